@@ -0,0 +1,12 @@
+"""
+URL configuration for GET and HEAD requests under ASGI: the async read
+views in ``store.async_urls`` first, then every route from ``e_comm.urls``.
+"""
+from django.urls import path, include
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/', include('store.async_urls')),
+    *sync_urlpatterns,
+]
@@ -47,11 +47,13 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_PAGINATION_CLASS': 'store.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
+        'users.authentication.CachedBasicAuthentication',
     ),
     
 }
@@ -76,9 +78,19 @@ SIMPLE_JWT={
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),  
     'TOKEN_TYPE_CLAIM': 'token_type',  # Adds token type claim (access/refresh)
     'JTI_CLAIM': 'jti',  
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.UserTokenObtainPairSerializer',
 }
 
+# Seconds a user resolved from a JWT is cached; saving the user drops it.
+JWT_USER_CACHE_TIMEOUT = 60
+# Build request.user from the token's claims instead of the database/cache.
+JWT_STATELESS_USERS = False
+# Seconds verified Basic auth credentials skip the password hasher.
+BASIC_AUTH_CACHE_TIMEOUT = 120
+
 MIDDLEWARE = [
+    'store.middleware.server_timing_middleware',
+    'store.middleware.metrics_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,9 +98,51 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'store.middleware.async_routes_middleware',
+    'store.middleware.profiling_middleware',
 ]
 
 ROOT_URLCONF = 'e_comm.urls'
+# Under ASGI, hot read endpoints are served by native async views.
+ASYNC_ROOT_URLCONF = 'e_comm.async_urls'
+
+# Share of requests whose time is broken down (total, database, serializers,
+# cache) in a Server-Timing header and a store.timing log line.
+SERVER_TIMING_SAMPLE_RATE = 0.01
+SERVER_TIMING_HEADER = True
+
+# Prometheus metrics at /metrics. With several worker processes, point
+# METRICS_MULTIPROC_DIR at a directory they share and empty it on deploy.
+# Only staff may read it; set METRICS_TOKEN to require it as a bearer
+# token from the scraper instead, or METRICS_PUBLIC to open it to anyone.
+# Gauges are recomputed at most every METRICS_GAUGE_MAX_AGE seconds.
+METRICS_MULTIPROC_DIR = None
+METRICS_FLUSH_INTERVAL = 5
+METRICS_TOKEN = None
+METRICS_PUBLIC = False
+METRICS_GAUGE_MAX_AGE = 60
+LOW_STOCK_THRESHOLD = 5
+
+# On-demand request profiles (manage.py profile_token, or ?profile=1 from a
+# staff user), listed at /api/profiles/. Only the newest PROFILE_RETENTION
+# are kept.
+PROFILE_DIR = BASE_DIR / 'profiles'
+PROFILE_RETENTION = 50
+# Python switches threads every 5ms, so sampling faster gains little.
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_TOKEN_MAX_AGE = 3600
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # The per-request lines are logged at INFO; lower this to see them.
+        'store.timing': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
 
 TEMPLATES = [
     {
@@ -124,6 +178,32 @@ DATABASES = {
 }
 
 
+# Cache
+# The local-memory cache is per process; point this at Redis or Memcached
+# when running more than one worker so catalog invalidation is shared.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+CATALOG_CACHE_TIMEOUT = 300
+
+# Product image renditions: longest side in pixels per size, and how many
+# background threads per process generate them.
+PRODUCT_IMAGE_SIZES = {'thumb': 200, 'medium': 600, 'large': 1200}
+IMAGE_RENDITION_WORKERS = 2
+
+# Upper bounds of the price facet buckets. Run rebuild_facet_counts after
+# changing them.
+PRODUCT_PRICE_BUCKETS = [10, 25, 50, 100, 250]
+
+# How long stock added to a cart stays held for it. Any change to the cart
+# extends every hold on it.
+CART_RESERVATION_TTL = timedelta(minutes=15)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -17,9 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path , include
 
+from store.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("api/users/", include("users.urls")),
     path('api/', include('store.urls')),  # This ensures 'api/' is mapped to store.urls
+    path('metrics', metrics_view, name='metrics'),
 
 ]
@@ -1,15 +1,133 @@
-from django.contrib import admin
-from .models import Product , Category , Inventory , CartItem , Cart , Order , OrderItem 
+from django.contrib import admin, messages
+from django.db import transaction
+from .models import Product , Category , Inventory , InventoryShard , CartItem , Cart , Order , OrderItem , StockReservation , ProductFacetCount , DailyProductSales , DailyCategorySales 
+from .models.facets import facet_cell
+from .cache import invalidate_categories, invalidate_products
+from .facets import locked_stock
+from .fulfilment import MAX_BATCH, transition
+from .images import schedule_renditions
+from .search import index_product, unindex_product
 # from .models.category import Category
 # from .models.inventory import Inventory
 
 
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'full_name', 'email', 'status', 'total', 'created_at')
+    list_filter = ('status',)
+    actions = ['mark_processing', 'mark_shipped', 'mark_delivered', 'cancel_orders']
+
+    def move(self, request, queryset, status):
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+        moved, rejected = [], []
+        for start in range(0, len(ids), MAX_BATCH):
+            batch_moved, batch_rejected = transition(dict.fromkeys(ids[start:start + MAX_BATCH], status))
+            moved += batch_moved
+            rejected += batch_rejected
+        self.message_user(request, f'{len(moved)} order(s) marked {status}.')
+        if rejected:
+            shown = ', '.join(map(str, rejected[:20])) + (', ...' if len(rejected) > 20 else '')
+            self.message_user(request, f'{len(rejected)} order(s) cannot be marked {status}: {shown}', messages.WARNING)
+
+    @admin.action(description='Mark selected orders as processing')
+    def mark_processing(self, request, queryset):
+        self.move(request, queryset, 'processing')
+
+    @admin.action(description='Mark selected orders as shipped')
+    def mark_shipped(self, request, queryset):
+        self.move(request, queryset, 'shipped')
+
+    @admin.action(description='Mark selected orders as delivered')
+    def mark_delivered(self, request, queryset):
+        self.move(request, queryset, 'delivered')
+
+    @admin.action(description='Cancel selected orders and restock them')
+    def cancel_orders(self, request, queryset):
+        self.move(request, queryset, 'cancelled')
+
+
+class ProductAdmin(admin.ModelAdmin):
+    """Keeps the facet counts, search index and catalog cache up to date
+    like the API's product writes do."""
+
+    def save_model(self, request, obj, form, change):
+        previous = Product.objects.get(pk=obj.pk) if change else None
+        with transaction.atomic():
+            stock = locked_stock(obj) if change else 0
+            if 'image' in form.changed_data:
+                obj.renditions = {}
+            super().save_model(request, obj, form, change)
+            ProductFacetCount.objects.apply([(
+                facet_cell(previous.category_id, previous.price, stock) if previous else None,
+                facet_cell(obj.category_id, obj.price, stock),
+            )])
+        if 'image' in form.changed_data:
+            schedule_renditions(obj.image.name)
+        index_product(obj)
+        invalidate_products([product for product in (previous, obj) if product])
+
+    def delete_model(self, request, obj):
+        product = Product(pk=obj.pk, category_id=obj.category_id)
+        with transaction.atomic():
+            ProductFacetCount.objects.apply([(facet_cell(obj.category_id, obj.price, locked_stock(obj)), None)])
+            super().delete_model(request, obj)
+        unindex_product(product.pk)
+        invalidate_products([product])
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            self.delete_model(request, obj)
+
+
+class CategoryAdmin(admin.ModelAdmin):
+    """Drops the cached catalog responses, which embed category names."""
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        invalidate_categories()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_categories()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        invalidate_categories()
+
+
+class InventoryAdmin(admin.ModelAdmin):
+    """Moves the product between the in and out of stock facet cells and
+    invalidates its cached responses like the API's stock writes do."""
+    # Shards are only resized by Inventory.rebalance(), which moves the stock.
+    readonly_fields = ('shard_count',)
+
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            before = locked_stock(obj.product) if change else 0
+            super().save_model(request, obj, form, change)
+            obj.record_stock_change(before, obj.total_stock)
+        invalidate_products([obj.product])
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            obj.record_stock_change(locked_stock(obj.product), 0)
+            super().delete_model(request, obj)
+        invalidate_products([obj.product])
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset.select_related('product'):
+            self.delete_model(request, obj)
+
 
 # Register your models here.
-admin.site.register (Product)
-admin.site.register (Category)
-admin.site.register(Inventory)
+admin.site.register (Product, ProductAdmin)
+admin.site.register (Category, CategoryAdmin)
+admin.site.register(Inventory, InventoryAdmin)
+admin.site.register(InventoryShard)
 admin.site.register(CartItem)
 admin.site.register(Cart)
-admin.site.register(Order)
+admin.site.register(Order, OrderAdmin)
 admin.site.register(OrderItem)
+admin.site.register(StockReservation)
+admin.site.register(ProductFacetCount)
+admin.site.register(DailyProductSales)
+admin.site.register(DailyCategorySales)
@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import async_views
+
+app_name = 'async_api'
+
+urlpatterns = [
+    path('products/', async_views.product_list, name='product-list'),
+    path('products/<int:pk>/', async_views.product_detail, name='product-detail'),
+    path('categories/', async_views.category_list, name='category-list'),
+    path('cart/', async_views.cart_detail, name='cart-list'),
+]
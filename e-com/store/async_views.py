@@ -0,0 +1,137 @@
+"""Native async implementations of the hot catalog and cart reads.
+
+Under ASGI these are routed ahead of the DRF viewsets for GET and HEAD (see
+``store.middleware.async_routes_middleware``), so the busiest reads are
+served on the event loop instead of hopping to a worker thread. They
+reuse the viewsets for querysets, filters, cache scopes and serializers and
+read through the async ORM and cache APIs; responses and cache entries are
+identical to the sync views'. Everything the serializers touch is loaded up
+front, so a lazy query raises SynchronousOnlyOperation instead of blocking
+the loop.
+"""
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from users.authentication import CachedJWTAuthentication
+
+from .cache import CATALOG_CACHE_TIMEOUT, acache_key
+from .models import Cart, Product
+from .serializers import CartSerializer
+from .timing import record_cache
+from .views import CategoryViewSet, ProductViewSet
+
+
+def render(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+def async_read_view(view):
+    """Wrap ``view(request, **kwargs)`` with a DRF request and turn API
+    errors into the same JSON bodies DRF would send. Only GET and HEAD are
+    answered; ``async_routes_middleware`` sends other methods to the DRF
+    viewsets, so a 405 here means the view was routed to directly."""
+
+    async def wrapper(request, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            response = render({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            response['Allow'] = 'GET, HEAD'
+            return response
+        request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            return await view(request, **kwargs)
+        except Http404 as exc:
+            return render({'detail': str(exc) or 'Not found.'}, status=404)
+        except (exceptions.NotAuthenticated, exceptions.AuthenticationFailed) as exc:
+            response = render({'detail': exc.detail}, status=401)
+            response['WWW-Authenticate'] = JWTAuthentication().authenticate_header(request)
+            return response
+        except exceptions.APIException as exc:
+            return render({'detail': exc.detail}, status=exc.status_code)
+
+    return wrapper
+
+
+def viewset(viewset_class, request, action, **kwargs):
+    return viewset_class(request=request, action=action, args=(), kwargs=kwargs, format_kwarg=None)
+
+
+async def cached(request, name, scopes, build):
+    key = await acache_key(request, name, scopes)
+    data = await cache.aget(key)
+    record_cache(data is not None)
+    if data is None:
+        data = await build()
+        await cache.aset(key, data, CATALOG_CACHE_TIMEOUT)
+    return render(data)
+
+
+async def paginated(view):
+    queryset = view.filter_queryset(view.get_queryset())
+    page = await view.paginator.apaginate_queryset(queryset, view.request, view=view)
+    return view.paginator.get_paginated_response(view.get_serializer(page, many=True).data).data
+
+
+async def authenticate(request, required=True):
+    """Resolve a bearer JWT through the async user cache. Session and basic
+    credentials go through DRF's authenticators in a worker thread. Invalid
+    credentials raise AuthenticationFailed, as in the sync views; without
+    any, NotAuthenticated is raised if ``required`` and None returned if not."""
+    jwt = CachedJWTAuthentication()
+    header = jwt.get_header(request)
+    raw_token = jwt.get_raw_token(header) if header is not None else None
+    if raw_token is not None:
+        return await jwt.aget_user(jwt.get_validated_token(raw_token))
+    if header is None and not required:
+        # A session alone never fails authentication, so anonymous reads
+        # skip the worker thread.
+        return None
+    user = await sync_to_async(lambda: request.user)()
+    if not user.is_authenticated:
+        if required:
+            raise exceptions.NotAuthenticated()
+        return None
+    return user
+
+
+@async_read_view
+async def product_list(request):
+    await authenticate(request, required=False)
+    view = viewset(ProductViewSet, request, 'list')
+    return await cached(request, 'product-list', view.get_cache_scopes(), lambda: paginated(view))
+
+
+@async_read_view
+async def product_detail(request, pk):
+    await authenticate(request, required=False)
+    view = viewset(ProductViewSet, request, 'retrieve', pk=pk)
+
+    async def build():
+        try:
+            product = await view.get_queryset().aget(pk=pk)
+        except Product.DoesNotExist:
+            raise Http404('No Product matches the given query.')
+        return view.get_serializer(product).data
+
+    return await cached(request, 'product-retrieve', view.get_cache_scopes(), build)
+
+
+@async_read_view
+async def category_list(request):
+    await authenticate(request, required=False)
+    view = viewset(CategoryViewSet, request, 'list')
+    return await cached(request, 'category-list', view.get_cache_scopes(), lambda: paginated(view))
+
+
+@async_read_view
+async def cart_detail(request):
+    user = await authenticate(request)
+    cart = await Cart.objects.with_items().filter(user=user).afirst()
+    if cart is None:
+        cart, _ = await Cart.objects.aget_or_create(user=user)
+        cart = await Cart.objects.with_items().aget(pk=cart.pk)
+    return render(CartSerializer(cart).data)
@@ -0,0 +1,154 @@
+"""In-process WSGI and ASGI load drivers.
+
+Both drivers send real HTTP requests through Django's own handlers, so the
+middleware stack, URL resolution and views are exactly what a deployment
+runs; only the network and the server's accept loop are left out. The WSGI
+driver runs ``concurrency`` worker threads, like a threaded WSGI server; the
+ASGI driver runs ``concurrency`` tasks on one event loop, like a single
+ASGI worker.
+"""
+import asyncio
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import close_old_connections
+
+HOST = 'localhost'
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies, statuses, elapsed):
+    return {
+        'requests': len(latencies),
+        'errors': sum(1 for status in statuses if status >= 400),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def wsgi_environ(url, headers):
+    parts = urlsplit(url)
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': parts.path,
+        'QUERY_STRING': parts.query,
+        'SERVER_NAME': HOST,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': HOST,
+        'wsgi.input': BytesIO(),
+        'wsgi.errors': BytesIO(),
+        'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in headers.items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    return environ
+
+
+def run_wsgi(url, headers, total, concurrency):
+    application = WSGIHandler()
+
+    def request():
+        status = []
+        start = time.perf_counter()
+        response = application(wsgi_environ(url, headers), lambda line, _headers: status.append(int(line[:3])))
+        try:
+            b''.join(response)
+        finally:
+            response.close()
+        return time.perf_counter() - start, status[0]
+
+    def worker(count):
+        try:
+            return [request() for _ in range(count)]
+        finally:
+            close_old_connections()
+
+    per_worker = [total // concurrency + (i < total % concurrency) for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = [result for chunk in executor.map(worker, per_worker) for result in chunk]
+    elapsed = time.perf_counter() - start
+    return summarize([latency for latency, _ in results], [status for _, status in results], elapsed)
+
+
+def asgi_scope(url, headers):
+    parts = urlsplit(url)
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': parts.path,
+        'raw_path': parts.path.encode(),
+        'query_string': parts.query.encode(),
+        'root_path': '',
+        'headers': [(b'host', HOST.encode())] + [
+            (name.lower().encode(), value.encode()) for name, value in headers.items()
+        ],
+        'server': (HOST, 80),
+        'client': ('127.0.0.1', 0),
+    }
+
+
+async def asgi_request(application, url, headers):
+    done = asyncio.Event()
+    status = []
+    sent_request = False
+
+    async def receive():
+        nonlocal sent_request
+        if not sent_request:
+            sent_request = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif message['type'] == 'http.response.body' and not message.get('more_body'):
+            done.set()
+
+    start = time.perf_counter()
+    await application(asgi_scope(url, headers), receive, send)
+    done.set()
+    return time.perf_counter() - start, status[0]
+
+
+async def _run_asgi(url, headers, total, concurrency):
+    application = ASGIHandler()
+    remaining = iter(range(total))
+    results = []
+
+    async def worker():
+        for _ in remaining:
+            results.append(await asgi_request(application, url, headers))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return summarize([latency for latency, _ in results], [status for _, status in results], elapsed)
+
+
+def run_asgi(url, headers, total, concurrency):
+    return asyncio.run(_run_asgi(url, headers, total, concurrency))
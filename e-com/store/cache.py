@@ -0,0 +1,139 @@
+"""Versioned response cache for catalog reads.
+
+Cached entries are never deleted. Each key embeds the current value of the
+version counters ("scopes") its data depends on, and writers bump those
+counters so later reads simply miss:
+
+* ``global``        -- any category change (names are embedded everywhere)
+* ``products``      -- any product change; unfiltered product lists
+* ``category:<id>`` -- product changes in one category; category-filtered lists
+* ``product:<id>``  -- one product; its detail response
+
+Counters start from a nanosecond timestamp rather than 1, so a counter the
+cache has evicted can never come back at a value that old entries used.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from rest_framework.response import Response
+
+from .timing import record_cache
+
+CATALOG_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+CACHED_QUERY_PARAMS = ('category', 'min_price', 'max_price', 'in_stock', 'q', 'search', 'cursor', 'page_size')
+SEARCH_PARAMS = ('q', 'search')
+
+
+def _version_key(scope):
+    return f'catalog:version:{scope}'
+
+
+def get_versions(scopes):
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+async def aget_versions(scopes):
+    keys = [_version_key(scope) for scope in scopes]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, time.time_ns(), None)
+            versions[key] = await cache.aget(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*scopes):
+    def _bump():
+        for scope in scopes:
+            key = _version_key(scope)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, time.time_ns(), None)
+
+    _bump()
+    # A reader may repopulate the old version between the bump above and the
+    # commit, so bump again once the new rows are visible.
+    if connection.in_atomic_block:
+        transaction.on_commit(_bump)
+
+
+def invalidate_products(products):
+    scopes = {'products'}
+    for product in products:
+        scopes.add(f'product:{product.pk}')
+        scopes.add(f'category:{product.category_id}')
+    bump(*sorted(scopes))
+
+
+def invalidate_categories():
+    invalidate_catalog()
+
+
+def invalidate_catalog():
+    """Drop every cached catalog response, e.g. after a bulk import."""
+    bump('global')
+
+
+def normalized_params(request):
+    params = []
+    for param in CACHED_QUERY_PARAMS:
+        value = request.query_params.get(param, '')
+        if param in SEARCH_PARAMS:
+            # Both search backends are case-insensitive and split on whitespace.
+            value = ' '.join(value.lower().split())
+        value = value.strip()
+        if value:
+            params.append((param, value))
+    return params
+
+
+def _cache_key(request, name, versions):
+    params = normalized_params(request)
+    # Pagination links are absolute, so the host is part of the response.
+    raw = repr((request.get_host(), request.path, params))
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    versions = '.'.join(str(version) for version in versions)
+    return f'catalog:{name}:{versions}:{digest}'
+
+
+def cache_key(request, name, scopes):
+    return _cache_key(request, name, get_versions(scopes))
+
+
+async def acache_key(request, name, scopes):
+    return _cache_key(request, name, await aget_versions(scopes))
+
+
+class CatalogCacheMixin:
+    """Serve ``list`` and ``retrieve`` from the cache, keyed by
+    ``get_cache_scopes()`` and the normalized query string."""
+
+    def get_cache_scopes(self):
+        return ['global']
+
+    def cached_response(self, request, render):
+        key = cache_key(request, f'{self.basename}-{self.action}', self.get_cache_scopes())
+        data = cache.get(key)
+        record_cache(data is not None)
+        if data is not None:
+            return Response(data)
+        response = render()
+        if response.status_code == 200:
+            cache.set(key, response.data, CATALOG_CACHE_TIMEOUT)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CatalogCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CatalogCacheMixin, self).retrieve(request, *args, **kwargs))
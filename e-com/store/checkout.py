@@ -0,0 +1,169 @@
+from django.db import transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from . import sales
+from .cache import invalidate_products
+from .models import Inventory, Order, OrderItem, ProductFacetCount
+from .models.facets import facet_cell
+from .reservations import reserved_quantities
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCart(CheckoutError):
+    pass
+
+
+class InsufficientStock(CheckoutError):
+    def __init__(self, product):
+        self.product = product
+        super().__init__(f'Not enough stock for {product.name}')
+
+
+def place_order(cart, user, details):
+    """Turn the cart into an order in a single transaction.
+
+    All inventory rows touched by the cart are locked up front with one
+    SELECT ... FOR UPDATE ordered by product id, so two checkouts sharing
+    SKUs always take their locks in the same order and cannot deadlock.
+    Order lines are written with one bulk INSERT, stock is decremented
+    with one CASE UPDATE and the daily sales rollups take one upsert each,
+    so the statement count does not grow with the size of the cart.
+    Sharded SKUs skip the row lock and take their stock from a shard
+    instead (see ``Inventory.remove``).
+
+    Lines covered by the cart's own unexpired hold were checked against
+    everyone else's holds when the hold was placed; the rest must fit in
+    what other carts have not reserved. The holds are consumed by the order.
+    """
+    with transaction.atomic():
+        items = list(cart.items.select_related('product').order_by('product_id'))
+        if not items:
+            raise EmptyCart('Cart is empty')
+
+        sharded = {
+            inventory.product_id: inventory
+            for inventory in Inventory.objects.filter(
+                product_id__in=[item.product_id for item in items], shard_count__gt=0,
+            )
+        }
+        locked_items = [item for item in items if item.product_id not in sharded]
+        product_ids = [item.product_id for item in locked_items]
+        stock = dict(
+            Inventory.objects.select_for_update()
+            .filter(product_id__in=product_ids)
+            .order_by('product_id')
+            .values_list('product_id', 'stock_count')
+        )
+        now = timezone.now()
+        held = dict(cart.reservations.filter(expires_at__gt=now).values_list('product_id', 'quantity'))
+        unheld = [item.product_id for item in items if held.get(item.product_id, 0) < item.quantity]
+        reserved = reserved_quantities(unheld, exclude_cart=cart) if unheld else {}
+        for item in locked_items:
+            if stock.get(item.product_id, 0) - reserved.get(item.product_id, 0) < item.quantity:
+                raise InsufficientStock(item.product)
+        for item in items:
+            if item.product_id not in sharded:
+                continue
+            inventory = sharded[item.product_id]
+            if inventory.total_stock - reserved.get(item.product_id, 0) < item.quantity:
+                raise InsufficientStock(item.product)
+            if not inventory.remove(item.quantity):
+                raise InsufficientStock(item.product)
+
+        order = Order.objects.create(
+            user=user,
+            total=sum(item.subtotal for item in items),
+            **details,
+        )
+        lines = OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order, product=item.product, quantity=item.quantity, price=item.product.price,
+                category_id=item.product.category_id,
+            )
+            for item in items
+        ])
+        sales.record(order, lines, None, order.status)
+
+        # The rows are locked and checked above; the stock_count guard keeps
+        # the statement safe even if it is ever run without the lock.
+        if locked_items:
+            updated = Inventory.objects.filter(
+                product_id__in=product_ids,
+                stock_count__gte=Case(*[When(product_id=item.product_id, then=item.quantity) for item in locked_items]),
+            ).update(
+                stock_count=Case(*[
+                    When(product_id=item.product_id, then=F('stock_count') - item.quantity)
+                    for item in locked_items
+                ]),
+                last_updated=now,
+            )
+            if updated != len(locked_items):
+                raise CheckoutError('Stock changed during checkout')
+            ProductFacetCount.objects.apply(
+                (
+                    facet_cell(item.product.category_id, item.product.price, stock[item.product_id]),
+                    facet_cell(item.product.category_id, item.product.price, stock[item.product_id] - item.quantity),
+                )
+                for item in locked_items
+            )
+
+        cart.items.all().delete()
+        cart.reservations.all().delete()
+        invalidate_products(item.product for item in items)
+    return order
+
+
+def restock_quantities(quantities):
+    """Put ``quantities``, a mapping of product id to units, back in stock.
+    Returns the restocked products.
+
+    Unsharded inventory rows are locked in product id order, like at
+    checkout, and incremented with one CASE UPDATE; sharded SKUs restock a
+    shard each (see ``Inventory.add``). Products without an inventory row
+    get one.
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity}
+    if not quantities:
+        return []
+    rows = (
+        Inventory.objects.select_for_update().select_related('product')
+        .filter(product_id__in=quantities)
+        .order_by('product_id')
+    )
+    with transaction.atomic():
+        inventories = list(rows)
+        missing = quantities.keys() - {inventory.product_id for inventory in inventories}
+        if missing:
+            Inventory.objects.bulk_create(
+                [Inventory(product_id=product_id) for product_id in missing], ignore_conflicts=True,
+            )
+            inventories = list(rows.all())
+        locked = [inventory for inventory in inventories if not inventory.shard_count]
+        for inventory in inventories:
+            if inventory.shard_count:
+                inventory.add(quantities[inventory.product_id])
+        products = [inventory.product for inventory in inventories]
+        if not locked:
+            return products
+        Inventory.objects.filter(pk__in=[inventory.pk for inventory in locked]).update(
+            stock_count=Case(*[
+                When(pk=inventory.pk, then=F('stock_count') + quantities[inventory.product_id])
+                for inventory in locked
+            ]),
+            last_updated=timezone.now(),
+        )
+        ProductFacetCount.objects.apply(
+            (
+                facet_cell(inventory.product.category_id, inventory.product.price, inventory.stock_count),
+                facet_cell(
+                    inventory.product.category_id, inventory.product.price,
+                    inventory.stock_count + quantities[inventory.product_id],
+                ),
+            )
+            for inventory in locked
+        )
+    return products
@@ -0,0 +1,125 @@
+"""Streaming order history export.
+
+Orders are read with ``.iterator(chunk_size=...)`` so only one chunk of
+orders, with its items and products prefetched in two queries, is in memory
+at a time. Output is produced incrementally as CSV (one row per order line)
+or NDJSON (one object per order with its lines nested). An order without
+lines still gets a CSV row, with the item columns left empty.
+"""
+import csv
+import json
+from datetime import datetime, time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Order, OrderItem
+
+FORMATS = ('csv', 'ndjson')
+DEFAULT_CHUNK_SIZE = 1000
+CSV_HEADER = [
+    'order_id', 'created_at', 'status', 'user_id', 'full_name', 'email', 'order_total',
+    'item_id', 'product_id', 'product_name', 'quantity', 'price', 'subtotal',
+]
+
+
+class _Echo:
+    """File-like object whose ``write`` returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def parse_bound(value, end=False):
+    """Parse a ``YYYY-MM-DD`` or ISO datetime filter value. A bare date used
+    as an upper bound covers the whole day."""
+    if not value:
+        return None
+    # Dates first: parse_datetime() also reads a bare date, as midnight.
+    day = parse_date(value)
+    if day is not None:
+        moment = datetime.combine(day, time.max if end else time.min)
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(f'Invalid date: {value!r}')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def filter_orders(queryset, since=None, until=None, statuses=None):
+    if since:
+        queryset = queryset.filter(created_at__gte=parse_bound(since))
+    if until:
+        queryset = queryset.filter(created_at__lte=parse_bound(until, end=True))
+    if statuses:
+        valid = dict(Order.STATUS_CHOICES)
+        unknown = [status for status in statuses if status not in valid]
+        if unknown:
+            raise ValueError(f'Unknown status: {", ".join(unknown)}')
+        queryset = queryset.filter(status__in=statuses)
+    return queryset
+
+
+def iter_orders(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    items = OrderItem.objects.select_related('product').only(
+        'id', 'order_id', 'product_id', 'quantity', 'price', 'product__name',
+    ).order_by('id')
+    return (
+        queryset.order_by('id')
+        .prefetch_related(Prefetch('items', queryset=items))
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def export_csv(orders):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for order in orders:
+        columns = [
+            order.id, order.created_at.isoformat(), order.status, order.user_id, order.full_name,
+            order.email, order.total,
+        ]
+        items = order.items.all()
+        if not items:
+            yield writer.writerow(columns + [''] * (len(CSV_HEADER) - len(columns)))
+        for item in items:
+            yield writer.writerow(columns + [
+                item.id, item.product_id, item.product.name, item.quantity, item.price, item.subtotal,
+            ])
+
+
+def export_ndjson(orders):
+    for order in orders:
+        yield json.dumps({
+            'id': order.id,
+            'created_at': order.created_at,
+            'status': order.status,
+            'user_id': order.user_id,
+            'full_name': order.full_name,
+            'email': order.email,
+            'total': order.total,
+            'items': [
+                {
+                    'id': item.id,
+                    'product_id': item.product_id,
+                    'product_name': item.product.name,
+                    'quantity': item.quantity,
+                    'price': item.price,
+                    'subtotal': item.subtotal,
+                }
+                for item in order.items.all()
+            ],
+        }, cls=DjangoJSONEncoder) + '\n'
+
+
+def export_orders(queryset, fmt, chunk_size=DEFAULT_CHUNK_SIZE):
+    orders = iter_orders(queryset, chunk_size=chunk_size)
+    if fmt == 'csv':
+        return export_csv(orders)
+    if fmt == 'ndjson':
+        return export_ndjson(orders)
+    raise ValueError(f'Unsupported format {fmt!r}; expected one of {", ".join(FORMATS)}')
@@ -0,0 +1,102 @@
+"""Facet counts for catalog navigation.
+
+Each product falls in one cell of (category, price bucket, in stock). The
+sidebar counts are sums over cells, so one result set of cells answers all
+three facets. A search or price filter counts its cells with a single
+grouped query; plain browsing, optionally narrowed to a category, reads the
+``ProductFacetCount`` table the write paths keep up to date instead.
+"""
+from django.db import transaction
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Value, When
+
+from .models import Inventory, InventoryShard, Product, ProductFacetCount
+from .models.facets import PRICE_BUCKETS
+
+
+def price_bucket_expression():
+    return Case(
+        *[When(price__lt=bound, then=Value(index)) for index, bound in enumerate(PRICE_BUCKETS)],
+        default=Value(len(PRICE_BUCKETS)),
+    )
+
+
+def in_stock_filter():
+    sharded_stock = InventoryShard.objects.filter(inventory__product=OuterRef('pk'), stock_count__gt=0)
+    return Q(inventory__stock_count__gt=0) | Exists(sharded_stock)
+
+
+def in_stock_expression():
+    return Case(When(in_stock_filter(), then=Value(True)), default=Value(False))
+
+
+def locked_stock(product):
+    """Total stock of ``product`` (0 without an inventory row), read with
+    the row locked so it cannot move in or out of stock before the caller's
+    transaction applies a facet change based on it (see ``Inventory``)."""
+    inventory = Inventory.objects.select_for_update().filter(product=product).first()
+    return inventory.total_stock if inventory else 0
+
+
+def counted_cells(queryset):
+    return (
+        queryset.order_by()
+        .values('category_id', 'category__name', bucket=price_bucket_expression(), stock=in_stock_expression())
+        .annotate(count=Count('pk'))
+    )
+
+
+def stored_cells(category=None):
+    cells = ProductFacetCount.objects.filter(count__gt=0)
+    if category:
+        cells = cells.filter(category_id=category)
+    return cells.values('category_id', 'category__name', 'count', bucket=F('price_bucket'), stock=F('in_stock'))
+
+
+def fold(cells):
+    categories = {}
+    buckets = [0] * (len(PRICE_BUCKETS) + 1)
+    in_stock = out_of_stock = 0
+    for cell in cells:
+        count = cell['count']
+        category = categories.setdefault(
+            cell['category_id'], {'id': cell['category_id'], 'name': cell['category__name'], 'count': 0},
+        )
+        category['count'] += count
+        buckets[cell['bucket']] += count
+        if cell['stock']:
+            in_stock += count
+        else:
+            out_of_stock += count
+
+    bounds = ['0', *map(str, PRICE_BUCKETS), None]
+    return {
+        'total': in_stock + out_of_stock,
+        'categories': sorted(categories.values(), key=lambda category: (-category['count'], category['name'])),
+        'price': [
+            {'min': bounds[index], 'max': bounds[index + 1], 'count': count}
+            for index, count in enumerate(buckets)
+        ],
+        'stock': {'in_stock': in_stock, 'out_of_stock': out_of_stock},
+    }
+
+
+def facet_counts(queryset, filtered, category=None):
+    """Facet counts for ``queryset``. Unless the result set is ``filtered``
+    by more than ``category``, they come from the maintained table."""
+    if filtered:
+        return fold(counted_cells(queryset))
+    return fold(stored_cells(category))
+
+
+def rebuild():
+    """Recount every cell from the catalog, e.g. after changing the price
+    buckets or after writes that bypass the write paths (queryset updates,
+    raw SQL)."""
+    with transaction.atomic():
+        ProductFacetCount.objects.all().delete()
+        ProductFacetCount.objects.bulk_create([
+            ProductFacetCount(
+                category_id=cell['category_id'], price_bucket=cell['bucket'], in_stock=cell['stock'], count=cell['count'],
+            )
+            for cell in counted_cells(Product.objects.all())
+        ])
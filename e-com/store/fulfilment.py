@@ -0,0 +1,61 @@
+"""Bulk order status changes for fulfilment.
+
+``transition()`` takes a batch of orders and their new statuses. The
+orders are locked in id order, and each target status is applied with one
+UPDATE whose WHERE clause only matches orders in a status that may move
+to it (see ``Order.TRANSITIONS``); everything else is rejected. Cancelled
+orders are restocked with one aggregated update over all their lines,
+summed by the same grouped query that moves the sales rollups, so a batch
+costs the same number of statements whatever its size.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import sales
+from .cache import invalidate_products
+from .checkout import restock_quantities
+from .models import Order
+
+MAX_BATCH = 1000
+
+
+class TransitionError(Exception):
+    pass
+
+
+def transition(changes):
+    """Move orders to new statuses. ``changes`` maps order ids to target
+    statuses. Returns the ids moved and the ids rejected, because the
+    order does not exist or may not move to its target."""
+    unknown = set(changes.values()) - Order.TRANSITIONS.keys()
+    if unknown:
+        raise TransitionError(f'Cannot move orders to: {", ".join(sorted(unknown))}')
+    with transaction.atomic():
+        current = dict(
+            Order.objects.select_for_update().filter(pk__in=changes).order_by('pk').values_list('pk', 'status')
+        )
+        accepted = {
+            pk: status for pk, status in changes.items()
+            if current.get(pk) in Order.TRANSITIONS[status]
+        }
+        if accepted:
+            lines = sales.moves(accepted)
+            now = timezone.now()
+            for status in sorted(set(accepted.values())):
+                ids = [pk for pk, target in accepted.items() if target == status]
+                updated = Order.objects.filter(pk__in=ids, status__in=Order.TRANSITIONS[status]).update(
+                    status=status, updated_at=now,
+                )
+                # The rows are locked; a shortfall means they were not.
+                if updated != len(ids):
+                    raise TransitionError('Orders changed during the transition')
+            quantities = Counter()
+            for line in lines:
+                if line['after'] == 'cancelled':
+                    quantities[line['product_id']] += line['units']
+            if quantities:
+                invalidate_products(restock_quantities(quantities))
+            sales.move(lines)
+    return sorted(accepted), sorted(pk for pk in changes if pk not in accepted)
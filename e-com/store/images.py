@@ -0,0 +1,133 @@
+"""Product image storage and renditions.
+
+Uploads are stored under the SHA-256 of their content, so the same picture
+uploaded for many products is kept once. Resized WebP and JPEG renditions
+are generated after the request has committed, on a small thread pool, and
+recorded on ``Product.renditions``; until then clients fall back to the
+original ``image``.
+"""
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import close_old_connections, transaction
+from django.utils.deconstruct import deconstructible
+from PIL import Image, ImageOps
+
+from .cache import invalidate_products
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DIR = 'products'
+RENDITION_DIR = 'products/renditions'
+RENDITION_SIZES = getattr(settings, 'PRODUCT_IMAGE_SIZES', {'thumb': 200, 'medium': 600, 'large': 1200})
+RENDITION_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+RENDITION_QUALITY = 80
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'IMAGE_RENDITION_WORKERS', 2), thread_name_prefix='renditions',
+)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage for names derived from file content: a name that
+    already exists holds the same bytes, so it is reused instead of being
+    given a random suffix and written again."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def image_name(digest, filename):
+    ext = os.path.splitext(filename)[1].lower() or '.jpg'
+    return f'{IMAGE_DIR}/{digest[:2]}/{digest}{ext}'
+
+
+def product_image_path(instance, filename):
+    return image_name(content_hash(instance.image), filename)
+
+
+def rendition_name(image_name, label, ext):
+    digest = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{RENDITION_DIR}/{digest}/{label}.{ext}'
+
+
+def generate_renditions(image_name):
+    """Write every rendition of ``image_name`` that does not exist yet,
+    record them on all products using that image and drop those products'
+    cached responses. Returns the mapping."""
+    from .models import Product
+
+    storage = Product._meta.get_field('image').storage
+    with storage.open(image_name) as source:
+        original = ImageOps.exif_transpose(Image.open(source))
+        original.load()
+
+    renditions = {}
+    for label, size in RENDITION_SIZES.items():
+        image = original.copy()
+        image.thumbnail((size, size))
+        renditions[label] = {}
+        for ext, pil_format in RENDITION_FORMATS.items():
+            name = rendition_name(image_name, label, ext)
+            if not storage.exists(name):
+                buffer = BytesIO()
+                output = image if pil_format == 'WEBP' or image.mode == 'RGB' else image.convert('RGB')
+                output.save(buffer, pil_format, quality=RENDITION_QUALITY)
+                storage.save(name, ContentFile(buffer.getvalue()))
+            renditions[label][ext] = name
+
+    products = Product.objects.filter(image=image_name)
+    products.update(renditions=renditions)
+    # Cached list and detail responses still show the products without them.
+    invalidate_products(products.only('pk', 'category_id'))
+    return renditions
+
+
+def _generate_in_background(image_name):
+    try:
+        generate_renditions(image_name)
+    except Exception:
+        logger.exception('Could not generate renditions for %s', image_name)
+    finally:
+        close_old_connections()
+
+
+def schedule_renditions(image_name):
+    """Queue rendition generation for after the current transaction commits."""
+    if image_name:
+        transaction.on_commit(lambda: _executor.submit(_generate_in_background, image_name))
+
+
+def rendition_urls(product, request=None):
+    storage = product.image.storage
+    urls = {}
+    for label, formats in (product.renditions or {}).items():
+        urls[label] = {}
+        for ext, name in formats.items():
+            url = storage.url(name)
+            urls[label][ext] = request.build_absolute_uri(url) if request else url
+    return urls
@@ -0,0 +1,198 @@
+"""Streaming bulk product import.
+
+Rows are read one at a time from a CSV or NDJSON byte stream, validated,
+and upserted by SKU in batches: one INSERT ... ON CONFLICT for the products
+and one for their inventory rows per batch. Optional columns missing from
+the file are left as they are on existing products. Only the current batch and a
+capped list of row errors are kept in memory, so the size of the input
+does not matter.
+"""
+import codecs
+import csv
+import json
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+
+from .cache import invalidate_catalog
+from .images import schedule_renditions
+from .models import Category, Inventory, Product, ProductFacetCount
+from .models.facets import facet_cell, product_cell
+from .search import index_products
+from .serializers import ProductImportRowSerializer
+
+FORMATS = ('csv', 'ndjson')
+DEFAULT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+# Product columns that may be left out of a file; existing products keep
+# their stored values and new ones get blanks. A missing or blank ``stock``
+# leaves existing inventory alone and gives new products none.
+OPTIONAL_FIELDS = ('description', 'image')
+
+
+def detect_format(content_type='', filename=''):
+    if filename.endswith(('.ndjson', '.jsonl')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'ndjson'
+    if filename.endswith('.csv') or 'csv' in content_type:
+        return 'csv'
+    return None
+
+
+def current_stock(product):
+    if product is None:
+        return 0
+    try:
+        return product.inventory.total_stock
+    except ObjectDoesNotExist:
+        return 0
+
+
+def read_rows(stream, fmt):
+    """Yield ``(line_number, row)`` from a binary stream. Rows that cannot
+    be parsed are yielded as ``(line_number, ValueError)``."""
+    lines = codecs.iterdecode(stream, 'utf-8-sig')
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'ndjson':
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, ValueError(f'Invalid JSON: {e}')
+                continue
+            if not isinstance(row, dict):
+                row = ValueError('Expected a JSON object')
+            yield line_number, row
+    else:
+        raise ValueError(f'Unsupported format {fmt!r}; expected one of {", ".join(FORMATS)}')
+
+
+class ProductImporter:
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        # Category names resolve through one lookup instead of a query per row.
+        self.categories = dict(Category.objects.values_list('name', 'id'))
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+
+    def run(self, rows):
+        batch = {}
+        for line_number, row in rows:
+            if isinstance(row, Exception):
+                self.add_error(line_number, [str(row)])
+                continue
+            serializer = ProductImportRowSerializer(data=row, context={'categories': self.categories})
+            if not serializer.is_valid():
+                self.add_error(line_number, serializer.errors)
+                continue
+            # A SKU repeated within one batch keeps its last row; a single
+            # upsert statement may not touch the same row twice.
+            data = serializer.validated_data
+            batch[data['sku']] = data
+            if len(batch) >= self.batch_size:
+                self.flush(list(batch.values()))
+                batch = {}
+        if batch:
+            self.flush(list(batch.values()))
+        return self.report()
+
+    def add_error(self, line_number, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'errors': errors})
+
+    def flush(self, rows):
+        with transaction.atomic():
+            # Lock the inventory rows first, in product order like checkout,
+            # so no sale moves stock between the facet snapshot below and the
+            # stock written for the batch.
+            list(
+                Inventory.objects.select_for_update(of=('self',))
+                .filter(product__sku__in=[row['sku'] for row in rows])
+                .order_by('product_id')
+                .values_list('pk', flat=True)
+            )
+            existing = {
+                product.sku: product
+                for product in Product.objects.filter(sku__in=[row['sku'] for row in rows])
+                .select_related('inventory')
+                .prefetch_related('inventory__shards')
+            }
+            before = {sku: product_cell(product) for sku, product in existing.items()}
+
+            # Columns a row leaves out keep their stored values, so rows are
+            # upserted in groups that update the same columns; a file with a
+            # fixed set of columns is a single group.
+            groups = {}
+            for row in rows:
+                groups.setdefault(tuple(field for field in OPTIONAL_FIELDS if field in row), []).append(row)
+            rows = [row for group in groups.values() for row in group]
+            products = []
+            for fields, group in groups.items():
+                products += Product.objects.bulk_create(
+                    [
+                        Product(
+                            sku=row['sku'], name=row['name'], description=row.get('description', ''),
+                            price=row['price'], category_id=row['category'], image=row.get('image', ''),
+                        )
+                        for row in group
+                    ],
+                    update_conflicts=True,
+                    unique_fields=['sku'],
+                    update_fields=['name', 'price', 'category', *fields],
+                )
+            if any(product.pk is None for product in products):
+                # Backends without RETURNING on upserts: look the ids up by SKU.
+                ids = dict(Product.objects.filter(sku__in=[row['sku'] for row in rows]).values_list('sku', 'id'))
+                for product in products:
+                    product.pk = ids[product.sku]
+
+            # Renditions of a replaced image no longer match it.
+            changed = [
+                (product, row) for product, row in zip(products, rows)
+                if 'image' in row and (row['sku'] not in existing or existing[row['sku']].image.name != row['image'])
+            ]
+            replaced = [product.pk for product, row in changed if row['sku'] in existing]
+            if replaced:
+                Product.objects.filter(pk__in=replaced).update(renditions={})
+            for name in {row['image'] for _, row in changed}:
+                schedule_renditions(name)
+
+            stocked = [(product, row) for product, row in zip(products, rows) if 'stock' in row]
+            Inventory.objects.bulk_create(
+                [Inventory(product=product, stock_count=row['stock']) for product, row in stocked],
+                update_conflicts=True,
+                unique_fields=['product'],
+                update_fields=['stock_count', 'last_updated'],
+            )
+            Inventory.objects.bulk_create(
+                [Inventory(product=product) for product, row in zip(products, rows) if 'stock' not in row],
+                ignore_conflicts=True,
+            )
+            # Sharded SKUs keep their stock in the shards; move the imported
+            # count there.
+            for inventory in Inventory.objects.filter(product__in=[product for product, _ in stocked], shard_count__gt=0):
+                inventory.rebalance(stock=inventory.stock_count)
+            ProductFacetCount.objects.apply(
+                (
+                    before.get(row['sku']),
+                    facet_cell(row['category'], row['price'], row.get('stock', current_stock(existing.get(row['sku'])))),
+                )
+                for row in rows
+            )
+
+            index_products(products)
+            invalidate_catalog()
+        self.imported += len(rows)
+
+    def report(self):
+        return {
+            'imported': self.imported,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
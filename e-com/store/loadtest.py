@@ -0,0 +1,215 @@
+"""Reproducible load benchmark for the store API.
+
+``seed()`` fills an empty database with a synthetic catalog, users and
+carts; ``run()`` replays a weighted mix of shopper actions (browse, search,
+add to cart, checkout, purchase) through the Django test client, so every
+request goes through the real middleware, URLconf and views, and records
+latency, status and query count per request. ``report()`` turns that into
+per-endpoint throughput, p50/p95/p99 latency and queries per request.
+
+Everything random comes from one seeded ``random.Random``, so two runs
+with the same options send the same requests.
+"""
+import random
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from users.models import CustomUser
+from users.serializers import UserTokenObtainPairSerializer
+
+from . import facets
+from .benchmark import percentile
+from .models import Cart, CartItem, Category, Inventory, Product
+from .search import index_products
+
+ADJECTIVES = ['red', 'blue', 'green', 'black', 'white', 'classic', 'modern', 'vintage', 'light', 'heavy',
+              'soft', 'rugged', 'slim', 'compact', 'deluxe', 'organic', 'wireless', 'waterproof', 'smart', 'eco']
+NOUNS = ['shoe', 'jacket', 'lamp', 'chair', 'mug', 'backpack', 'watch', 'speaker', 'kettle', 'blanket',
+         'bottle', 'headphones', 'desk', 'wallet', 'camera', 'helmet', 'tent', 'keyboard', 'pillow', 'scarf']
+SEED_PASSWORD = 'loadtest'
+
+# Relative weight of each shopper action in the mix.
+MIX = {
+    'browse': 45,
+    'product_detail': 20,
+    'search': 12,
+    'add_to_cart': 10,
+    'view_cart': 6,
+    'checkout': 3,
+    'purchase': 2,
+    'facets': 2,
+}
+
+
+def seed(categories=50, products=20000, users=200, carts=100, rng=None, batch_size=2000):
+    """Create the synthetic data set. Returns the number of rows per model."""
+    rng = rng or random.Random(0)
+    with transaction.atomic():
+        category_rows = Category.objects.bulk_create([
+            Category(name=f'{NOUNS[i % len(NOUNS)]} {i}', description=f'All things {NOUNS[i % len(NOUNS)]}')
+            for i in range(categories)
+        ])
+        for start in range(0, products, batch_size):
+            batch = Product.objects.bulk_create([
+                Product(
+                    sku=f'LT-{i:08d}',
+                    name=f'{rng.choice(ADJECTIVES)} {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}',
+                    description=' '.join(rng.choices(ADJECTIVES + NOUNS, k=12)),
+                    price=Decimal(rng.randrange(100, 50000)) / 100,
+                    category=rng.choice(category_rows),
+                    image='products/loadtest.jpg',
+                )
+                for i in range(start, min(start + batch_size, products))
+            ])
+            # About one product in ten is out of stock.
+            Inventory.objects.bulk_create([
+                Inventory(product=product, stock_count=0 if rng.random() < 0.1 else rng.randrange(1, 500))
+                for product in batch
+            ])
+            index_products(batch)
+        facets.rebuild()
+
+        password = make_password(SEED_PASSWORD)
+        user_rows = CustomUser.objects.bulk_create([
+            CustomUser(email=f'shopper{i}@example.com', password=password, first_name='Load', last_name=f'Test {i}')
+            for i in range(users)
+        ])
+        cart_rows = Cart.objects.bulk_create([Cart(user=user) for user in user_rows[:carts]])
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product_id=product_id, quantity=rng.randrange(1, 3))
+            for cart in cart_rows
+            for product_id in rng.sample(product_ids, rng.randrange(1, 6))
+        ])
+    return {
+        'categories': categories,
+        'products': products,
+        'users': users,
+        'carts': carts,
+    }
+
+
+class Shopper:
+    """One authenticated client replaying actions picked from ``MIX``."""
+
+    def __init__(self, user, rng, product_ids, category_ids, record):
+        token = UserTokenObtainPairSerializer.get_token(user).access_token
+        self.client = Client(headers={'Authorization': f'bearer {token}'}, raise_request_exception=False)
+        self.user = user
+        self.rng = rng
+        self.product_ids = product_ids
+        self.category_ids = category_ids
+        self.record = record
+        self.next_page = None
+
+    def request(self, endpoint, method, path, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            if method == 'get':
+                response = self.client.get(path, data)
+            else:
+                response = self.client.post(path, data, content_type='application/json')
+            elapsed = time.perf_counter() - start
+        self.record(endpoint, elapsed, response.status_code, len(queries))
+        return response
+
+    def act(self):
+        action = self.rng.choices(list(MIX), weights=list(MIX.values()))[0]
+        getattr(self, action)()
+
+    def browse(self):
+        if self.next_page and self.rng.random() < 0.3:
+            response = self.request('product-list-next', 'get', self.next_page)
+        elif self.rng.random() < 0.5:
+            response = self.request('product-list-category', 'get', '/api/products/', {
+                'category': self.rng.choice(self.category_ids), 'page_size': 24,
+            })
+        else:
+            response = self.request('product-list', 'get', '/api/products/', {'page_size': 24})
+        self.next_page = response.json().get('next') if response.status_code == 200 else None
+
+    def product_detail(self):
+        self.request('product-detail', 'get', f'/api/products/{self.rng.choice(self.product_ids)}/')
+
+    def search(self):
+        terms = [self.rng.choice(ADJECTIVES), self.rng.choice(NOUNS)]
+        self.request('product-search', 'get', '/api/products/', {'q': ' '.join(terms[:self.rng.randrange(1, 3)])})
+
+    def facets(self):
+        self.request('product-facets', 'get', '/api/products/facets/')
+
+    def add_to_cart(self):
+        self.request('cart-add-item', 'post', '/api/cart/add_item/', {
+            'product_id': self.rng.choice(self.product_ids), 'quantity': self.rng.randrange(1, 3),
+        })
+
+    def view_cart(self):
+        self.request('cart-view', 'get', '/api/cart/')
+
+    def checkout(self):
+        self.add_to_cart()
+        self.request('cart-checkout', 'post', '/api/cart/checkout/', {
+            'full_name': f'{self.user.first_name} {self.user.last_name}',
+            'email': self.user.email,
+            'address': '1 Benchmark Street',
+            'phone': '5550100',
+        })
+
+    def purchase(self):
+        self.request('product-purchase', 'post', f'/api/products/{self.rng.choice(self.product_ids)}/purchase/', {
+            'quantity': 1,
+        })
+
+
+def run(requests=2000, rng=None):
+    """Replay actions from randomly chosen shoppers until ``requests``
+    actions have run. Returns the raw samples grouped by endpoint and the
+    wall-clock time taken."""
+    rng = rng or random.Random(0)
+    product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+    category_ids = list(Category.objects.order_by('id').values_list('id', flat=True))
+    users = list(CustomUser.objects.filter(email__startswith='shopper').order_by('id'))
+    samples = defaultdict(list)
+
+    def record(endpoint, elapsed, status, queries):
+        samples[endpoint].append((elapsed, status, queries))
+
+    shoppers = [Shopper(user, random.Random(rng.random()), product_ids, category_ids, record) for user in users]
+    start = time.perf_counter()
+    for _ in range(requests):
+        rng.choice(shoppers).act()
+    return samples, time.perf_counter() - start
+
+
+def summarize(samples):
+    latencies = [elapsed for elapsed, _, _ in samples]
+    queries = [count for _, _, count in samples]
+    busy = sum(latencies)
+    return {
+        'requests': len(samples),
+        'client_errors': sum(1 for _, status, _ in samples if 400 <= status < 500),
+        'server_errors': sum(1 for _, status, _ in samples if status >= 500),
+        # Requests per second one worker sustains on this endpoint.
+        'throughput_rps': round(len(samples) / busy, 1) if busy else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'queries_avg': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def report(samples, elapsed):
+    everything = [sample for endpoint_samples in samples.values() for sample in endpoint_samples]
+    overall = summarize(everything)
+    overall['throughput_rps'] = round(len(everything) / elapsed, 1) if elapsed else None
+    return {
+        'overall': overall,
+        'endpoints': {endpoint: summarize(samples[endpoint]) for endpoint in sorted(samples)},
+    }
@@ -0,0 +1,63 @@
+import json
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from store.benchmark import run_asgi, run_wsgi
+from store.models import Product
+from users.models import CustomUser
+
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests per second and latency of the catalog and cart reads '
+        'under the WSGI handler (sync viewsets) and the ASGI handler (async views), '
+        'against the configured database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint and handler (default: 500).')
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients (default: 16).')
+        parser.add_argument('--user', help='Email of the user whose cart is read; the cart endpoint is skipped without it.')
+        parser.add_argument('--no-cache', action='store_true', help='Bypass the catalog response cache.')
+        parser.add_argument('--json', action='store_true', dest='as_json', help='Print the results as JSON.')
+
+    def handle(self, *args, requests, concurrency, user, no_cache, as_json, **options):
+        if requests < 1 or concurrency < 1:
+            raise CommandError('--requests and --concurrency must be at least 1')
+        product = Product.objects.order_by('id').first()
+        if product is None:
+            raise CommandError('The catalog is empty; seed some products first.')
+
+        endpoints = [
+            ('product list', '/api/products/', {}),
+            ('product detail', f'/api/products/{product.pk}/', {}),
+            ('category list', '/api/categories/', {}),
+        ]
+        if user:
+            try:
+                account = CustomUser.objects.get(email=user)
+            except CustomUser.DoesNotExist:
+                raise CommandError(f'No user with email {user!r}')
+            endpoints.append(('cart', '/api/cart/', {'Authorization': f'bearer {AccessToken.for_user(account)}'}))
+
+        results = []
+        with override_settings(CACHES=NO_CACHE) if no_cache else nullcontext():
+            for name, url, headers in endpoints:
+                for handler, run in (('wsgi', run_wsgi), ('asgi', run_asgi)):
+                    # Warm up connections, caches and lazy imports first.
+                    run(url, headers, concurrency, concurrency)
+                    results.append({'endpoint': name, 'handler': handler, **run(url, headers, requests, concurrency)})
+
+        if as_json:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f'{"endpoint":<16}{"handler":<9}{"rps":>9}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+        for row in results:
+            self.stdout.write(
+                f'{row["endpoint"]:<16}{row["handler"]:<9}{row["rps"]:>9}{row["p50_ms"]:>10}{row["p99_ms"]:>10}{row["errors"]:>8}'
+            )
@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.exporter import DEFAULT_CHUNK_SIZE, FORMATS, export_orders, filter_orders
+from store.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Stream order history with its order lines as CSV or NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help='File to write, or "-" for stdout (default).')
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--since', help='Only orders created on or after this date/datetime.')
+        parser.add_argument('--until', help='Only orders created on or before this date/datetime.')
+        parser.add_argument('--status', action='append', default=[],
+                            help='Only orders with this status (repeatable).')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help=f'Orders fetched per round trip (default: {DEFAULT_CHUNK_SIZE}).')
+
+    def handle(self, *args, output, format, since, until, status, chunk_size, **options):
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        try:
+            queryset = filter_orders(Order.objects.all(), since, until, status)
+        except ValueError as e:
+            raise CommandError(e)
+
+        chunks = export_orders(queryset, format, chunk_size=chunk_size)
+        if output == '-':
+            sys.stdout.writelines(chunks)
+        else:
+            with open(output, 'w', newline='', encoding='utf-8') as stream:
+                stream.writelines(chunks)
@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.importer import DEFAULT_BATCH_SIZE, FORMATS, ProductImporter, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Upsert products by SKU from a CSV or NDJSON file, streaming it in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or "-" for stdin.')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Input format (default: from the file extension).')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help=f'Rows per upsert (default: {DEFAULT_BATCH_SIZE}).')
+
+    def handle(self, *args, path, format, batch_size, **options):
+        fmt = format or detect_format(filename=path)
+        if fmt is None:
+            raise CommandError('Cannot tell the format from the file name; pass --format.')
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        importer = ProductImporter(batch_size=batch_size)
+        if path == '-':
+            report = importer.run(read_rows(sys.stdin.buffer, fmt))
+        else:
+            with open(path, 'rb') as stream:
+                report = importer.run(read_rows(stream, fmt))
+
+        for error in report['errors']:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        self.stdout.write(f"Imported {report['imported']} product(s), {report['error_count']} row(s) rejected")
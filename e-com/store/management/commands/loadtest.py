@@ -0,0 +1,133 @@
+import json
+import logging
+import random
+import subprocess
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from store import loadtest
+from store.models import Product
+
+# A private cache so a run neither reads nor pollutes the shared one.
+RUN_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'loadtest'}}
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+def git_commit():
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database with a synthetic catalog, users and carts, replay a '
+        'weighted mix of browse, search, add-to-cart, checkout and purchase requests '
+        'through the URLconf, and report throughput, p50/p95/p99 latency and queries '
+        'per request for each endpoint.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20000, help='Products to seed (default: 20000).')
+        parser.add_argument('--categories', type=int, default=50, help='Categories to seed (default: 50).')
+        parser.add_argument('--users', type=int, default=200, help='Shoppers to seed (default: 200).')
+        parser.add_argument('--carts', type=int, default=100, help='Shoppers with a pre-filled cart (default: 100).')
+        parser.add_argument('--requests', type=int, default=2000, help='Shopper actions to replay (default: 2000).')
+        parser.add_argument('--warmup', type=int, default=200, help='Actions replayed before measuring (default: 200).')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the data set and the mix (default: 0).')
+        parser.add_argument('--no-cache', action='store_true', help='Bypass the catalog response cache.')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database and reuse it if already seeded.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--compare', help='JSON results of an earlier run to print deltas against.')
+
+    def handle(self, *args, products, categories, users, carts, requests, warmup, seed, no_cache, keepdb, output,
+               compare, **options):
+        if min(products, categories, users, requests) < 1 or not 0 <= carts <= users:
+            raise CommandError('--products, --categories, --users and --requests must be at least 1, '
+                               'and --carts at most --users')
+        baseline = None
+        if compare:
+            try:
+                with open(compare) as fp:
+                    baseline = json.load(fp)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Cannot read {compare}: {exc}')
+
+        sizes = {'categories': categories, 'products': products, 'users': users, 'carts': carts}
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+        try:
+            with override_settings(
+                CACHES=NO_CACHE if no_cache else RUN_CACHES,
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                DEBUG=False,
+            ):
+                if not Product.objects.exists():
+                    self.stdout.write(f'Seeding {products} products, {users} users and {carts} carts...')
+                    loadtest.seed(rng=random.Random(seed), **sizes)
+                rng = random.Random(seed)
+                # Keep the per-request timing lines out of the report.
+                timing_logger = logging.getLogger('store.timing')
+                timing_logger.disabled = True
+                try:
+                    if warmup:
+                        loadtest.run(warmup, rng)
+                    samples, elapsed = loadtest.run(requests, rng)
+                finally:
+                    timing_logger.disabled = False
+            results = {
+                'meta': {
+                    'commit': git_commit(),
+                    'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                    'database': connection.vendor,
+                    'cache': not no_cache,
+                    'seed': seed,
+                    'sizes': sizes,
+                    'requests': requests,
+                    'elapsed_s': round(elapsed, 3),
+                },
+                **loadtest.report(samples, elapsed),
+            }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+
+        if output:
+            with open(output, 'w') as fp:
+                json.dump(results, fp, indent=2)
+        self.print_table(results, baseline)
+
+    def print_table(self, results, baseline):
+        before = baseline['endpoints'] if baseline else {}
+        self.stdout.write(
+            f'{"endpoint":<24}{"reqs":>6}{"rps":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}{"4xx":>6}{"5xx":>6}'
+        )
+        rows = [*results['endpoints'].items(), ('overall', results['overall'])]
+        if baseline:
+            before = {**before, 'overall': baseline['overall']}
+        for endpoint, row in rows:
+            self.stdout.write(
+                f'{endpoint:<24}{row["requests"]:>6}{row["throughput_rps"]:>9}{row["p50_ms"]:>9}{row["p95_ms"]:>9}'
+                f'{row["p99_ms"]:>9}{row["queries_avg"]:>9}{row["client_errors"]:>6}{row["server_errors"]:>6}'
+            )
+            old = before.get(endpoint)
+            if old:
+                self.stdout.write(
+                    f'{"  vs " + str(baseline["meta"].get("commit")):<24}{"":>6}'
+                    f'{self.change(row, old, "throughput_rps"):>9}{self.change(row, old, "p50_ms"):>9}'
+                    f'{self.change(row, old, "p95_ms"):>9}{self.change(row, old, "p99_ms"):>9}'
+                    f'{row["queries_avg"] - old["queries_avg"]:>+9.2f}'
+                )
+
+    @staticmethod
+    def change(row, old, key):
+        if not old.get(key):
+            return '-'
+        return f'{(row[key] - old[key]) / old[key]:+.0%}'
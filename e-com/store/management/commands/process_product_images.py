@@ -0,0 +1,49 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from store.images import content_hash, generate_renditions, image_name
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Move product images to content-addressed names, removing duplicate '
+        'uploads, and generate any missing renditions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-originals', action='store_true',
+                            help='Do not delete legacy files after they have been moved.')
+
+    def handle(self, *args, keep_originals, **options):
+        storage = Product._meta.get_field('image').storage
+        moved = {}
+        for product in Product.objects.exclude(image='').only('id', 'image').iterator():
+            name = product.image.name
+            if name not in moved:
+                moved[name] = self.content_addressed_name(storage, name)
+            if moved[name] != name:
+                Product.objects.filter(pk=product.pk).update(image=moved[name], renditions={})
+
+        if not keep_originals:
+            for old, new in moved.items():
+                if old != new and not Product.objects.filter(image=old).exists():
+                    storage.delete(old)
+
+        names = set(Product.objects.exclude(image='').values_list('image', flat=True))
+        for name in sorted(names):
+            generate_renditions(name)
+        self.stdout.write(
+            f'{sum(old != new for old, new in moved.items())} file(s) moved, '
+            f'{len(set(moved.values()))} unique image(s), renditions for {len(names)}'
+        )
+
+    def content_addressed_name(self, storage, name):
+        if not storage.exists(name):
+            self.stderr.write(f'Missing file: {name}')
+            return name
+        with storage.open(name) as source:
+            new_name = image_name(content_hash(File(source)), name)
+            if new_name == name:
+                return name
+            return storage.save(new_name, source)
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from store.profiling import PROFILE_TOKEN_MAX_AGE, make_token
+
+
+class Command(BaseCommand):
+    help = (
+        'Print an X-Profile-Token header value. Requests that send it are profiled '
+        'and listed at /api/profiles/ until the token expires.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/', help='Only profile requests under this path prefix (default: /).')
+
+    def handle(self, *args, path, **options):
+        self.stdout.write(f'X-Profile-Token: {make_token(path)}')
+        self.stderr.write(f'Valid for {PROFILE_TOKEN_MAX_AGE} seconds for paths under {path}')
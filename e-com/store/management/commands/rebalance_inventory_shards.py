@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.cache import invalidate_products
+from store.models import Inventory
+
+
+class Command(BaseCommand):
+    help = (
+        "Spread each product's stock evenly over its inventory shards. "
+        "Pass --shards to enable sharding for the given products, change the "
+        "shard count, or fold the shards back into one counter with --shards 0."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='*', type=int,
+                            help='Products to rebalance (default: every sharded product).')
+        parser.add_argument('--shards', type=int,
+                            help='New shard count for the selected products.')
+
+    def handle(self, *args, product_ids, shards, **options):
+        if shards is not None and shards < 0:
+            raise CommandError('--shards must be 0 or more')
+        if shards is not None and not product_ids:
+            raise CommandError('--shards needs the product ids to apply it to')
+
+        inventories = Inventory.objects.select_related('product').order_by('product_id')
+        if product_ids:
+            inventories = inventories.filter(product_id__in=product_ids)
+            missing = set(product_ids) - set(inventories.values_list('product_id', flat=True))
+            if missing:
+                raise CommandError(f'No inventory for products: {sorted(missing)}')
+        else:
+            inventories = inventories.filter(shard_count__gt=0)
+
+        for inventory in inventories.iterator():
+            inventory.rebalance(shard_count=shards)
+            invalidate_products([inventory.product])
+            self.stdout.write(
+                f'{inventory.product}: {inventory.total_stock} in {inventory.shard_count} shard(s)'
+            )
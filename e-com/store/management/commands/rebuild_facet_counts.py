@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from store.facets import rebuild
+from store.models import ProductFacetCount
+
+
+class Command(BaseCommand):
+    help = 'Recount the stored product facet counts from the catalog.'
+
+    def handle(self, *args, **options):
+        rebuild()
+        self.stdout.write(f'Rebuilt {ProductFacetCount.objects.count()} facet cell(s)')
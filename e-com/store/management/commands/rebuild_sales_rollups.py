@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from store.models import DailyCategorySales, DailyProductSales
+from store.sales import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollups from the order lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild this day (YYYY-MM-DD) and later.')
+
+    def handle(self, *args, since=None, **options):
+        try:
+            day = parse_date(since) if since else None
+        except ValueError:
+            day = None
+        if since and day is None:
+            raise CommandError(f'Invalid date: {since!r}')
+        rebuild(day)
+        counts = [
+            (model.objects.filter(day__gte=day) if day else model.objects.all()).count()
+            for model in (DailyProductSales, DailyCategorySales)
+        ]
+        self.stdout.write(f'Rebuilt {counts[0]} product and {counts[1]} category row(s)')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete cart stock reservations whose hold has expired. Safe to run from cron.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows deleted per statement (default: 1000).')
+
+    def handle(self, *args, batch_size, **options):
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+        deleted = release_expired(batch_size=batch_size)
+        self.stdout.write(f'Released {deleted} expired reservation(s)')
@@ -0,0 +1,294 @@
+"""In-process metrics in the Prometheus text format.
+
+Counters and histograms are kept in memory per process. With several
+worker processes, set ``METRICS_MULTIPROC_DIR`` to a directory they share
+(and empty it on deploy): each process writes its values there at most
+every ``METRICS_FLUSH_INTERVAL`` seconds and on exit, and ``/metrics``
+adds up every process's file, so whichever worker serves the scrape
+reports the totals. Gauges are computed from the database when scraped
+and kept in the cache for ``METRICS_GAUGE_MAX_AGE`` seconds, so frequent
+scrapes do not each run the aggregates.
+
+The endpoint is for staff only, unless ``METRICS_TOKEN`` is set (the
+scraper then sends it as a bearer token) or ``METRICS_PUBLIC`` is on.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from .models import Inventory, Order
+
+MULTIPROC_DIR = getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', None)
+METRICS_PUBLIC = getattr(settings, 'METRICS_PUBLIC', False)
+GAUGE_MAX_AGE = getattr(settings, 'METRICS_GAUGE_MAX_AGE', 60)
+LOW_STOCK_THRESHOLD = getattr(settings, 'LOW_STOCK_THRESHOLD', 5)
+OPEN_ORDER_STATUSES = ('pending', 'processing')
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.changed()
+
+    @staticmethod
+    def merge(total, value):
+        return total + value
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_labels(self.labelnames, key)} {_number(value)}'
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, registry, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: a count per bucket (not cumulative), then sum and count.
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.registry.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[index] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+        self.registry.changed()
+
+    @staticmethod
+    def merge(total, value):
+        return [a + b for a, b in zip(total, value)]
+
+    def samples(self, values):
+        for key, entry in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry[:-2]):
+                cumulative += count
+                yield f'{self.name}_bucket{_labels(self.labelnames, key, [("le", repr(float(bound)))])} {cumulative}'
+            yield f'{self.name}_bucket{_labels(self.labelnames, key, [("le", "+Inf")])} {entry[-1]}'
+            yield f'{self.name}_sum{_labels(self.labelnames, key)} {_number(float(entry[-2]))}'
+            yield f'{self.name}_count{_labels(self.labelnames, key)} {entry[-1]}'
+
+
+class Gauge:
+    """A value read when the metrics are scraped; ``read()`` returns a
+    number, or a dict of label values to numbers. With ``max_age``, a value
+    is reused from the cache for that many seconds."""
+    type = 'gauge'
+
+    def __init__(self, name, help, read, labelnames=(), max_age=0):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.labelnames = tuple(labelnames)
+        self.max_age = max_age
+
+    def value(self):
+        if not self.max_age:
+            return self.read()
+        return cache.get_or_set(f'metrics:gauge:{self.name}', self.read, self.max_age)
+
+    def samples(self):
+        value = self.value()
+        if not isinstance(value, dict):
+            value = {(): value}
+        for key, number in sorted(value.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            yield f'{self.name}{_labels(self.labelnames, key)} {_number(number)}'
+
+
+class Registry:
+    def __init__(self, directory=None, flush_interval=FLUSH_INTERVAL):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.gauges = {}
+        self.directory = Path(directory) if directory else None
+        self.flush_interval = flush_interval
+        self.flush_lock = threading.Lock()
+        self.flush_timer = None
+        # Unique per process start, so a recycled pid never takes over the
+        # counts of an earlier process.
+        self.filename = f'{os.getpid()}-{time.time_ns()}.json'
+        if self.directory:
+            atexit.register(self.flush)
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(self, name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self, name, help, labelnames, buckets))
+
+    def gauge(self, name, help, read, labelnames=(), max_age=0):
+        self.gauges[name] = Gauge(name, help, read, labelnames, max_age)
+        return self.gauges[name]
+
+    def _add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: {json.dumps(key): value if isinstance(value, int | float) else list(value)
+                       for key, value in metric.values.items()}
+                for name, metric in self.metrics.items()
+            }
+
+    def changed(self):
+        # Writes are batched: the first change schedules a flush, and
+        # changes until it runs ride along.
+        if self.directory and self.flush_timer is None:
+            with self.flush_lock:
+                if self.flush_timer is None:
+                    self.flush_timer = threading.Timer(self.flush_interval, self.flush)
+                    self.flush_timer.daemon = True
+                    self.flush_timer.start()
+
+    def flush(self):
+        """Write this process's values to the shared directory."""
+        with self.flush_lock:
+            self.flush_timer = None
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / self.filename
+            temporary = path.with_suffix('.tmp')
+            temporary.write_text(json.dumps(self.snapshot()))
+            os.replace(temporary, path)
+
+    def collect(self):
+        """Values of every metric, summed over all processes."""
+        snapshots = [self.snapshot()]
+        if self.directory and self.directory.is_dir():
+            for path in self.directory.glob('*.json'):
+                if path.name == self.filename:
+                    continue
+                try:
+                    snapshots.append(json.loads(path.read_text()))
+                except (OSError, ValueError):
+                    continue
+        totals = {name: {} for name in self.metrics}
+        for snapshot in snapshots:
+            for name, values in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for key, value in values.items():
+                    key = tuple(json.loads(key))
+                    current = totals[name].get(key)
+                    totals[name][key] = value if current is None else metric.merge(current, value)
+        return totals
+
+    def exposition(self):
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines += [f'# HELP {name} {metric.help}', f'# TYPE {name} {metric.type}', *metric.samples(values)]
+        for name, gauge in self.gauges.items():
+            lines += [f'# HELP {name} {gauge.help}', f'# TYPE {name} gauge', *gauge.samples()]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry(MULTIPROC_DIR)
+
+request_latency = registry.histogram(
+    'store_request_duration_seconds', 'Time to produce a response, by route.', ['route', 'method', 'status'],
+)
+checkouts = registry.counter('store_checkouts_total', 'Cart checkouts, by result.', ['result'])
+purchases = registry.counter('store_purchases_total', 'Single-product purchases, by result.', ['result'])
+stock_adjustments = registry.counter(
+    'store_stock_adjustments_total', 'Manual stock adjustments, by direction and result.', ['direction', 'result'],
+)
+stock_adjusted_units = registry.counter(
+    'store_stock_adjusted_units_total', 'Units added or removed by manual stock adjustments.', ['direction'],
+)
+
+
+def low_stock_skus():
+    return (
+        Inventory.objects.annotate(total=F('stock_count') + Coalesce(Sum('shards__stock_count'), Value(0)))
+        .filter(total__lt=LOW_STOCK_THRESHOLD)
+        .count()
+    )
+
+
+def open_orders():
+    counts = dict(
+        Order.objects.filter(status__in=OPEN_ORDER_STATUSES).order_by()
+        .values_list('status').annotate(count=Count('id'))
+    )
+    return {status: counts.get(status, 0) for status in OPEN_ORDER_STATUSES}
+
+
+registry.gauge(
+    'store_low_stock_skus', f'Products with fewer than {LOW_STOCK_THRESHOLD} units in stock.', low_stock_skus,
+    max_age=GAUGE_MAX_AGE,
+)
+registry.gauge('store_open_orders', 'Orders not yet shipped, by status.', open_orders, ['status'], max_age=GAUGE_MAX_AGE)
+
+
+def status_class(status_code):
+    return f'{status_code // 100}xx'
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint. With ``METRICS_TOKEN`` set, the scraper
+    must send it as a bearer token; otherwise only staff signed in to the
+    site may read it, unless ``METRICS_PUBLIC`` is on."""
+    if METRICS_TOKEN:
+        expected = f'Bearer {METRICS_TOKEN}'
+        if not constant_time_compare(request.headers.get('Authorization', ''), expected):
+            return HttpResponseForbidden()
+    elif not (METRICS_PUBLIC or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.exposition(), content_type=CONTENT_TYPE)
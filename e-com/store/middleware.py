@@ -0,0 +1,113 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+from . import metrics, profiling, timing
+
+ASYNC_ROOT_URLCONF = getattr(settings, 'ASYNC_ROOT_URLCONF', 'e_comm.async_urls')
+# The methods the async read views answer; everything else is left to DRF.
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+@sync_and_async_middleware
+def async_routes_middleware(get_response):
+    """Resolve GET and HEAD requests against ``ASYNC_ROOT_URLCONF`` when
+    served over ASGI, so the async read views take over their routes there.
+    Writes to the same paths keep going to the DRF viewsets. Under WSGI the
+    middleware removes itself and the DRF viewsets serve every route."""
+    if not iscoroutinefunction(get_response):
+        raise MiddlewareNotUsed
+
+    async def middleware(request):
+        if request.method in SAFE_METHODS:
+            request.urlconf = ASYNC_ROOT_URLCONF
+        return await get_response(request)
+
+    return middleware
+
+
+@sync_and_async_middleware
+def server_timing_middleware(get_response):
+    """Report where a sampled request's time went in a ``Server-Timing``
+    header and a log line (see ``store.timing``). Keep it first in
+    MIDDLEWARE so the total covers the other middleware too. For streaming
+    responses the total stops when the response starts."""
+    timing.install()
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = timing.start()
+            response = await get_response(request)
+            if token is not None:
+                timing.report(request, response, timing.stop(token))
+            return response
+    else:
+        def middleware(request):
+            token = timing.start()
+            response = get_response(request)
+            if token is not None:
+                timing.report(request, response, timing.stop(token))
+            return response
+
+    return middleware
+
+
+def observe_latency(request, response, started):
+    route, _ = timing.route_name(request)
+    metrics.request_latency.observe(
+        time.perf_counter() - started,
+        route=route or 'unmatched', method=request.method, status=metrics.status_class(response.status_code),
+    )
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Record every request's latency in the per-route histogram served
+    at ``/metrics``. Unresolved paths share the ``unmatched`` route so
+    scanners cannot blow up the number of series."""
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            started = time.perf_counter()
+            response = await get_response(request)
+            observe_latency(request, response, started)
+            return response
+    else:
+        def middleware(request):
+            started = time.perf_counter()
+            response = get_response(request)
+            observe_latency(request, response, started)
+            return response
+
+    return middleware
+
+
+@sync_and_async_middleware
+def profiling_middleware(get_response):
+    """Profile the rest of the request when it asks to be and is allowed
+    to (see ``store.profiling``). The profile id is returned in the
+    ``X-Profile-Id`` header."""
+    profiling.install()
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if not profiling.wants_profile(request) or not await sync_to_async(profiling.selected)(request):
+                return await get_response(request)
+            profile = profiling.Profile(request)
+            profile.start()
+            response = await get_response(request)
+            profile.stop(response)
+            return response
+    else:
+        def middleware(request):
+            if not profiling.wants_profile(request) or not profiling.selected(request):
+                return get_response(request)
+            profile = profiling.Profile(request)
+            profile.start()
+            response = get_response(request)
+            profile.stop(response)
+            return response
+
+    return middleware
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:44
+
+from django.db import migrations
+
+
+def create_missing_inventory(apps, schema_editor):
+    # Inventory.stock_count becomes the only stock counter. Products that never
+    # got an inventory row keep the stock they had on the product itself.
+    Product = apps.get_model('store', 'Product')
+    Inventory = apps.get_model('store', 'Inventory')
+    Inventory.objects.bulk_create([
+        Inventory(product_id=product_id, stock_count=stock)
+        for product_id, stock in Product.objects.filter(inventory__isnull=True).values_list('id', 'stock')
+    ])
+
+
+def restore_product_stock(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    Inventory = apps.get_model('store', 'Inventory')
+    for product_id, stock_count in Inventory.objects.values_list('product_id', 'stock_count').iterator():
+        Product.objects.filter(pk=product_id).update(stock=stock_count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_product_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_inventory, restore_product_stock),
+        migrations.RemoveField(
+            model_name='product',
+            name='stock',
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_inventory_single_stock_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventory',
+            name='shard_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='InventoryShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('stock_count', models.PositiveIntegerField(default=0)),
+                ('inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='store.inventory')),
+            ],
+            options={
+                'unique_together': {('inventory', 'index')},
+            },
+        ),
+    ]
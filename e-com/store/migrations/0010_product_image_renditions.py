@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:51
+
+import store.images
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_product_sku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(storage=store.images.ContentAddressedStorage(), upload_to=store.images.product_image_path),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:02
+
+from bisect import bisect_right
+from collections import Counter
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# A copy of store.models.facets as of this migration, so later changes to
+# that module do not change what it does.
+PRICE_BUCKETS = [Decimal(str(bound)) for bound in getattr(settings, 'PRODUCT_PRICE_BUCKETS', [10, 25, 50, 100, 250])]
+
+
+def facet_cell(category_id, price, stock):
+    return (category_id, bisect_right(PRICE_BUCKETS, Decimal(price)), stock > 0)
+
+
+def count_products(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    InventoryShard = apps.get_model('store', 'InventoryShard')
+    ProductFacetCount = apps.get_model('store', 'ProductFacetCount')
+    sharded = Counter()
+    for product_id, stock in InventoryShard.objects.values_list('inventory__product_id', 'stock_count').iterator():
+        sharded[product_id] += stock
+    cells = Counter()
+    rows = Product.objects.values_list('id', 'category_id', 'price', 'inventory__stock_count')
+    for product_id, category_id, price, stock in rows.iterator():
+        cells[facet_cell(category_id, price, (stock or 0) + sharded[product_id])] += 1
+    ProductFacetCount.objects.bulk_create([
+        ProductFacetCount(category_id=category_id, price_bucket=bucket, in_stock=in_stock, count=count)
+        for (category_id, bucket, in_stock), count in cells.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_product_image_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_bucket', models.PositiveSmallIntegerField()),
+                ('in_stock', models.BooleanField()),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='store.category')),
+            ],
+            options={
+                'unique_together': {('category', 'price_bucket', 'in_stock')},
+            },
+        ),
+        migrations.RunPython(count_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-16 21:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_catalog_filter_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'processing'])), fields=['status'], name='order_open_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def record_categories(apps, schema_editor):
+    # Existing lines are counted under their product's current category, as
+    # the rollups did until now.
+    OrderItem = apps.get_model('store', 'OrderItem')
+    Product = apps.get_model('store', 'Product')
+    OrderItem.objects.update(
+        category_id=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('category_id')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_daily_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='store.category'),
+        ),
+        migrations.RunPython(record_categories, migrations.RunPython.noop),
+    ]
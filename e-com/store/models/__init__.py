@@ -1,5 +1,8 @@
 
 from .category import Category
-from .inventory import Inventory
+from .inventory import Inventory, InventoryShard
 from .products import Product
 from .cart import Cart , CartItem , Order , OrderItem
+from .reservation import StockReservation
+from .facets import ProductFacetCount
+from .sales import DailyCategorySales, DailyProductSales
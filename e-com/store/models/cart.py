@@ -1,23 +1,56 @@
 from django.db import models
+from django.db.models import DecimalField, F, Prefetch, Q, Sum
+from django.db.models.functions import Coalesce
 from users.models import CustomUser
+from .category import Category
 from .products import Product
 
 
+def line_total(prefix=''):
+    """SUM(quantity * product.price) over cart lines, 0 when there are none."""
+    money = DecimalField(max_digits=12, decimal_places=2)
+    return Coalesce(
+        Sum(F(f'{prefix}quantity') * F(f'{prefix}product__price'), output_field=money),
+        0, output_field=money,
+    )
+
+
+class CartQuerySet(models.QuerySet):
+    def with_items(self):
+        """Load carts with their items, products and categories in two queries,
+        with totals aggregated by the database instead of in Python."""
+        items = (
+            CartItem.objects.select_related('product__category', 'product__inventory')
+            .prefetch_related('product__inventory__shards')
+            .order_by('added_at', 'id')
+        )
+        return self.prefetch_related(Prefetch('items', queryset=items)).annotate(
+            cart_total_price=line_total('items__'),
+            cart_total_items=Coalesce(Sum('items__quantity'), 0),
+        )
+
+
 class Cart(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartQuerySet.as_manager()
+
     def __str__(self):
         return f"Cart for {self.user.email}"
     
     @property
     def total_price(self):
-        return sum(item.subtotal for item in self.items.all())
+        if hasattr(self, 'cart_total_price'):
+            return self.cart_total_price
+        return self.items.aggregate(total=line_total())['total']
     
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        if hasattr(self, 'cart_total_items'):
+            return self.cart_total_items
+        return self.items.aggregate(total=Coalesce(Sum('quantity'), 0))['total']
 
 
 class CartItem(models.Model):
@@ -37,6 +70,17 @@ class CartItem(models.Model):
         return self.product.price * self.quantity
 
 
+class OrderQuerySet(models.QuerySet):
+    def with_items(self):
+        """Prefetch order lines with their products: two queries in total."""
+        items = OrderItem.objects.select_related('product').order_by('id')
+        return self.prefetch_related(Prefetch('items', queryset=items))
+
+    def with_summary(self):
+        """Annotate ``item_count`` (units ordered) without loading the lines."""
+        return self.annotate(item_count=Coalesce(Sum('items__quantity'), 0))
+
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -45,6 +89,13 @@ class Order(models.Model):
         ('delivered', 'Delivered'),
         ('cancelled', 'Cancelled'),
     )
+    # Target status: the statuses an order may move to it from.
+    TRANSITIONS = {
+        'processing': ('pending',),
+        'shipped': ('processing',),
+        'delivered': ('shipped',),
+        'cancelled': ('pending', 'processing'),
+    }
     
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='orders')
     full_name = models.CharField(max_length=100)
@@ -55,6 +106,19 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            # Date range filters of the order export.
+            models.Index(fields=['created_at'], name='order_created_idx'),
+            # Open order counts for the metrics endpoint.
+            models.Index(
+                fields=['status'], condition=Q(status__in=['pending', 'processing']), name='order_open_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"Order {self.id} - {self.user.email}"
@@ -65,6 +129,10 @@ class OrderItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)  # Price at the time of purchase
+    # Category at the time of purchase, so the sales rollups keep counting
+    # the line there if the product moves. Null on lines from before it was
+    # recorded, which fall back to the product's category.
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
     
     def __str__(self):
         return f"{self.quantity} x {self.product.name} in Order {self.order.id}"
@@ -5,7 +5,11 @@ class Category(models.Model):
     name = models.CharField(max_length = 255 , unique = True)
     description = models.TextField(blank = True)
     created_at = models.DateTimeField(auto_now_add = True)
-    
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='category_created_idx'),
+        ]
 
     def __str__(self):
 
@@ -0,0 +1,74 @@
+from bisect import bisect_right
+from collections import Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models
+from django.db.models import F
+
+from .category import Category
+
+# Upper bounds of the price buckets; the last bucket has no upper bound.
+# Changing them needs ``manage.py rebuild_facet_counts``.
+PRICE_BUCKETS = [Decimal(str(bound)) for bound in getattr(settings, 'PRODUCT_PRICE_BUCKETS', [10, 25, 50, 100, 250])]
+
+
+def price_bucket(price):
+    return bisect_right(PRICE_BUCKETS, Decimal(price))
+
+
+def facet_cell(category_id, price, stock):
+    return (category_id, price_bucket(price), stock > 0)
+
+
+def product_cell(product):
+    try:
+        stock = product.inventory.total_stock
+    except ObjectDoesNotExist:
+        stock = 0
+    return facet_cell(product.category_id, product.price, stock)
+
+
+class ProductFacetCountQuerySet(models.QuerySet):
+    def apply(self, changes):
+        """Move products between cells. ``changes`` holds ``(before, after)``
+        cell pairs, where None stands for a product that did not exist or no
+        longer does."""
+        deltas = Counter()
+        for before, after in changes:
+            if before == after:
+                continue
+            if before is not None:
+                deltas[before] -= 1
+            if after is not None:
+                deltas[after] += 1
+        # A fixed order keeps concurrent writers from deadlocking on the rows.
+        for (category_id, bucket, in_stock), delta in sorted(deltas.items()):
+            if not delta:
+                continue
+            cell = self.filter(category_id=category_id, price_bucket=bucket, in_stock=in_stock)
+            if not cell.update(count=F('count') + delta):
+                self.bulk_create(
+                    [ProductFacetCount(category_id=category_id, price_bucket=bucket, in_stock=in_stock)],
+                    ignore_conflicts=True,
+                )
+                cell.update(count=F('count') + delta)
+
+
+class ProductFacetCount(models.Model):
+    """Number of products per (category, price bucket, in stock) cell, kept
+    up to date by the product and inventory write paths so unfiltered
+    facet counts are read without scanning the catalog."""
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='facet_counts')
+    price_bucket = models.PositiveSmallIntegerField()
+    in_stock = models.BooleanField()
+    count = models.IntegerField(default=0)
+
+    objects = ProductFacetCountQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('category', 'price_bucket', 'in_stock')
+
+    def __str__(self):
+        return f'{self.category} [{self.price_bucket}, {"in" if self.in_stock else "out of"} stock] - {self.count}'
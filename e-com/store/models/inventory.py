@@ -1,10 +1,180 @@
-from django.db import models
+import random
+
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .facets import ProductFacetCount, facet_cell
 from .products import Product
 
 class Inventory(models.Model):
     product = models.OneToOneField (Product,on_delete = models.CASCADE,related_name="inventory")
     stock_count = models.PositiveIntegerField(default= 0)
+    # Number of InventoryShard rows the stock is spread over; 0 keeps all of
+    # it in stock_count. Change it with rebalance() so stock is moved along.
+    shard_count = models.PositiveSmallIntegerField(default=0)
     last_updated = models.DateTimeField (auto_now=True)
 
+    class Meta:
+        indexes = [
+            # In-stock filtering only needs the rows that have stock.
+            models.Index(fields=['product'], condition=Q(stock_count__gt=0), name='inventory_in_stock_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product} - {self.total_stock}'
+
+    # Stock changes are applied in the database with F() expressions so
+    # concurrent writers never overwrite each other's updates. The common
+    # case is one guarded UPDATE that leaves stock where it lands, which
+    # cannot move the product in or out of stock. Anything else goes
+    # through _change_locked(), which reads the stock before and after the
+    # change under the row lock so the facet counts follow it exactly.
+
+    @property
+    def total_stock(self):
+        if not self.shard_count:
+            return self.stock_count
+        return self.stock_count + sum(shard.stock_count for shard in self.shards.all())
+
+    def add(self, quantity):
+        if self.shard_count:
+            # Spread restocks so no shard becomes the only one holding stock.
+            added = self.shards.filter(index=random.randrange(self.shard_count), stock_count__gt=0).update(
+                stock_count=F('stock_count') + quantity,
+            )
+        else:
+            added = Inventory.objects.filter(pk=self.pk, stock_count__gt=0).update(
+                stock_count=F('stock_count') + quantity, last_updated=timezone.now(),
+            )
+        if not added:
+            self._change_locked(quantity)
+        self.refresh_from_db()
+
+    def remove(self, quantity):
+        """Take ``quantity`` off the counter if that much is available.
+        Returns False, leaving the row untouched, when it is not."""
+        if self.shard_count:
+            removed = self._remove_from_shards(quantity)
+            self.refresh_from_db()
+        else:
+            removed = Inventory.objects.filter(pk=self.pk, stock_count__gt=quantity).update(
+                stock_count=F('stock_count') - quantity, last_updated=timezone.now(),
+            ) == 1 or self._change_locked(-quantity)
+            self.refresh_from_db(fields=['stock_count', 'last_updated'])
+        return removed
+
+    def _remove_from_shards(self, quantity):
+        # Concurrent buyers land on different shards, so each one only
+        # contends for 1/shard_count of the row locks on a hot SKU.
+        candidates = list(self.shards.filter(stock_count__gt=quantity).values_list('index', flat=True))
+        random.shuffle(candidates)
+        for index in candidates:
+            updated = self.shards.filter(index=index, stock_count__gt=quantity).update(
+                stock_count=F('stock_count') - quantity,
+            )
+            if updated:
+                return True
+        # No single shard can cover the quantity and keep some stock; take
+        # it across all of them.
+        return self._change_locked(-quantity)
+
+    def _change_locked(self, quantity):
+        """Add ``quantity`` (or remove it, if negative) with the inventory row
+        and its shards locked, and move the product between the in and out
+        of stock facet cells if that changes. Returns False, changing
+        nothing, when there is not enough stock to remove.
+
+        Row and shards are locked in that order, like in rebalance(), and
+        the guarded updates above never leave a shard empty or fill an empty
+        one, so whether the product is in stock only changes under the lock.
+        """
+        with transaction.atomic():
+            inventory = Inventory.objects.select_for_update().get(pk=self.pk)
+            shards = list(inventory.shards.select_for_update().order_by('index')) if inventory.shard_count else []
+            before = inventory.stock_count + sum(shard.stock_count for shard in shards)
+            if before + quantity < 0:
+                return False
+            if quantity > 0 and shards:
+                InventoryShard.objects.filter(pk=random.choice(shards).pk).update(stock_count=F('stock_count') + quantity)
+            elif quantity > 0:
+                Inventory.objects.filter(pk=self.pk).update(
+                    stock_count=F('stock_count') + quantity, last_updated=timezone.now(),
+                )
+            else:
+                remaining = -quantity
+                for shard in shards:
+                    taken = min(shard.stock_count, remaining)
+                    if taken:
+                        InventoryShard.objects.filter(pk=shard.pk).update(stock_count=F('stock_count') - taken)
+                        remaining -= taken
+                if remaining:
+                    Inventory.objects.filter(pk=self.pk).update(
+                        stock_count=F('stock_count') - remaining, last_updated=timezone.now(),
+                    )
+            self.record_stock_change(before, before + quantity)
+        return True
+
+    def set_stock(self, stock):
+        with transaction.atomic():
+            previous = Inventory.objects.select_for_update().get(pk=self.pk).total_stock
+            if self.shard_count:
+                self.rebalance(stock=stock)
+            else:
+                self.stock_count = stock
+                self.save(update_fields=['stock_count', 'last_updated'])
+            self.record_stock_change(previous, stock)
+
+    def record_stock_change(self, before, after):
+        # Only running out of stock or coming back moves the product to
+        # another facet cell.
+        if (before > 0) != (after > 0):
+            product = self.product
+            ProductFacetCount.objects.apply([
+                (facet_cell(product.category_id, product.price, before), facet_cell(product.category_id, product.price, after)),
+            ])
+
+    def rebalance(self, shard_count=None, stock=None):
+        """Spread ``stock`` (default: the current total) evenly over
+        ``shard_count`` shards (default: the current count). A shard count of
+        0 folds every shard back into stock_count."""
+        with transaction.atomic():
+            inventory = Inventory.objects.select_for_update().get(pk=self.pk)
+            shards = list(inventory.shards.select_for_update().order_by('index'))
+            if stock is None:
+                stock = inventory.stock_count + sum(shard.stock_count for shard in shards)
+            if shard_count is None:
+                shard_count = inventory.shard_count
+
+            inventory.shards.filter(index__gte=shard_count).delete()
+            if shard_count:
+                per_shard, extra = divmod(stock, shard_count)
+                InventoryShard.objects.bulk_create(
+                    [
+                        InventoryShard(inventory=inventory, index=index, stock_count=per_shard + (index < extra))
+                        for index in range(shard_count)
+                    ],
+                    update_conflicts=True,
+                    unique_fields=['inventory', 'index'],
+                    update_fields=['stock_count'],
+                )
+                inventory.stock_count = 0
+            else:
+                inventory.stock_count = stock
+            inventory.shard_count = shard_count
+            inventory.save(update_fields=['stock_count', 'shard_count', 'last_updated'])
+        self.refresh_from_db()
+
+
+class InventoryShard(models.Model):
+    inventory = models.ForeignKey(Inventory, on_delete=models.CASCADE, related_name='shards')
+    index = models.PositiveSmallIntegerField()
+    stock_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('inventory', 'index')
+        indexes = [
+            models.Index(fields=['inventory'], condition=Q(stock_count__gt=0), name='shard_in_stock_idx'),
+        ]
+
     def __str__(self):
-        return f'{self.product} - {self.stock_count}'
\ No newline at end of file
+        return f'{self.inventory.product} [{self.index}] - {self.stock_count}'
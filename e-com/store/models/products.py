@@ -1,17 +1,32 @@
 from django.db import models
 from .category import Category
 from users.models import CustomUser
+from store.images import ContentAddressedStorage, product_image_path
 
 
 class Product(models.Model):
+    # Supplier stock-keeping unit; the key bulk imports upsert on.
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length = 255)
     description = models.TextField ()
     price = models.DecimalField (max_digits = 10 , decimal_places=2)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
-    stock = models.PositiveIntegerField(default=0)
-    image = models.ImageField(upload_to='products/')
+    image = models.ImageField(upload_to=product_image_path, storage=ContentAddressedStorage())
+    # {size: {format: storage name}}, filled in by store.images once the
+    # resized copies of ``image`` exist.
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination, optionally narrowed to one category.
+            models.Index(fields=['-created_at', '-id'], name='product_created_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='product_category_created_idx'),
+            # Price range filters, with and without a category.
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+        ]
+
 
     def __str__(self):
         return self.name
\ No newline at end of file
@@ -0,0 +1,23 @@
+from django.db import models
+from .cart import Cart
+from .products import Product
+
+
+class StockReservation(models.Model):
+    """Stock held for a cart line until ``expires_at``. Holds are not taken
+    off Inventory; available stock is on-hand minus unexpired holds."""
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('cart', 'product')
+        indexes = [
+            # Summing the active holds on a product.
+            models.Index(fields=['product', 'expires_at'], name='reservation_product_exp_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product} held for {self.cart}"
@@ -0,0 +1,73 @@
+from django.db import connections, models
+
+from .cart import Order
+from .category import Category
+from .products import Product
+
+
+class SalesRollupQuerySet(models.QuerySet):
+    def apply(self, deltas):
+        """Add ``deltas``, a mapping of ``(day, key id, status)`` to
+        ``(units, revenue)``, to the rollup rows in one upsert. Rows are
+        created on first use."""
+        rows = [(*key, *delta) for key, delta in sorted(deltas.items()) if any(delta)]
+        if not rows:
+            return
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        opts = self.model._meta
+        table = quote(opts.db_table)
+        columns = [quote(opts.get_field(name).column) for name in ('day', self.model.rollup_key, 'status')]
+        units, revenue = quote('units'), quote('revenue')
+        # Rows are sorted, so concurrent writers lock them in the same order.
+        sql = (
+            f'INSERT INTO {table} ({", ".join(columns)}, {units}, {revenue}) '
+            f'VALUES {", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))} '
+            f'ON CONFLICT ({", ".join(columns)}) DO UPDATE SET '
+            f'{units} = {table}.{units} + EXCLUDED.{units}, {revenue} = {table}.{revenue} + EXCLUDED.{revenue}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value for row in rows for value in row])
+
+
+class SalesRollup(models.Model):
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    objects = SalesRollupQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+
+class DailyProductSales(SalesRollup):
+    """Units sold and revenue per (day, product, order status), kept up to
+    date at checkout and on status changes so sales reports read one row
+    per day instead of every order line."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+
+    rollup_key = 'product'
+
+    class Meta:
+        unique_together = ('day', 'product', 'status')
+        verbose_name_plural = 'daily product sales'
+
+    def __str__(self):
+        return f'{self.day} {self.product} [{self.status}] - {self.units} units, {self.revenue}'
+
+
+class DailyCategorySales(SalesRollup):
+    """Units sold and revenue per (day, category, order status), counted
+    under the category recorded on each order line at checkout."""
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+
+    rollup_key = 'category'
+
+    class Meta:
+        unique_together = ('day', 'category', 'status')
+        verbose_name_plural = 'daily category sales'
+
+    def __str__(self):
+        return f'{self.day} {self.category} [{self.status}] - {self.units} units, {self.revenue}'
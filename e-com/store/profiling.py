@@ -0,0 +1,235 @@
+"""On-demand profiles of single requests.
+
+A request is profiled when it carries a valid ``X-Profile-Token`` header
+(see ``manage.py profile_token``) or when a staff user adds ``?profile=1``.
+Everything else pays for two dictionary lookups.
+
+A profiled request is sampled every ``PROFILE_SAMPLE_INTERVAL`` seconds
+from a background thread, which reads the stack of the thread serving it,
+and every SQL statement it runs is traced with its duration. The profile
+is stored under ``PROFILE_DIR`` as ``<id>.json`` (request details, SQL
+trace and the functions with the most samples) and ``<id>.folded``
+(collapsed stacks for flamegraph.pl, speedscope or inferno). Only the
+newest ``PROFILE_RETENTION`` profiles are kept.
+
+Under ASGI the sampled thread is the event loop's, so async views are
+profiled but sync code the ORM runs in worker threads shows up as waits.
+"""
+import json
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .timing import route_name
+
+PROFILE_DIR = Path(getattr(settings, 'PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+PROFILE_RETENTION = getattr(settings, 'PROFILE_RETENTION', 50)
+PROFILE_SAMPLE_INTERVAL = getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.005)
+PROFILE_TOKEN_MAX_AGE = getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 3600)
+TOKEN_HEADER = 'HTTP_X_PROFILE_TOKEN'
+QUERY_FLAG = 'profile'
+TOP_FUNCTIONS = 40
+
+_signer = signing.TimestampSigner(salt='store.profiling')
+_trace = ContextVar('store_profile_sql', default=None)
+_installed = False
+
+
+def make_token(path_prefix='/'):
+    """A header value that profiles requests under ``path_prefix`` until it
+    expires."""
+    return _signer.sign(path_prefix)
+
+
+def token_allows(token, path):
+    try:
+        path_prefix = _signer.unsign(token, max_age=PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return path.startswith(path_prefix)
+
+
+def is_staff(request):
+    """Authenticate ``request`` the way the API views will. Only runs for
+    requests that ask to be profiled."""
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        return drf_request.user.is_staff
+    except APIException:
+        return False
+
+
+def wants_profile(request):
+    return TOKEN_HEADER in request.META or QUERY_FLAG in request.GET
+
+
+def selected(request):
+    token = request.META.get(TOKEN_HEADER)
+    if token is not None:
+        return token_allows(token, request.path)
+    return request.GET.get(QUERY_FLAG) == '1' and is_staff(request)
+
+
+def trace_query(execute, sql, params, many, context):
+    trace = _trace.get()
+    if trace is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        # Statements only: parameters may hold personal data.
+        trace.append({'sql': sql, 'many': many, 'ms': round((time.perf_counter() - started) * 1000, 3)})
+
+
+def install_tracer(connection, **kwargs):
+    if trace_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, trace_query)
+
+
+def install():
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    connection_created.connect(install_tracer, dispatch_uid='store.profiling')
+
+
+class Sampler(threading.Thread):
+    """Counts the stacks of thread ``thread_id`` until stopped."""
+
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class Profile:
+    def __init__(self, request):
+        self.request = request
+        # Sorts by creation time, which recent() and prune() rely on.
+        self.id = f'{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}-{secrets.token_hex(4)}'
+        self.sampler = Sampler(threading.get_ident())
+        self.trace = []
+
+    def start(self):
+        for connection in connections.all(initialized_only=True):
+            install_tracer(connection)
+        self.token = _trace.set(self.trace)
+        self.started = time.perf_counter()
+        self.sampler.start()
+
+    def stop(self, response):
+        self.sampler.stop()
+        self.duration = time.perf_counter() - self.started
+        _trace.reset(self.token)
+        save(self, response)
+        response['X-Profile-Id'] = self.id
+
+
+def top_functions(stacks):
+    own, total = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    return [
+        {'function': function, 'own': own[function], 'total': count}
+        for function, count in total.most_common(TOP_FUNCTIONS)
+    ]
+
+
+def save(profile, response):
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    route, action = route_name(profile.request)
+    stacks = profile.sampler.stacks
+    summary = {
+        'id': profile.id,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'method': profile.request.method,
+        'path': profile.request.path,
+        'route': route,
+        'action': action,
+        'status': response.status_code,
+        'duration_ms': round(profile.duration * 1000, 2),
+        'samples': sum(stacks.values()),
+        'sample_interval_ms': PROFILE_SAMPLE_INTERVAL * 1000,
+        'queries': len(profile.trace),
+        'db_ms': round(sum(query['ms'] for query in profile.trace), 3),
+    }
+    (PROFILE_DIR / f'{profile.id}.folded').write_text(
+        ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common()),
+    )
+    (PROFILE_DIR / f'{profile.id}.json').write_text(json.dumps({
+        **summary, 'top': top_functions(stacks), 'sql': profile.trace,
+    }))
+    prune()
+
+
+def prune():
+    for path in sorted(PROFILE_DIR.glob('*.json'), reverse=True)[PROFILE_RETENTION:]:
+        path.unlink(missing_ok=True)
+        path.with_suffix('.folded').unlink(missing_ok=True)
+
+
+def _path(profile_id, suffix):
+    # Ids are generated here; anything else cannot name a profile.
+    if not profile_id.replace('-', '').isalnum():
+        return None
+    path = PROFILE_DIR / f'{profile_id}{suffix}'
+    return path if path.is_file() else None
+
+
+def recent():
+    """Summaries of the stored profiles, newest first."""
+    if not PROFILE_DIR.is_dir():
+        return []
+    summaries = []
+    for path in sorted(PROFILE_DIR.glob('*.json'), reverse=True):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        summaries.append({key: value for key, value in data.items() if key not in ('top', 'sql')})
+    return summaries
+
+
+def load(profile_id):
+    path = _path(profile_id, '.json')
+    return json.loads(path.read_text()) if path else None
+
+
+def flamegraph(profile_id):
+    path = _path(profile_id, '.folded')
+    return path.read_text() if path else None
@@ -0,0 +1,110 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Inventory, StockReservation
+
+RESERVATION_TTL = getattr(settings, 'CART_RESERVATION_TTL', timedelta(minutes=15))
+
+
+class ReservationError(Exception):
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or [message]
+
+
+def reserved_quantities(product_ids, exclude_cart=None):
+    """Unexpired holds per product, optionally ignoring one cart's own."""
+    holds = StockReservation.objects.filter(product_id__in=product_ids, expires_at__gt=timezone.now())
+    if exclude_cart is not None:
+        holds = holds.exclude(cart=exclude_cart)
+    return dict(holds.values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total'))
+
+
+def reserve(cart, product, quantity):
+    reserve_many(cart, {product: quantity})
+
+
+def reserve_many(cart, quantities):
+    """Hold ``quantities[product]`` of each product for ``cart``, replacing
+    those lines' previous holds, and extend every hold on the cart by the TTL.
+
+    The inventory rows are locked (in product order) while the holds are
+    placed so that two carts cannot both be granted the last units. Either
+    every hold is placed or ReservationError lists every line that failed.
+    """
+    expires_at = timezone.now() + RESERVATION_TTL
+    products = {product.pk: product for product in quantities}
+    with transaction.atomic():
+        inventories = {
+            inventory.product_id: inventory
+            for inventory in Inventory.objects.select_for_update()
+            .filter(product_id__in=products)
+            .order_by('product_id')
+            .prefetch_related('shards')
+        }
+        held = reserved_quantities(list(products), exclude_cart=cart)
+        errors = []
+        for product, quantity in quantities.items():
+            inventory = inventories.get(product.pk)
+            if inventory is None:
+                errors.append(f'{product.name} has no inventory record.')
+                continue
+            available = inventory.total_stock - held.get(product.pk, 0)
+            if available < quantity:
+                errors.append(f'Not enough stock available for {product.name}. Only {max(available, 0)} items left.')
+        if errors:
+            raise ReservationError(' '.join(errors), errors)
+
+        StockReservation.objects.bulk_create(
+            [
+                StockReservation(cart=cart, product=product, quantity=quantity, expires_at=expires_at)
+                for product, quantity in quantities.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity', 'expires_at'],
+        )
+        cart.reservations.exclude(product_id__in=products).update(expires_at=expires_at)
+
+
+def remove_unreserved(inventory, quantity):
+    """Take ``quantity`` off ``inventory`` if that much is left once every
+    unexpired hold is set aside. Returns False, changing nothing, when it is
+    not.
+
+    The inventory row is locked while the holds are counted, as in
+    reserve_many(), so no cart can be granted the same units in between.
+    """
+    with transaction.atomic():
+        locked = Inventory.objects.select_for_update().get(pk=inventory.pk)
+        held = reserved_quantities([locked.product_id]).get(locked.product_id, 0)
+        if locked.total_stock - held < quantity:
+            return False
+        return inventory.remove(quantity)
+
+
+def release(cart, product_ids=None):
+    holds = cart.reservations.all()
+    if product_ids is not None:
+        holds = holds.filter(product_id__in=product_ids)
+    holds.delete()
+
+
+def release_expired(batch_size=1000):
+    """Delete expired holds in batches of ``batch_size`` rows so the sweep
+    never holds long locks on the table. Returns the number deleted."""
+    now = timezone.now()
+    deleted = 0
+    while True:
+        batch = list(
+            StockReservation.objects.filter(expires_at__lte=now)
+            .order_by('expires_at')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return deleted
+        deleted += StockReservation.objects.filter(pk__in=batch).delete()[0]
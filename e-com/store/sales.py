@@ -0,0 +1,181 @@
+"""Daily sales rollups for the analytics endpoints.
+
+``DailyProductSales`` and ``DailyCategorySales`` hold units and revenue per
+day, product or category, and order status. Checkout adds an order's lines
+under its status and status changes move them to the new one, each with
+one upsert per table in the same transaction, so reports read a row per
+day and key however many orders there are. The day is the order's
+creation date in the current time zone.
+
+``manage.py rebuild_sales_rollups`` recomputes the rows from the order
+lines, for everything or from a given day on. It is idempotent; run it
+after loading orders in bulk or after status changes made outside the API.
+
+Category rollups count each line under the category recorded on it at
+checkout, so moving a product later does not move its past sales.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import DailyCategorySales, DailyProductSales, Order, OrderItem
+
+DEFAULT_DAYS = 30
+MAX_DAYS = 366
+LINE_REVENUE = ExpressionWrapper(F('quantity') * F('price'), output_field=DecimalField())
+DEFAULT_STATUSES = [status for status, _ in Order.STATUS_CHOICES if status != 'cancelled']
+# The category a line was sold under; older lines did not record it.
+LINE_CATEGORY = Coalesce(F('category_id'), F('product__category_id'))
+
+
+def move(lines):
+    """Move sales between statuses. ``lines`` holds dicts of ``day``,
+    ``product_id``, ``category_id``, ``units`` and ``revenue`` moved from
+    status ``before`` to ``after``; None stands for an order that did not
+    exist."""
+    products = defaultdict(lambda: [0, Decimal(0)])
+    categories = defaultdict(lambda: [0, Decimal(0)])
+    for line in lines:
+        if line['before'] == line['after']:
+            continue
+        for status, sign in ((line['before'], -1), (line['after'], 1)):
+            if status is None:
+                continue
+            for totals in (products[line['day'], line['product_id'], status],
+                           categories[line['day'], line['category_id'], status]):
+                totals[0] += sign * line['units']
+                totals[1] += sign * line['revenue']
+    DailyProductSales.objects.apply(products)
+    DailyCategorySales.objects.apply(categories)
+
+
+def record(order, items, before, after):
+    """Move the lines ``items`` of ``order`` from status ``before`` to
+    ``after``. Items need ``product`` loaded."""
+    day = timezone.localdate(order.created_at)
+    move({
+        'day': day, 'product_id': item.product_id, 'category_id': item.category_id or item.product.category_id,
+        'units': item.quantity, 'revenue': item.price * item.quantity, 'before': before, 'after': after,
+    } for item in items)
+
+
+def moves(orders):
+    """The lines of ``orders``, a mapping of order id to new status, summed
+    per day, product, category and move, in one grouped query."""
+    target = Case(*[
+        When(order_id__in=[pk for pk, status in orders.items() if status == after], then=Value(after))
+        for after in set(orders.values())
+    ])
+    lines = list(
+        OrderItem.objects.filter(order_id__in=orders).order_by()
+        .values('product_id', day=TruncDate('order__created_at'), line_category=LINE_CATEGORY,
+                before=F('order__status'), after=target)
+        .annotate(units=Sum('quantity'), revenue=Sum(LINE_REVENUE))
+    )
+    for line in lines:
+        line['category_id'] = line.pop('line_category')
+    return lines
+
+
+def rebuild(since=None, batch_size=1000):
+    """Recompute the rollups from the order lines, for every day or for
+    ``since`` and later."""
+    lines = OrderItem.objects.order_by()
+    if since:
+        lines = lines.filter(order__created_at__gte=timezone.make_aware(datetime.combine(since, time.min)))
+    with transaction.atomic():
+        for model, key in ((DailyProductSales, F('product_id')), (DailyCategorySales, LINE_CATEGORY)):
+            (model.objects.filter(day__gte=since) if since else model.objects.all()).delete()
+            grouped = lines.values(
+                key=key, day=TruncDate('order__created_at'), status=F('order__status'),
+            ).annotate(units=Sum('quantity'), revenue=Sum(LINE_REVENUE))
+            model.objects.bulk_create(
+                (
+                    model(**{f'{model.rollup_key}_id': row['key']}, day=row['day'], status=row['status'],
+                          units=row['units'], revenue=row['revenue'])
+                    for row in grouped.iterator()
+                ),
+                batch_size=batch_size,
+            )
+
+
+def _day(value):
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(f'Invalid date: {value!r}')
+    return day
+
+
+def parse_range(since=None, until=None):
+    """The inclusive day range of a report from ``YYYY-MM-DD`` values; the
+    last ``DEFAULT_DAYS`` days by default."""
+    until = _day(until) if until else timezone.localdate()
+    since = _day(since) if since else until - timedelta(days=DEFAULT_DAYS - 1)
+    if since > until:
+        raise ValueError('since must not be after until')
+    if (until - since).days >= MAX_DAYS:
+        raise ValueError(f'A report covers at most {MAX_DAYS} days')
+    return since, until
+
+
+def _money(value):
+    return str(Decimal(value or 0).quantize(Decimal('0.01')))
+
+
+def _rows(model, since, until, statuses):
+    return model.objects.filter(day__range=(since, until), status__in=statuses).order_by()
+
+
+def daily(since, until, statuses):
+    """Units and revenue per day, with a row for every day in the range."""
+    totals = {
+        row['day']: row
+        for row in _rows(DailyCategorySales, since, until, statuses)
+        .values('day').annotate(units=Sum('units'), revenue=Sum('revenue'))
+    }
+    days = []
+    day = since
+    while day <= until:
+        row = totals.get(day)
+        days.append({
+            'day': day,
+            'units': row['units'] if row else 0,
+            'revenue': _money(row['revenue'] if row else 0),
+        })
+        day += timedelta(days=1)
+    return days
+
+
+def by_product(since, until, statuses, limit):
+    """The ``limit`` products with the most revenue in the range."""
+    rows = (
+        _rows(DailyProductSales, since, until, statuses)
+        .values('product_id', 'product__name')
+        .annotate(units=Sum('units'), revenue=Sum('revenue'))
+        .filter(units__gt=0)
+        .order_by('-revenue', 'product_id')[:limit]
+    )
+    return [
+        {'id': row['product_id'], 'name': row['product__name'], 'units': row['units'], 'revenue': _money(row['revenue'])}
+        for row in rows
+    ]
+
+
+def by_category(since, until, statuses):
+    rows = (
+        _rows(DailyCategorySales, since, until, statuses)
+        .values('category_id', 'category__name')
+        .annotate(units=Sum('units'), revenue=Sum('revenue'))
+        .filter(units__gt=0)
+        .order_by('-revenue', 'category_id')
+    )
+    return [
+        {'id': row['category_id'], 'name': row['category__name'], 'units': row['units'], 'revenue': _money(row['revenue'])}
+        for row in rows
+    ]
@@ -0,0 +1,89 @@
+"""Full-text product search.
+
+PostgreSQL keeps a weighted ``search_vector`` tsvector as a generated column
+on ``store_product`` with a GIN index, so the database maintains it on every
+write. SQLite (used for tests) has no tsvector, so the same text is mirrored
+into an FTS5 table keyed by product id and kept in sync by ``index_product``
+and ``unindex_product``. Both are created by migration 0005.
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+FTS_TABLE = 'store_product_fts'
+MAX_TERMS = 8
+
+_term_re = re.compile(r'\w+')
+
+
+def search_terms(query):
+    return _term_re.findall(query.lower())[:MAX_TERMS]
+
+
+def search_products(queryset, query):
+    """Filter ``queryset`` to products matching every term of ``query`` as a
+    prefix and annotate ``search_rank``, higher being more relevant.
+
+    Terms are not stemmed: a stemmed index turns "running" into "run", after
+    which the partial word "runn" typed into a search box matches nothing.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset
+
+    vendor = connections[queryset.db].vendor
+    table = Product._meta.db_table
+
+    if vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        search = SearchQuery(tsquery, search_type='raw', config='simple')
+        vector = RawSQL(f'"{table}"."search_vector"', [], output_field=SearchVectorField())
+        return queryset.alias(search_vector=vector).filter(search_vector=search).annotate(
+            search_rank=SearchRank(vector, search),
+        )
+
+    if vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        # bm25() is lower-is-better; negate it so every backend sorts DESC.
+        rank = RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id"',
+            [match], output_field=FloatField(),
+        )
+        matches = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+        return queryset.filter(id__in=matches).annotate(search_rank=rank)
+
+    condition = Q()
+    for term in terms:
+        condition &= Q(name__icontains=term) | Q(description__icontains=term)
+    return queryset.filter(condition).annotate(search_rank=RawSQL('0.0', [], output_field=FloatField()))
+
+
+def index_product(product):
+    index_products([product], using=product._state.db or 'default')
+
+
+def index_products(products, using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not products:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [[product.pk] for product in products])
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)',
+            [[product.pk, product.name, product.description] for product in products],
+        )
+
+
+def unindex_product(product_id, using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
@@ -1,59 +1,139 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import Category, Product, Inventory, Cart, CartItem, Order, OrderItem
+from .models import Category, Product, Inventory, Cart, CartItem, Order, OrderItem, ProductFacetCount
+from .models.facets import facet_cell
+from .cache import invalidate_products
+from .facets import locked_stock
+from .fulfilment import MAX_BATCH
+from .images import rendition_urls, schedule_renditions
+from .reservations import reserved_quantities
+from .search import index_product
+from .timing import TimedSerializerMixin
 
-class CategorySerializer(serializers.ModelSerializer):
+
+# Bases of every serializer below, so their time shows in Server-Timing.
+class Serializer(TimedSerializerMixin, serializers.Serializer):
+    pass
+
+class ModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    pass
+
+class CategorySerializer(ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'description', 'created_at']
 
-class InventorySerializer(serializers.ModelSerializer):
+class InventorySerializer(ModelSerializer):
     product_name = serializers.ReadOnlyField(source='product.name')
+    stock_count = serializers.IntegerField(source='total_stock', min_value=0, required=False)
     
     class Meta:
         model = Inventory
-        fields = ['id', 'product', 'product_name', 'stock_count', 'last_updated']
+        fields = ['id', 'product', 'product_name', 'stock_count', 'shard_count', 'last_updated']
+        read_only_fields = ['shard_count']
+    
+    def create(self, validated_data):
+        stock = validated_data.pop('total_stock', 0)
+        instance = Inventory.objects.create(stock_count=stock, **validated_data)
+        instance.record_stock_change(0, stock)
+        invalidate_products([instance.product])
+        return instance
     
     def update(self, instance, validated_data):
-        new_stock_count = validated_data.get('stock_count', instance.stock_count)
-        instance.stock_count = new_stock_count
-        instance.save()
-        product = instance.product
-        product.stock = new_stock_count
-        product.save()
+        if 'total_stock' in validated_data:
+            instance.set_stock(validated_data['total_stock'])
+        invalidate_products([instance.product])
         return instance
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductImagesMixin(Serializer):
+    images = serializers.SerializerMethodField()
+
+    def get_images(self, obj):
+        return rendition_urls(obj, self.context.get('request'))
+
+class ProductSerializer(ProductImagesMixin, ModelSerializer):
     category_name = serializers.ReadOnlyField(source='category.name')
+    stock = serializers.IntegerField(source='inventory.total_stock', min_value=0, required=False)
     
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price', 'category', 'category_name', 'stock', 'image', 'created_at']
+        fields = ['id', 'sku', 'name', 'description', 'price', 'category', 'category_name', 'stock', 'image', 'images', 'created_at']
     
     def create(self, validated_data):
+        stock = validated_data.pop('inventory', {}).get('total_stock', 0)
         product = Product.objects.create(**validated_data)
-        Inventory.objects.create(product=product, stock_count=product.stock)
+        Inventory.objects.create(product=product, stock_count=stock)
+        ProductFacetCount.objects.apply([(None, facet_cell(product.category_id, product.price, stock))])
+        schedule_renditions(product.image.name)
+        index_product(product)
+        invalidate_products([product])
         return product
     
     def update(self, instance, validated_data):
-        stock = validated_data.get('stock', instance.stock)
-        instance = super().update(instance, validated_data)
-        inventory, created = Inventory.objects.get_or_create(product=instance)
-        inventory.stock_count = stock
-        inventory.save()
+        inventory_data = validated_data.pop('inventory', None)
+        previous = Product(pk=instance.pk, category_id=instance.category_id)
+        with transaction.atomic():
+            # Locked so a concurrent sale cannot move the product in or out
+            # of stock between this read and the facet change below.
+            stock = locked_stock(instance)
+            before = facet_cell(instance.category_id, instance.price, stock)
+            if 'image' in validated_data:
+                instance.renditions = {}
+            instance = super().update(instance, validated_data)
+            # Move the product to its new category and price; a stock change
+            # below then moves it between the in and out of stock cells.
+            ProductFacetCount.objects.apply([(before, facet_cell(instance.category_id, instance.price, stock))])
+            if inventory_data is not None:
+                try:
+                    inventory = instance.inventory
+                except Inventory.DoesNotExist:
+                    inventory = Inventory.objects.create(product=instance, stock_count=inventory_data['total_stock'])
+                    inventory.record_stock_change(0, inventory_data['total_stock'])
+                else:
+                    inventory.set_stock(inventory_data['total_stock'])
+        if 'image' in validated_data:
+            schedule_renditions(instance.image.name)
+        index_product(instance)
+        invalidate_products([previous, instance])
         return instance
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+class ProductDetailSerializer(ProductImagesMixin, ModelSerializer):
     category = CategorySerializer(read_only=True)
     inventory = InventorySerializer(read_only=True)
+    stock = serializers.ReadOnlyField(source='inventory.total_stock')
     
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price', 'category', 'stock', 'image', 'created_at', 'inventory']
+        fields = ['id', 'sku', 'name', 'description', 'price', 'category', 'stock', 'image', 'images', 'created_at', 'inventory']
+
+class ProductImportRowSerializer(Serializer):
+    """One row of a bulk product import; ``category`` is the category name."""
+    sku = serializers.CharField(max_length=64)
+    name = serializers.CharField(max_length=255)
+    # Left out of validated_data when the row has no such column, so a
+    # re-import does not blank them (see importer.OPTIONAL_FIELDS).
+    description = serializers.CharField(allow_blank=True, required=False)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    category = serializers.CharField(max_length=255)
+    stock = serializers.IntegerField(min_value=0, required=False)
+    image = serializers.CharField(max_length=100, allow_blank=True, required=False)
 
-class StockUpdateSerializer(serializers.Serializer):
+    def to_internal_value(self, data):
+        # A blank stock cell means the row does not set the stock.
+        if isinstance(data, dict) and data.get('stock') in ('', None):
+            data = {key: value for key, value in data.items() if key != 'stock'}
+        return super().to_internal_value(data)
+
+    def validate_category(self, value):
+        category_id = self.context['categories'].get(value.strip())
+        if category_id is None:
+            raise serializers.ValidationError(f'Unknown category "{value}".')
+        return category_id
+
+class StockUpdateSerializer(Serializer):
     quantity = serializers.IntegerField(min_value=1)
 
-class PurchaseSerializer(serializers.Serializer):
+class PurchaseSerializer(Serializer):
     quantity = serializers.IntegerField(min_value=1)
     
     def validate(self, data):
@@ -61,16 +141,18 @@ class PurchaseSerializer(serializers.Serializer):
         if not product:
             raise serializers.ValidationError("Product not provided")
         try:
-            inventory = Inventory.objects.get(product=product)
-            if inventory.stock_count < data['quantity']:
-                raise serializers.ValidationError(f"Not enough stock. Available: {inventory.stock_count}")
+            inventory = product.inventory
+            # Stock held in other customers' carts is not for sale.
+            available = inventory.total_stock - reserved_quantities([product.pk]).get(product.pk, 0)
+            if available < data['quantity']:
+                raise serializers.ValidationError(f"Not enough stock. Available: {max(available, 0)}")
         except Inventory.DoesNotExist:
             raise serializers.ValidationError("Inventory not found for this product")
         return data
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(ModelSerializer):
     product = ProductSerializer(read_only=True)
-    product_id = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all(), write_only=True, source='product')
+    product_id = serializers.PrimaryKeyRelatedField(queryset=Product.objects.select_related('inventory'), write_only=True, source='product')
     subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     
     class Meta:
@@ -81,14 +163,30 @@ class CartItemSerializer(serializers.ModelSerializer):
         product = data['product']
         quantity = data['quantity']
         try:
-            inventory = Inventory.objects.get(product=product)
-            if inventory.stock_count < quantity:
-                raise serializers.ValidationError(f"Not enough stock available. Only {inventory.stock_count} items left.")
+            inventory = product.inventory
+            if inventory.total_stock < quantity:
+                raise serializers.ValidationError(f"Not enough stock available. Only {inventory.total_stock} items left.")
         except Inventory.DoesNotExist:
             raise serializers.ValidationError("Product has no inventory record.")
         return data
 
-class CartSerializer(serializers.ModelSerializer):
+class CartOperationSerializer(Serializer):
+    MODES = ('add', 'set', 'remove')
+
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, default=0)
+    mode = serializers.ChoiceField(choices=MODES, default='set')
+
+class CartBatchSerializer(Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=200)
+
+    def to_internal_value(self, data):
+        # A bare list of operations is accepted as well.
+        if isinstance(data, list):
+            data = {'operations': data}
+        return super().to_internal_value(data)
+
+class CartSerializer(ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     total_items = serializers.IntegerField(read_only=True)
@@ -98,7 +196,7 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'items', 'total_price', 'total_items', 'created_at', 'updated_at']
         read_only_fields = ['user']
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(ModelSerializer):
     product_name = serializers.ReadOnlyField(source='product.name')
     subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     
@@ -106,7 +204,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         fields = ['id', 'product', 'product_name', 'quantity', 'price', 'subtotal']
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
     
     class Meta:
@@ -114,7 +212,35 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'full_name', 'email', 'address', 'phone', 'total', 'status', 'items', 'created_at', 'updated_at']
         read_only_fields = ['user', 'total', 'status']
 
-class CheckoutSerializer(serializers.Serializer):
+class OrderSummarySerializer(ModelSerializer):
+    """Order list entry; expects ``Order.objects.with_summary()``."""
+    item_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'full_name', 'total', 'status', 'item_count', 'created_at', 'updated_at']
+        read_only_fields = fields
+
+class OrderTransitionSerializer(Serializer):
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=list(Order.TRANSITIONS))
+
+class BulkOrderTransitionSerializer(Serializer):
+    transitions = OrderTransitionSerializer(many=True, allow_empty=False, max_length=MAX_BATCH)
+
+    def to_internal_value(self, data):
+        # A bare list of transitions is accepted as well.
+        if isinstance(data, list):
+            data = {'transitions': data}
+        return super().to_internal_value(data)
+
+    def validate_transitions(self, transitions):
+        ids = [transition['id'] for transition in transitions]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError('Each order may only appear once.')
+        return transitions
+
+class CheckoutSerializer(Serializer):
     full_name = serializers.CharField(max_length=100)
     email = serializers.EmailField()
     address = serializers.CharField()
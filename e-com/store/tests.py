@@ -1,3 +1,1524 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import re
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import facets, metrics, profiling, sales, timing
+from .cache import get_versions, invalidate_products
+from .checkout import CheckoutError, EmptyCart, InsufficientStock, place_order
+from .facets import in_stock_filter
+from .images import RENDITION_SIZES, generate_renditions
+from .importer import ProductImporter, read_rows
+from .models import (
+    Cart, CartItem, Category, DailyCategorySales, DailyProductSales, Inventory, Order, OrderItem, Product,
+    ProductFacetCount, StockReservation,
+)
+from .reservations import ReservationError, release_expired, reserve, reserve_many, reserved_quantities
+from .search import index_products
+from .serializers import CategorySerializer, ProductSerializer
+from .urls import router
+from users.models import CustomUser
+
+QUERY_BUDGETS = json.loads(Path(__file__).with_name('query_budgets.json').read_text())
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN the catalog and order queries that must stay on an index.
+
+    Runs against the configured database: SQLite locally, PostgreSQL when
+    that is what the settings point at. The tables are small and not
+    analyzed, and on PostgreSQL sequential scans are switched off for the
+    test, so the plans show whether a usable index exists rather than what
+    the planner would pick for production data.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        user = CustomUser.objects.create_user('plans@example.com', 'pw')
+        categories = Category.objects.bulk_create([Category(name=f'category {i}', description='') for i in range(5)])
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'product {i}', description='', price=Decimal(i % 300), category=categories[i % 5],
+                image='products/plan.jpg',
+            )
+            for i in range(300)
+        ])
+        Inventory.objects.bulk_create([Inventory(product=product, stock_count=i % 3) for i, product in enumerate(products)])
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product) for product in products[:20]])
+        order = Order.objects.create(
+            user=user, full_name='a', email='plans@example.com', address='a', phone='1', total=Decimal('1.00'),
+        )
+        OrderItem.objects.bulk_create([OrderItem(order=order, product=product, price=product.price) for product in products[:20]])
+        cls.user = user
+        cls.category = categories[0]
+        cls.product = products[0]
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def assertNoFullScan(self, queryset, table):
+        plan = self.explain(queryset)
+        if connection.vendor == 'postgresql':
+            full_scan = re.search(rf'Seq Scan on {table}\b', plan)
+        else:
+            full_scan = re.search(rf'\bSCAN {table}\b(?! USING)', plan)
+        self.assertIsNone(full_scan, f'Full scan of {table}:\n{plan}')
+        return plan
+
+    def assertUsesIndex(self, queryset, table, index):
+        plan = self.assertNoFullScan(queryset, table)
+        self.assertIn(index, plan, f'{index} not used:\n{plan}')
+
+    def test_product_category_price_range(self):
+        queryset = Product.objects.filter(category=self.category, price__gte=10, price__lte=50)
+        self.assertUsesIndex(queryset.values('id'), 'store_product', 'product_category_price_idx')
+
+    def test_product_price_range(self):
+        self.assertUsesIndex(Product.objects.filter(price__gte=10, price__lte=50).values('id'), 'store_product', 'product_price_idx')
+
+    def test_product_list_page(self):
+        queryset = Product.objects.order_by('-created_at', '-id')[:51]
+        self.assertUsesIndex(queryset, 'store_product', 'product_created_idx')
+        queryset = Product.objects.filter(category=self.category).order_by('-created_at', '-id')[:51]
+        self.assertNoFullScan(queryset, 'store_product')
+
+    def test_in_stock_inventory(self):
+        queryset = Inventory.objects.filter(stock_count__gt=0).values('product_id')
+        self.assertUsesIndex(queryset, 'store_inventory', 'inventory_in_stock_idx')
+        self.assertNoFullScan(Product.objects.filter(category=self.category).filter(in_stock_filter()), 'store_inventory')
+
+    def test_order_history(self):
+        queryset = Order.objects.filter(user=self.user).order_by('-created_at', '-id')[:51]
+        self.assertUsesIndex(queryset, 'store_order', 'order_user_created_idx')
+
+    def test_order_export_range(self):
+        since = timezone.now() - timedelta(days=1)
+        self.assertUsesIndex(Order.objects.filter(created_at__gte=since).values('id'), 'store_order', 'order_created_idx')
+
+    def test_lines_by_product(self):
+        self.assertNoFullScan(CartItem.objects.filter(product=self.product), 'store_cartitem')
+        self.assertNoFullScan(OrderItem.objects.filter(product=self.product), 'store_orderitem')
+
+    def test_active_reservations(self):
+        queryset = StockReservation.objects.filter(product_id__in=[self.product.pk], expires_at__gt=timezone.now())
+        self.assertUsesIndex(queryset, 'store_stockreservation', 'reservation_product_exp_idx')
+
+
+def image_upload(name='product.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8), 'white').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+def routes():
+    """``'<url name> <METHOD>'`` for every route and action of the API router."""
+    keys = set()
+    for pattern in router.urls:
+        actions = getattr(pattern.callback, 'actions', None)
+        if actions:
+            # HEAD runs the GET handler.
+            keys.update(f'{pattern.name} {method.upper()}' for method in actions if method != 'head')
+    return keys
+
+
+# Per route: the URL kwargs and request body for a data set from seed().
+REQUESTS = {
+    'category-list GET': lambda data: ({}, None),
+    'category-list POST': lambda data: ({}, {'name': 'new category', 'description': ''}),
+    'category-detail GET': lambda data: ({'pk': data.category.pk}, None),
+    'category-detail PUT': lambda data: ({'pk': data.category.pk}, {'name': 'renamed', 'description': ''}),
+    'category-detail PATCH': lambda data: ({'pk': data.category.pk}, {'name': 'renamed'}),
+    'category-detail DELETE': lambda data: ({'pk': data.category.pk}, None),
+    'product-list GET': lambda data: ({}, None),
+    'product-list POST': lambda data: ({}, {
+        'name': 'new product', 'description': 'new', 'price': '9.99', 'category': data.category.pk, 'stock': 5,
+        'image': image_upload(),
+    }),
+    'product-facets GET': lambda data: ({}, {'min_price': 1}),
+    # One price and stock, so every row lands in the same facet cell.
+    'product-bulk-import POST': lambda data: ({}, {'file': SimpleUploadedFile('products.csv', ''.join(
+        ['sku,name,description,price,category,stock\n']
+        + [f'IMPORT-{i},imported {i},,5.00,{data.category.name},3\n' for i in range(data.rows)]
+    ).encode(), content_type='text/csv')}),
+    'product-detail GET': lambda data: ({'pk': data.product.pk}, None),
+    'product-detail PUT': lambda data: ({'pk': data.product.pk}, {
+        'name': 'renamed', 'description': 'renamed', 'price': '19.99', 'category': data.category.pk, 'stock': 7,
+        'image': image_upload(),
+    }),
+    'product-detail PATCH': lambda data: ({'pk': data.product.pk}, {'price': '19.99', 'stock': 0}),
+    'product-detail DELETE': lambda data: ({'pk': data.product.pk}, None),
+    'product-purchase POST': lambda data: ({'pk': data.product.pk}, {'quantity': 1}),
+    'inventory-list GET': lambda data: ({}, None),
+    'inventory-list POST': lambda data: ({}, {'product': data.unstocked.pk, 'stock_count': 3}),
+    'inventory-detail GET': lambda data: ({'pk': data.inventory.pk}, None),
+    'inventory-detail PUT': lambda data: ({'pk': data.inventory.pk}, {'product': data.product.pk, 'stock_count': 0}),
+    'inventory-detail PATCH': lambda data: ({'pk': data.inventory.pk}, {'stock_count': 0}),
+    'inventory-detail DELETE': lambda data: ({'pk': data.inventory.pk}, None),
+    'inventory-add-stock POST': lambda data: ({'pk': data.inventory.pk}, {'quantity': 1}),
+    'inventory-remove-stock POST': lambda data: ({'pk': data.inventory.pk}, {'quantity': 1}),
+    'cart-list GET': lambda data: ({}, None),
+    'cart-add-item POST': lambda data: ({}, {'product_id': data.unlisted.pk, 'quantity': 1}),
+    'cart-update-item POST': lambda data: ({}, {'product_id': data.product.pk, 'quantity': 2}),
+    'cart-batch POST': lambda data: ({}, {'operations': [
+        {'product_id': product.pk, 'quantity': 2, 'mode': 'set'} for product in data.products
+    ]}),
+    'cart-checkout POST': lambda data: ({}, {
+        'full_name': 'Budget', 'email': 'budget@example.com', 'address': 'a', 'phone': '1',
+    }),
+    'orders-list GET': lambda data: ({}, None),
+    'orders-export GET': lambda data: ({}, None),
+    'orders-detail GET': lambda data: ({'pk': data.order.pk}, None),
+    'orders-cancel POST': lambda data: ({'pk': data.order.pk}, None),
+    # Half of the orders ship (after processing), the other half are cancelled.
+    'orders-bulk-transition POST': lambda data: ({}, {'transitions': [
+        {'id': order.pk, 'status': 'shipped' if i % 2 else 'cancelled'} for i, order in enumerate(data.orders)
+    ]}),
+    'analytics-daily GET': lambda data: ({}, None),
+    'analytics-products GET': lambda data: ({}, {'limit': 100}),
+    'analytics-categories GET': lambda data: ({}, None),
+    'profiles-list GET': lambda data: ({}, None),
+    'profiles-detail GET': lambda data: ({'pk': STORED_PROFILE}, None),
+    'profiles-flamegraph GET': lambda data: ({'pk': STORED_PROFILE}, None),
+}
+STORED_PROFILE = '20260101T000000000000-0000abcd'
+
+
+class DataSet:
+    """``rows`` products (with inventory) in one category, a cart holding
+    all of them, ``rows`` orders (every other one processing) and an order
+    of ``rows`` lines, plus ``rows`` other categories. The sales rollups cover the orders."""
+
+    def __init__(self, user, rows):
+        self.rows = rows
+        categories = Category.objects.bulk_create([Category(name=f'category {i}', description='') for i in range(rows + 1)])
+        self.category = categories[0]
+        products = Product.objects.bulk_create([
+            Product(name=f'product {i}', description='', price=Decimal(i + 1), category=self.category, image='products/budget.jpg')
+            for i in range(rows + 2)
+        ])
+        *self.products, self.unlisted, self.unstocked = products
+        self.product = self.products[0]
+        inventories = Inventory.objects.bulk_create([Inventory(product=product, stock_count=100) for product in products[:-1]])
+        self.inventory = inventories[0]
+        cart, _ = Cart.objects.get_or_create(user=user)
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product) for product in self.products])
+        orders = Order.objects.bulk_create([
+            Order(user=user, full_name='a', email='budget@example.com', address='a', phone='1', total=Decimal(rows))
+            for _ in range(rows)
+        ])
+        self.order = orders[0]
+        Order.objects.filter(pk__in=[order.pk for order in orders[1::2]]).update(status='processing')
+        self.orders = orders
+        OrderItem.objects.bulk_create(
+            [OrderItem(order=self.order, product=product, price=product.price) for product in self.products]
+            + [OrderItem(order=order, product=self.product, price=self.product.price) for order in orders[1:]]
+        )
+        sales.rebuild()
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class QueryBudgetTests(TestCase):
+    """Every API route must run in a number of queries that does not grow
+    with the data: each is called against ``rows`` and ``10 * rows`` rows of
+    everything it reads or writes, and neither count may exceed its entry
+    in ``query_budgets.json``. The response cache is off so cached routes
+    are measured on a miss."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+        cls.enterClassContext(mock.patch.object(timing.logger, 'disabled', True))
+        profile_dir = Path(cls.media_root) / 'profiles'
+        cls.enterClassContext(mock.patch.object(profiling, 'PROFILE_DIR', profile_dir))
+        profile_dir.mkdir()
+        (profile_dir / f'{STORED_PROFILE}.json').write_text(json.dumps({'id': STORED_PROFILE, 'top': [], 'sql': []}))
+        (profile_dir / f'{STORED_PROFILE}.folded').write_text('main;handler 3\n')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_superuser('budget@example.com', 'pw')
+
+    def count_queries(self, key, rows):
+        name, method = key.split()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with transaction.atomic():
+            kwargs, data = REQUESTS[key](DataSet(self.user, rows))
+            send = getattr(client, method.lower())
+            multipart = isinstance(data, dict) and any(isinstance(value, SimpleUploadedFile) for value in data.values())
+            with CaptureQueriesContext(connection) as queries:
+                if method == 'GET':
+                    response = send(reverse(f'api:{name}', kwargs=kwargs), data)
+                else:
+                    response = send(reverse(f'api:{name}', kwargs=kwargs), data, format='multipart' if multipart else 'json')
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 400, f'{key}: {getattr(response, "data", response)}')
+            transaction.set_rollback(True)
+        return len(queries)
+
+    def test_every_route_has_a_budget(self):
+        self.assertEqual(routes() - QUERY_BUDGETS['budgets'].keys(), set())
+        self.assertEqual(QUERY_BUDGETS['budgets'].keys() - routes(), set())
+
+    def test_query_budgets(self):
+        rows = QUERY_BUDGETS['rows']
+        for key, budget in sorted(QUERY_BUDGETS['budgets'].items()):
+            with self.subTest(key):
+                small, large = self.count_queries(key, rows), self.count_queries(key, rows * 10)
+                self.assertEqual(large, small, f'{key} grows with the data: {small} -> {large} queries')
+                self.assertLessEqual(small, budget, f'{key} is over budget: {small} > {budget} queries')
+
+
+@mock.patch.object(timing, 'SAMPLE_RATE', 1.0)
+class ServerTimingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Category.objects.create(name='timed', description='')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_header_and_log_line(self):
+        with self.assertLogs('store.timing') as logs, CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/categories/')
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['route'], 'category-list')
+        self.assertEqual(entry['action'], 'list')
+        self.assertEqual(entry['db_queries'], len(queries))
+        self.assertRegex(response['Server-Timing'], rf'db;dur=[0-9.]+;desc="{len(queries)} queries"')
+        self.assertIn('route;desc="category-list"', response['Server-Timing'])
+
+    def test_cache_hits_and_misses(self):
+        with self.assertLogs('store.timing') as logs:
+            self.client.get('/api/categories/')
+            self.client.get('/api/categories/')
+        miss, hit = (json.loads(record.getMessage()) for record in logs.records)
+        self.assertEqual((miss['cache_hits'], miss['cache_misses']), (0, 1))
+        self.assertEqual((hit['cache_hits'], hit['cache_misses']), (1, 0))
+        self.assertEqual(hit['db_queries'], 0)
+
+    def test_serializer_time(self):
+        Category.objects.create(name='also timed', description='')
+        token = timing.start()
+        with mock.patch('rest_framework.serializers.ModelSerializer.to_representation', side_effect=lambda item: time.sleep(0.01) or {}):
+            CategorySerializer(Category.objects.all(), many=True).data
+        measured = timing.stop(token)
+        self.assertGreaterEqual(measured.serializer, 0.02)
+        self.assertLess(measured.serializer, measured.total)
+
+    def test_unsampled(self):
+        with mock.patch.object(timing, 'SAMPLE_RATE', 0), self.assertNoLogs('store.timing'):
+            response = self.client.get('/api/categories/')
+        self.assertNotIn('Server-Timing', response)
+
+
+def metric_value(text, sample):
+    for line in text.splitlines():
+        if line.startswith(sample + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0.0
+
+
+@mock.patch.object(timing.logger, 'disabled', True)
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_superuser('metrics@example.com', 'pw')
+        category = Category.objects.create(name='metered', description='')
+        cls.product = Product.objects.create(name='metered', description='', price=Decimal('5.00'), category=category, image='products/metered.jpg')
+        cls.inventory = Inventory.objects.create(product=cls.product, stock_count=10)
+        Order.objects.create(user=cls.staff, full_name='a', email='metrics@example.com', address='a', phone='1', total=Decimal('1.00'))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        self.client.force_login(self.staff)
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        return response.content.decode()
+
+    def test_operation_counters(self):
+        before = self.scrape()
+        self.client.post(f'/api/products/{self.product.pk}/purchase/', {'quantity': 1}, format='json')
+        self.client.post(f'/api/products/{self.product.pk}/purchase/', {'quantity': 1000}, format='json')
+        self.client.post(f'/api/inventory/{self.inventory.pk}/add_stock/', {'quantity': 4}, format='json')
+        self.client.post('/api/cart/checkout/', {
+            'full_name': 'a', 'email': 'metrics@example.com', 'address': 'a', 'phone': '1',
+        }, format='json')
+        after = self.scrape()
+        for sample, delta in [
+            ('store_purchases_total{result="success"}', 1),
+            ('store_purchases_total{result="rejected"}', 1),
+            ('store_stock_adjustments_total{direction="add",result="success"}', 1),
+            ('store_stock_adjusted_units_total{direction="add"}', 4),
+            ('store_checkouts_total{result="failed"}', 1),
+            ('store_request_duration_seconds_count{route="product-purchase",method="POST",status="2xx"}', 1),
+            ('store_request_duration_seconds_count{route="product-purchase",method="POST",status="4xx"}', 1),
+        ]:
+            self.assertEqual(metric_value(after, sample) - metric_value(before, sample), delta, sample)
+
+    def test_gauges(self):
+        Inventory.objects.filter(pk=self.inventory.pk).update(stock_count=metrics.LOW_STOCK_THRESHOLD - 1)
+        text = self.scrape()
+        self.assertEqual(metric_value(text, 'store_low_stock_skus'), 1)
+        self.assertEqual(metric_value(text, 'store_open_orders{status="pending"}'), 1)
+        self.assertEqual(metric_value(text, 'store_open_orders{status="processing"}'), 0)
+
+    def test_gauges_are_cached(self):
+        self.assertEqual(metric_value(metrics.registry.exposition(), 'store_low_stock_skus'), 0)
+        Inventory.objects.filter(pk=self.inventory.pk).update(stock_count=0)
+        with self.assertNumQueries(0):
+            text = metrics.registry.exposition()
+        self.assertEqual(metric_value(text, 'store_low_stock_skus'), 0)
+        cache.clear()
+        self.assertEqual(metric_value(metrics.registry.exposition(), 'store_low_stock_skus'), 1)
+
+    def test_staff_only(self):
+        customer = CustomUser.objects.create_user('metrics-customer@example.com', 'pw')
+        client = APIClient()
+        self.assertEqual(client.get('/metrics').status_code, 403)
+        client.force_login(customer)
+        self.assertEqual(client.get('/metrics').status_code, 403)
+        with mock.patch.object(metrics, 'METRICS_PUBLIC', True):
+            self.assertEqual(APIClient().get('/metrics').status_code, 200)
+
+    def test_token(self):
+        with mock.patch.object(metrics, 'METRICS_TOKEN', 'secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_processes_are_added_up(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        workers = []
+        for observed in (0.003, 0.3):
+            with mock.patch('os.getpid', return_value=len(workers) + 1):
+                registry = metrics.Registry(directory, flush_interval=60)
+            registry.counter('jobs_total', 'Jobs.', ['kind']).inc(kind='a')
+            registry.histogram('job_seconds', 'Job time.', buckets=(0.01, 1)).observe(observed)
+            registry.flush()
+            workers.append(registry)
+        text = workers[0].exposition()
+        self.assertEqual(metric_value(text, 'jobs_total{kind="a"}'), 2)
+        self.assertEqual(metric_value(text, 'job_seconds_bucket{le="0.01"}'), 1)
+        self.assertEqual(metric_value(text, 'job_seconds_bucket{le="1.0"}'), 2)
+        self.assertEqual(metric_value(text, 'job_seconds_bucket{le="+Inf"}'), 2)
+        self.assertEqual(metric_value(text, 'job_seconds_count'), 2)
+
+
+@mock.patch.object(timing.logger, 'disabled', True)
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_superuser('profiler@example.com', 'pw')
+        cls.shopper = CustomUser.objects.create_user('profiled@example.com', 'pw')
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        patcher = mock.patch.object(profiling, 'PROFILE_DIR', Path(directory))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def bearer(self, user):
+        return f'bearer {AccessToken.for_user(user)}'
+
+    def test_signed_header(self):
+        response = self.client.get(
+            '/api/cart/', HTTP_AUTHORIZATION=self.bearer(self.shopper), HTTP_X_PROFILE_TOKEN=profiling.make_token('/api/cart/'),
+        )
+        profile = profiling.load(response['X-Profile-Id'])
+        self.assertEqual((profile['route'], profile['action'], profile['status']), ('cart-list', 'list', 200))
+        self.assertEqual(profile['queries'], len(profile['sql']))
+        self.assertTrue(any('store_cart' in query['sql'] for query in profile['sql']))
+        self.assertIsNotNone(profiling.flamegraph(profile['id']))
+
+    def test_token_is_checked(self):
+        for token in [profiling.make_token('/api/orders/'), profiling.make_token('/api/cart/') + 'x']:
+            response = self.client.get('/api/cart/', HTTP_AUTHORIZATION=self.bearer(self.shopper), HTTP_X_PROFILE_TOKEN=token)
+            self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(profiling.recent(), [])
+
+    def test_query_flag_is_staff_only(self):
+        response = self.client.get('/api/cart/?profile=1', HTTP_AUTHORIZATION=self.bearer(self.shopper))
+        self.assertNotIn('X-Profile-Id', response)
+        response = self.client.get('/api/cart/?profile=1', HTTP_AUTHORIZATION=self.bearer(self.staff))
+        self.assertIn('X-Profile-Id', response)
+
+    def test_listing(self):
+        token = profiling.make_token()
+        with mock.patch.object(profiling, 'PROFILE_RETENTION', 2):
+            ids = [self.client.get('/api/categories/', HTTP_X_PROFILE_TOKEN=token)['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(self.client.get('/api/profiles/', HTTP_AUTHORIZATION=self.bearer(self.shopper)).status_code, 403)
+        response = self.client.get('/api/profiles/', HTTP_AUTHORIZATION=self.bearer(self.staff))
+        self.assertEqual([profile['id'] for profile in response.json()], sorted(ids, reverse=True)[:2])
+        response = self.client.get(f'/api/profiles/{ids[-1]}/flamegraph/', HTTP_AUTHORIZATION=self.bearer(self.staff))
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertEqual(self.client.get('/api/profiles/nope/', HTTP_AUTHORIZATION=self.bearer(self.staff)).status_code, 404)
+
+
+class SalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_superuser('analyst@example.com', 'pw')
+        cls.shopper = CustomUser.objects.create_user('rolled@example.com', 'pw')
+        cls.books, cls.games = Category.objects.bulk_create([
+            Category(name='books', description=''), Category(name='games', description=''),
+        ])
+        cls.novel, cls.atlas, cls.chess = Product.objects.bulk_create([
+            Product(name='novel', description='', price=Decimal('10.00'), category=cls.books, image='products/novel.jpg'),
+            Product(name='atlas', description='', price=Decimal('25.50'), category=cls.books, image='products/atlas.jpg'),
+            Product(name='chess', description='', price=Decimal('40.00'), category=cls.games, image='products/chess.jpg'),
+        ])
+        Inventory.objects.bulk_create([
+            Inventory(product=product, stock_count=50) for product in (cls.novel, cls.atlas, cls.chess)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def checkout(self, *lines):
+        cart, _ = Cart.objects.get_or_create(user=self.shopper)
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=quantity) for product, quantity in lines])
+        self.client.force_authenticate(self.shopper)
+        response = self.client.post('/api/cart/checkout/', {
+            'full_name': 'a', 'email': 'rolled@example.com', 'address': 'a', 'phone': '1',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def rollups(self):
+        return (
+            sorted(DailyProductSales.objects.filter(units__gt=0).values_list('day', 'product_id', 'status', 'units', 'revenue')),
+            sorted(DailyCategorySales.objects.filter(units__gt=0).values_list('day', 'category_id', 'status', 'units', 'revenue')),
+        )
+
+    def test_checkout_and_cancel_update_rollups(self):
+        today = timezone.localdate()
+        self.checkout((self.novel, 2), (self.chess, 1))
+        order = self.checkout((self.novel, 1), (self.atlas, 2))
+        self.assertEqual(self.rollups()[1], [
+            (today, self.books.pk, 'pending', 5, Decimal('81.00')),
+            (today, self.games.pk, 'pending', 1, Decimal('40.00')),
+        ])
+        self.client.post(f'/api/orders/{order}/cancel/')
+        products, categories = self.rollups()
+        self.assertIn((today, self.atlas.pk, 'cancelled', 2, Decimal('51.00')), products)
+        self.assertIn((today, self.novel.pk, 'pending', 2, Decimal('20.00')), products)
+        self.assertIn((today, self.books.pk, 'cancelled', 3, Decimal('61.00')), categories)
+        # The maintained rows match a recount from the order lines.
+        maintained = self.rollups()
+        sales.rebuild()
+        self.assertEqual(self.rollups(), maintained)
+
+    def test_cancel_after_a_category_change(self):
+        today = timezone.localdate()
+        order = self.checkout((self.chess, 2))
+        Product.objects.filter(pk=self.chess.pk).update(category=self.books)
+        self.client.post(f'/api/orders/{order}/cancel/')
+        self.assertEqual(self.rollups()[1], [(today, self.games.pk, 'cancelled', 2, Decimal('80.00'))])
+        self.assertEqual(DailyCategorySales.objects.get(category=self.games, status='pending').units, 0)
+        self.assertFalse(DailyCategorySales.objects.filter(category=self.books).exclude(units=0).exists())
+        maintained = self.rollups()
+        sales.rebuild()
+        self.assertEqual(self.rollups(), maintained)
+
+    def test_rebuild_since_keeps_earlier_days(self):
+        self.checkout((self.novel, 1))
+        yesterday = timezone.localdate() - timedelta(days=1)
+        DailyProductSales.objects.create(day=yesterday, product=self.atlas, status='delivered', units=3, revenue=Decimal('76.50'))
+        DailyProductSales.objects.filter(day=timezone.localdate()).update(units=99)
+        sales.rebuild(since=timezone.localdate())
+        self.assertEqual(sorted(DailyProductSales.objects.values_list('day', 'product_id', 'units')), [
+            (yesterday, self.atlas.pk, 3), (timezone.localdate(), self.novel.pk, 1),
+        ])
+
+    def test_reports(self):
+        self.checkout((self.novel, 2), (self.chess, 1))
+        order = self.checkout((self.atlas, 1))
+        self.client.post(f'/api/orders/{order}/cancel/')
+        today = timezone.localdate()
+        self.client.force_authenticate(self.staff)
+
+        response = self.client.get('/api/analytics/daily/')
+        self.assertEqual(len(response.data['days']), sales.DEFAULT_DAYS)
+        self.assertEqual(response.data['days'][-1], {'day': today, 'units': 3, 'revenue': '60.00'})
+        self.assertEqual(response.data['days'][0]['units'], 0)
+
+        response = self.client.get('/api/analytics/products/', {'limit': 1})
+        self.assertEqual(response.data['products'], [{'id': self.chess.pk, 'name': 'chess', 'units': 1, 'revenue': '40.00'}])
+        response = self.client.get('/api/analytics/categories/', {'status': 'cancelled', 'since': str(today), 'until': str(today)})
+        self.assertEqual(response.data['categories'], [{'id': self.books.pk, 'name': 'books', 'units': 1, 'revenue': '25.50'}])
+
+    def test_report_access_and_filters(self):
+        self.client.force_authenticate(self.shopper)
+        self.assertEqual(self.client.get('/api/analytics/daily/').status_code, 403)
+        self.client.force_authenticate(self.staff)
+        for params in [{'since': 'yesterday'}, {'since': '2026-02-01', 'until': '2026-01-01'},
+                       {'since': '2020-01-01', 'until': '2026-01-01'}, {'status': 'lost'}]:
+            self.assertEqual(self.client.get('/api/analytics/daily/', params).status_code, 400, params)
+
+
+class FulfilmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_superuser('warehouse@example.com', 'pw')
+        cls.shopper = CustomUser.objects.create_user('waiting@example.com', 'pw')
+        category = Category.objects.create(name='parcels', description='')
+        cls.box, cls.crate = Product.objects.bulk_create([
+            Product(name='box', description='', price=Decimal('4.00'), category=category, image='products/box.jpg'),
+            Product(name='crate', description='', price=Decimal('9.00'), category=category, image='products/crate.jpg'),
+        ])
+        Inventory.objects.bulk_create([Inventory(product=cls.box, stock_count=10), Inventory(product=cls.crate, stock_count=10)])
+
+    def setUp(self):
+        self.orders = Order.objects.bulk_create([
+            Order(user=self.shopper, full_name='a', email='waiting@example.com', address='a', phone='1', total=Decimal('1.00'),
+                  status=status)
+            for status in ['pending', 'pending', 'processing', 'shipped', 'delivered']
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=2, price=product.price)
+            for order in self.orders for product in (self.box, self.crate)
+        ])
+        sales.rebuild()
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def statuses(self):
+        return list(Order.objects.filter(pk__in=[order.pk for order in self.orders]).order_by('pk').values_list('status', flat=True))
+
+    def test_bulk_transition(self):
+        pending, other_pending, processing, shipped, delivered = [order.pk for order in self.orders]
+        response = self.client.post('/api/orders/transition/', {'transitions': [
+            {'id': pending, 'status': 'processing'},
+            {'id': other_pending, 'status': 'cancelled'},
+            {'id': processing, 'status': 'cancelled'},
+            {'id': shipped, 'status': 'delivered'},
+            {'id': delivered, 'status': 'cancelled'},
+            {'id': 0, 'status': 'shipped'},
+        ]}, format='json')
+        self.assertEqual(response.data, {
+            'updated': sorted([pending, other_pending, processing, shipped]), 'rejected': [0, delivered],
+        })
+        self.assertEqual(self.statuses(), ['processing', 'cancelled', 'cancelled', 'delivered', 'delivered'])
+        # Two cancelled orders of two units per product go back in stock.
+        self.assertEqual(sorted(Inventory.objects.values_list('stock_count', flat=True)), [14, 14])
+        maintained = sorted(DailyProductSales.objects.filter(units__gt=0).values_list('product_id', 'status', 'units'))
+        sales.rebuild()
+        self.assertEqual(sorted(DailyProductSales.objects.filter(units__gt=0).values_list('product_id', 'status', 'units')), maintained)
+
+    def test_rejections_are_not_applied(self):
+        shipped = self.orders[3].pk
+        response = self.client.post('/api/orders/transition/', [{'id': shipped, 'status': 'processing'}], format='json')
+        self.assertEqual(response.data, {'updated': [], 'rejected': [shipped]})
+        self.assertEqual(self.statuses()[3], 'shipped')
+
+    def test_invalid_batches(self):
+        for transitions in [[], [{'id': 1, 'status': 'pending'}], [{'id': 1, 'status': 'shipped'}, {'id': 1, 'status': 'delivered'}]]:
+            response = self.client.post('/api/orders/transition/', {'transitions': transitions}, format='json')
+            self.assertEqual(response.status_code, 400, transitions)
+        self.client.force_authenticate(self.shopper)
+        response = self.client.post('/api/orders/transition/', [{'id': self.orders[0].pk, 'status': 'processing'}], format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_admin_action(self):
+        self.client.force_login(self.staff)
+        response = self.client.post(reverse('admin:store_order_changelist'), {
+            'action': 'mark_shipped', '_selected_action': [order.pk for order in self.orders[1:3]],
+        }, follow=True)
+        self.assertEqual(self.statuses()[1:3], ['pending', 'shipped'])
+        self.assertContains(response, f'cannot be marked shipped: {self.orders[1].pk}')
+
+
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shopper = CustomUser.objects.create_user('checkout@example.com', 'pw')
+        category = Category.objects.create(name='checked out', description='')
+        cls.pen, cls.ink = Product.objects.bulk_create([
+            Product(name='pen', description='', price=Decimal('2.00'), category=category, image='products/pen.jpg'),
+            Product(name='ink', description='', price=Decimal('3.50'), category=category, image='products/ink.jpg'),
+        ])
+        Inventory.objects.bulk_create([Inventory(product=cls.pen, stock_count=5), Inventory(product=cls.ink, stock_count=5)])
+
+    def setUp(self):
+        self.cart = Cart.objects.create(user=self.shopper)
+
+    def fill(self, *lines):
+        CartItem.objects.bulk_create([CartItem(cart=self.cart, product=product, quantity=quantity) for product, quantity in lines])
+
+    def place(self):
+        return place_order(self.cart, self.shopper, {
+            'full_name': 'a', 'email': 'checkout@example.com', 'address': 'a', 'phone': '1',
+        })
+
+    def stock(self):
+        return dict(Inventory.objects.values_list('product__name', 'stock_count'))
+
+    def test_stock_is_taken_once(self):
+        self.fill((self.pen, 2), (self.ink, 5))
+        order = self.place()
+        self.assertEqual(order.total, Decimal('21.50'))
+        self.assertEqual(sorted(order.items.values_list('product__name', 'quantity')), [('ink', 5), ('pen', 2)])
+        self.assertEqual(self.stock(), {'pen': 3, 'ink': 0})
+        self.assertFalse(self.cart.items.exists())
+        with self.assertRaises(EmptyCart):
+            self.place()
+        self.assertEqual(self.stock(), {'pen': 3, 'ink': 0})
+
+    def test_overselling_is_rejected(self):
+        self.fill((self.pen, 6))
+        with self.assertRaises(InsufficientStock):
+            self.place()
+        self.assertEqual(self.stock(), {'pen': 5, 'ink': 5})
+
+    def test_other_carts_holds_are_not_sold(self):
+        other = Cart.objects.create(user=CustomUser.objects.create_user('holder@example.com', 'pw'))
+        reserve(other, self.pen, 4)
+        self.fill((self.pen, 2))
+        with self.assertRaises(InsufficientStock):
+            self.place()
+        self.cart.items.update(quantity=1)
+        self.place()
+        self.assertEqual(self.stock()['pen'], 4)
+
+    def test_failed_line_rolls_back_the_order(self):
+        self.fill((self.pen, 2), (self.ink, 6))
+        with self.assertRaises(InsufficientStock) as raised:
+            self.place()
+        self.assertEqual(raised.exception.product, self.ink)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.stock(), {'pen': 5, 'ink': 5})
+        self.assertEqual(self.cart.items.count(), 2)
+
+    def test_failed_line_after_writes_rolls_back(self):
+        # Sharded lines take their stock before the order is written, so a
+        # later failure has to undo them.
+        for product in (self.pen, self.ink):
+            product.inventory.rebalance(shard_count=2)
+        self.fill((self.pen, 2), (self.ink, 1))
+        with mock.patch('store.checkout.sales.record', side_effect=CheckoutError('boom')), self.assertRaises(CheckoutError):
+            self.place()
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual([inventory.total_stock for inventory in Inventory.objects.order_by('product_id')], [5, 5])
+
+
+class InventoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='stocked', description='')
+        cls.product = Product.objects.create(name='lamp', description='', price=Decimal('30.00'), category=category, image='products/lamp.jpg')
+
+    def setUp(self):
+        self.inventory = Inventory.objects.create(product=self.product, stock_count=10)
+
+    def stock(self):
+        return Inventory.objects.get(pk=self.inventory.pk).stock_count
+
+    def test_stale_instances_do_not_overwrite_each_other(self):
+        first, second = Inventory.objects.get(pk=self.inventory.pk), Inventory.objects.get(pk=self.inventory.pk)
+        first.add(3)
+        second.add(2)
+        self.assertTrue(first.remove(4))
+        self.assertTrue(second.remove(1))
+        self.assertEqual(self.stock(), 10)
+        self.assertEqual(second.stock_count, 10)
+
+    def test_remove_beyond_stock_is_rejected(self):
+        stale = Inventory.objects.get(pk=self.inventory.pk)
+        self.assertFalse(self.inventory.remove(11))
+        self.assertTrue(self.inventory.remove(10))
+        # The stale copy still says 10, but the guard runs in the database.
+        self.assertFalse(stale.remove(1))
+        self.assertEqual(self.stock(), 0)
+        self.assertEqual(stale.stock_count, 0)
+
+
+class FacetCountConsistencyTests(TestCase):
+    """Stock movements keep the maintained facet counts equal to a recount,
+    including when another writer runs between a change and its bookkeeping."""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='faceted', description='')
+        cls.product = Product.objects.create(name='scarf', description='', price=Decimal('15.00'), category=category, image='products/scarf.jpg')
+
+    def setUp(self):
+        self.inventory = Inventory.objects.create(product=self.product, stock_count=2)
+        facets.rebuild()
+
+    def cells(self):
+        return sorted(ProductFacetCount.objects.exclude(count=0).values_list('price_bucket', 'in_stock', 'count'))
+
+    def assertCountsMatchRecount(self):
+        maintained = self.cells()
+        facets.rebuild()
+        self.assertEqual(maintained, self.cells())
+
+    def interleave(self, first, write):
+        """Run ``write`` right after ``first`` changes the stock, before it
+        reloads it."""
+        refresh = first.refresh_from_db
+
+        def refresh_after_write(*args, **kwargs):
+            write()
+            return refresh(*args, **kwargs)
+
+        return mock.patch.object(first, 'refresh_from_db', side_effect=refresh_after_write)
+
+    def run_interleaved(self):
+        first, second = Inventory.objects.get(pk=self.inventory.pk), Inventory.objects.get(pk=self.inventory.pk)
+        steps = [
+            # Two removes that both end at 0.
+            (lambda: first.remove(1), lambda: second.remove(1), 0),
+            (lambda: first.add(3), lambda: second.remove(3), 0),
+            (lambda: first.add(1), lambda: second.add(2), 3),
+            (lambda: first.remove(3), lambda: second.add(1), 1),
+        ]
+        for change, write, stock in steps:
+            with self.interleave(first, write):
+                change()
+            self.assertEqual(Inventory.objects.get(pk=self.inventory.pk).total_stock, stock)
+            self.assertCountsMatchRecount()
+        self.assertEqual(self.cells(), [(1, True, 1)])
+
+    def test_only_real_filters_skip_the_stored_cells(self):
+        cache.clear()
+        ProductFacetCount.objects.update(count=7)
+        self.assertEqual(self.client.get('/api/products/facets/', {'in_stock': '0'}).json()['total'], 7)
+        self.assertEqual(self.client.get('/api/products/facets/', {'in_stock': 'true'}).json()['total'], 1)
+
+    def test_product_update_reads_current_stock(self):
+        product = Product.objects.select_related('inventory').get(pk=self.product.pk)
+        product.inventory.stock_count
+        self.assertTrue(Inventory.objects.get(pk=self.inventory.pk).remove(2))
+        serializer = ProductSerializer(product, data={'price': '30.00'}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertCountsMatchRecount()
+        self.assertEqual(self.cells(), [(2, False, 1)])
+
+    def test_admin_edits(self):
+        self.client.force_login(CustomUser.objects.create_superuser('facets-admin@example.com', 'pw'))
+        other = Category.objects.create(name='reshelved', description='')
+        response = self.client.post(reverse('admin:store_product_change', args=[self.product.pk]), {
+            'sku': '', 'name': 'scarf', 'description': 'wool', 'price': '60.00', 'category': other.pk,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertCountsMatchRecount()
+        self.assertEqual(list(ProductFacetCount.objects.filter(count__gt=0).values_list('category_id', flat=True)), [other.pk])
+
+        response = self.client.post(reverse('admin:store_inventory_change', args=[self.inventory.pk]), {
+            'product': self.product.pk, 'stock_count': 0,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertCountsMatchRecount()
+        self.assertEqual(self.cells(), [(3, False, 1)])
+
+        self.client.post(reverse('admin:store_product_delete', args=[self.product.pk]), {'post': 'yes'})
+        self.assertFalse(Product.objects.exists())
+        self.assertCountsMatchRecount()
+        self.assertEqual(self.cells(), [])
+
+    def test_interleaved_changes(self):
+        self.run_interleaved()
+
+    def test_interleaved_changes_on_shards(self):
+        self.inventory.rebalance(shard_count=2)
+        self.run_interleaved()
+
+
+class ShardedInventoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='hot', description='')
+        cls.product = Product.objects.create(name='console', description='', price=Decimal('300.00'), category=category, image='products/console.jpg')
+
+    def setUp(self):
+        self.inventory = Inventory.objects.create(product=self.product, stock_count=10)
+        self.inventory.rebalance(shard_count=4)
+
+    def shards(self):
+        return list(self.inventory.shards.order_by('index').values_list('stock_count', flat=True))
+
+    def test_rebalance_spreads_stock(self):
+        self.assertEqual((self.inventory.stock_count, self.shards()), (0, [3, 3, 2, 2]))
+        self.inventory.rebalance(shard_count=3)
+        self.assertEqual(self.shards(), [4, 3, 3])
+        self.inventory.rebalance(shard_count=0)
+        self.assertEqual((self.inventory.stock_count, self.shards()), (10, []))
+
+    def test_rebalance_keeps_the_total(self):
+        self.inventory.add(5)
+        self.assertTrue(self.inventory.remove(2))
+        self.inventory.rebalance(shard_count=5)
+        self.assertEqual(self.shards(), [3, 3, 3, 2, 2])
+        self.assertEqual(self.inventory.total_stock, 13)
+
+    def test_removes_never_go_negative(self):
+        removed = 0
+        while self.inventory.remove(3):
+            removed += 3
+            self.assertTrue(all(stock >= 0 for stock in self.shards()))
+        self.assertEqual(removed, 9)
+        self.assertEqual(self.inventory.total_stock, 1)
+        self.assertFalse(self.inventory.remove(2))
+        self.assertEqual(sum(self.shards()), 1)
+
+    def test_remove_across_every_shard(self):
+        # No shard holds 9, so the locked fallback takes it from all of them.
+        self.assertTrue(self.inventory.remove(9))
+        self.assertEqual(sum(self.shards()), 1)
+        self.assertTrue(all(stock >= 0 for stock in self.shards()))
+        self.assertFalse(self.inventory.remove(2))
+        self.assertTrue(self.inventory.remove(1))
+        self.assertEqual((self.inventory.total_stock, self.shards()), (0, [0, 0, 0, 0]))
+
+
+class ReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='held', description='')
+        cls.product = Product.objects.create(name='ticket', description='', price=Decimal('50.00'), category=category, image='products/ticket.jpg')
+        Inventory.objects.create(product=cls.product, stock_count=5)
+        cls.first, cls.second = (
+            Cart.objects.create(user=CustomUser.objects.create_user(f'holder{i}@example.com', 'pw')) for i in range(2)
+        )
+
+    def test_holds_reduce_available_stock(self):
+        reserve(self.first, self.product, 3)
+        self.assertEqual(reserved_quantities([self.product.pk]), {self.product.pk: 3})
+        self.assertEqual(reserved_quantities([self.product.pk], exclude_cart=self.first), {})
+        with self.assertRaisesMessage(ReservationError, 'Only 2 items left'):
+            reserve(self.second, self.product, 3)
+        reserve(self.second, self.product, 2)
+        # Holds are not taken off the counter.
+        self.assertEqual(Inventory.objects.get(product=self.product).stock_count, 5)
+
+    def test_changing_a_hold_replaces_and_extends_it(self):
+        reserve(self.first, self.product, 3)
+        hold = StockReservation.objects.get(cart=self.first)
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(minutes=5)):
+            reserve(self.first, self.product, 5)
+        extended = StockReservation.objects.get(cart=self.first)
+        self.assertEqual(extended.quantity, 5)
+        self.assertGreaterEqual(extended.expires_at - hold.expires_at, timedelta(minutes=5))
+        with self.assertRaises(ReservationError):
+            reserve(self.second, self.product, 1)
+
+    def test_expired_holds_are_ignored_and_released(self):
+        reserve(self.first, self.product, 5)
+        StockReservation.objects.filter(cart=self.first).update(expires_at=timezone.now() - timedelta(seconds=1))
+        reserve(self.second, self.product, 4)
+        self.assertEqual(reserved_quantities([self.product.pk]), {self.product.pk: 4})
+        self.assertEqual(release_expired(batch_size=1), 1)
+        self.assertEqual(list(StockReservation.objects.values_list('cart_id', flat=True)), [self.second.pk])
+        self.assertEqual(release_expired(), 0)
+
+
+    def test_purchase_does_not_sell_held_units(self):
+        reserve(self.first, self.product, 4)
+        client = APIClient()
+        client.force_authenticate(self.first.user)
+        url = f'/api/products/{self.product.pk}/purchase/'
+        # A hold placed after the serializer's check still counts.
+        with mock.patch('store.serializers.reserved_quantities', return_value={}):
+            self.assertEqual(client.post(url, {'quantity': 2}, format='json').status_code, 400)
+        self.assertEqual(client.post(url, {'quantity': 1}, format='json').status_code, 200)
+        self.assertEqual(Inventory.objects.get(product=self.product).stock_count, 4)
+        reserve(self.first, self.product, 4)
+
+
+class ProductImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='imported', description='')
+
+    def run_import(self, text, fmt='csv'):
+        report = ProductImporter().run(read_rows(io.BytesIO(text.encode()), fmt))
+        self.assertEqual(report['error_count'], 0, report['errors'])
+        return Product.objects.select_related('inventory').get(sku='SKU-1')
+
+    def test_reimport_keeps_missing_columns(self):
+        self.run_import('sku,name,description,price,category,stock,image\nSKU-1,mug,blue mug,4.00,imported,7,products/mug.jpg\n')
+        Product.objects.filter(sku='SKU-1').update(renditions={'thumb': {'webp': 'products/renditions/mug/thumb.webp'}})
+
+        product = self.run_import('sku,name,price,category\nSKU-1,big mug,5.00,imported\n')
+        self.assertEqual((product.name, product.price), ('big mug', Decimal('5.00')))
+        self.assertEqual((product.description, product.image.name, product.inventory.stock_count), ('blue mug', 'products/mug.jpg', 7))
+        self.assertEqual(product.renditions, {'thumb': {'webp': 'products/renditions/mug/thumb.webp'}})
+
+        product = self.run_import('{"sku": "SKU-1", "name": "mug", "price": "5.00", "category": "imported", "description": ""}\n', 'ndjson')
+        self.assertEqual((product.description, product.image.name), ('', 'products/mug.jpg'))
+
+    def test_new_image_resets_renditions(self):
+        self.run_import('sku,name,price,category,image\nSKU-1,mug,4.00,imported,products/mug.jpg\n')
+        Product.objects.filter(sku='SKU-1').update(renditions={'thumb': {'webp': 'products/renditions/mug/thumb.webp'}})
+        product = self.run_import('sku,name,price,category,image\nSKU-1,mug,4.00,imported,products/mug.jpg\n')
+        self.assertNotEqual(product.renditions, {})
+        product = self.run_import('sku,name,price,category,image\nSKU-1,mug,4.00,imported,products/cup.jpg\n')
+        self.assertEqual((product.image.name, product.renditions), ('products/cup.jpg', {}))
+
+    def test_blank_stock_is_not_set(self):
+        self.run_import('sku,name,price,category,stock\nSKU-1,mug,4.00,imported,7\n')
+        product = self.run_import('sku,name,price,category,stock\nSKU-1,mug,4.50,imported,\n')
+        self.assertEqual((product.price, product.inventory.stock_count), (Decimal('4.50'), 7))
+        product = self.run_import('{"sku": "SKU-1", "name": "mug", "price": "4.50", "category": "imported", "stock": null}\n', 'ndjson')
+        self.assertEqual(product.inventory.stock_count, 7)
+        new = ProductImporter().run(read_rows(io.BytesIO(b'sku,name,price,category,stock\nSKU-2,cup,3.00,imported,\n'), 'csv'))
+        self.assertEqual(new['error_count'], 0)
+        self.assertEqual(Inventory.objects.get(product__sku='SKU-2').stock_count, 0)
+
+    def test_facet_counts_follow_stock(self):
+        self.run_import('sku,name,price,category,stock\nSKU-1,mug,4.00,imported,2\n')
+        self.assertTrue(Inventory.objects.get(product__sku='SKU-1').remove(2))
+        self.run_import('sku,name,price,category\nSKU-1,mug,30.00,imported\n')
+        self.run_import('sku,name,price,category,stock\nSKU-1,mug,30.00,imported,3\n')
+        maintained = sorted(ProductFacetCount.objects.exclude(count=0).values_list('price_bucket', 'in_stock', 'count'))
+        facets.rebuild()
+        self.assertEqual(maintained, sorted(ProductFacetCount.objects.exclude(count=0).values_list('price_bucket', 'in_stock', 'count')))
+        self.assertEqual(maintained, [(2, True, 1)])
+
+    def test_new_products_without_optional_columns(self):
+        product = self.run_import('sku,name,price,category\nSKU-1,mug,4.00,imported\n')
+        self.assertEqual((product.description, product.image.name, product.inventory.stock_count), ('', '', 0))
+
+
+class RenditionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='pictured', description='')
+        cls.product = Product.objects.create(name='frame', description='', price=Decimal('12.00'), category=category, image='products/frame.png')
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        Product._meta.get_field('image').storage.save('products/frame.png', image_upload())
+
+    def test_cached_responses_pick_up_renditions(self):
+        detail, listing = f'/api/products/{self.product.pk}/', '/api/products/'
+        self.assertEqual(self.client.get(detail).json()['images'], {})
+        self.assertEqual(self.client.get(listing).json()['results'][0]['images'], {})
+        generate_renditions('products/frame.png')
+        self.assertEqual(set(self.client.get(detail).json()['images']), set(RENDITION_SIZES))
+        self.assertEqual(set(self.client.get(listing).json()['results'][0]['images']), set(RENDITION_SIZES))
+
+
+class CartBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shopper = CustomUser.objects.create_user('batch@example.com', 'pw')
+        category = Category.objects.create(name='batched', description='')
+        cls.tea, cls.cup, cls.pot = Product.objects.bulk_create([
+            Product(name=name, description='', price=Decimal('3.00'), category=category, image=f'products/{name}.jpg')
+            for name in ('tea', 'cup', 'pot')
+        ])
+        Inventory.objects.bulk_create([Inventory(product=product, stock_count=5) for product in (cls.tea, cls.cup, cls.pot)])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.shopper)
+        self.cart = Cart.objects.create(user=self.shopper)
+        CartItem.objects.bulk_create([CartItem(cart=self.cart, product=self.tea, quantity=2), CartItem(cart=self.cart, product=self.cup, quantity=1)])
+        reserve_many(self.cart, {self.tea: 2, self.cup: 1})
+
+    def batch(self, operations):
+        return self.client.post('/api/cart/batch/', {'operations': operations}, format='json')
+
+    def lines(self):
+        return dict(self.cart.items.values_list('product__name', 'quantity'))
+
+    def holds(self):
+        return dict(self.cart.reservations.values_list('product__name', 'quantity'))
+
+    def test_add_set_and_remove(self):
+        response = self.batch([
+            {'product_id': self.tea.pk, 'quantity': 1, 'mode': 'add'},
+            {'product_id': self.cup.pk, 'mode': 'remove'},
+            {'product_id': self.pot.pk, 'quantity': 4},
+            {'product_id': self.pot.pk, 'quantity': 1, 'mode': 'add'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_items'], 8)
+        self.assertEqual(self.lines(), {'tea': 3, 'pot': 5})
+        self.assertEqual(self.holds(), {'tea': 3, 'pot': 5})
+
+    def test_set_to_zero_removes_the_line(self):
+        self.batch([{'product_id': self.tea.pk, 'quantity': 0, 'mode': 'set'}])
+        self.assertEqual(self.lines(), {'cup': 1})
+        self.assertEqual(self.holds(), {'cup': 1})
+
+    def test_one_failure_applies_nothing(self):
+        response = self.batch([
+            {'product_id': self.tea.pk, 'quantity': 5},
+            {'product_id': self.cup.pk, 'quantity': 6},
+            {'product_id': self.pot.pk, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data['errors']), 1)
+        self.assertEqual(self.lines(), {'tea': 2, 'cup': 1})
+        self.assertEqual(self.holds(), {'tea': 2, 'cup': 1})
+
+        response = self.batch([{'product_id': self.tea.pk, 'quantity': 1}, {'product_id': 0, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.lines(), {'tea': 2, 'cup': 1})
+
+    def test_operation_limit(self):
+        operations = [{'product_id': self.tea.pk, 'quantity': 1, 'mode': 'add'}] * 201
+        self.assertEqual(self.batch(operations).status_code, 400)
+        self.assertEqual(self.batch([]).status_code, 400)
+        self.assertEqual(self.lines(), {'tea': 2, 'cup': 1})
+        # A bare list of up to 200 operations is accepted.
+        response = self.client.post('/api/cart/batch/', [{'product_id': self.tea.pk, 'quantity': 4}] * 200, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.lines(), {'tea': 4, 'cup': 1})
+
+
+@mock.patch.object(timing.logger, 'disabled', True)
+class AsyncRouteTests(TestCase):
+    """The ASGI request path: reads are answered by ``store.async_views``,
+    writes to the same URLs by the DRF viewsets."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.shopper = CustomUser.objects.create_user('async@example.com', 'pw')
+        cls.category = Category.objects.create(name='awaited', description='')
+        cls.product = Product.objects.create(name='kettle', description='', price=Decimal('20.00'), category=cls.category, image='products/kettle.jpg')
+        Inventory.objects.create(product=cls.product, stock_count=4)
+
+    def setUp(self):
+        cache.clear()
+        self.headers = {'Authorization': f'bearer {AccessToken.for_user(self.shopper)}'}
+
+    def assertServedBy(self, response, namespace):
+        self.assertEqual(response.resolver_match.namespace, namespace)
+
+    async def test_reads(self):
+        response = await self.async_client.get('/api/products/')
+        self.assertServedBy(response, 'async_api')
+        self.assertEqual([product['name'] for product in response.json()['results']], ['kettle'])
+        response = await self.async_client.get(f'/api/products/{self.product.pk}/')
+        self.assertServedBy(response, 'async_api')
+        self.assertEqual(response.json()['stock'], 4)
+        response = await self.async_client.get('/api/categories/')
+        self.assertServedBy(response, 'async_api')
+        self.assertEqual([category['name'] for category in response.json()['results']], ['awaited'])
+        response = await self.async_client.get('/api/cart/', headers=self.headers)
+        self.assertServedBy(response, 'async_api')
+        self.assertEqual((response.status_code, response.json()['items']), (200, []))
+        self.assertEqual((await self.async_client.get('/api/cart/')).status_code, 401)
+
+    async def test_bad_credentials_are_refused(self):
+        expired = AccessToken.for_user(self.shopper)
+        expired.set_exp(lifetime=-timedelta(minutes=1))
+        urls = ['/api/products/', f'/api/products/{self.product.pk}/', '/api/categories/']
+        for url in urls:
+            for authorization in ('bearer not-a-token', f'bearer {expired}', 'Basic YXN5bmNAZXhhbXBsZS5jb206d3Jvbmc='):
+                response = await self.async_client.get(url, headers={'Authorization': authorization})
+                self.assertServedBy(response, 'async_api')
+                self.assertEqual(response.status_code, 401, (url, authorization))
+            response = await self.async_client.get(url, headers=self.headers)
+            self.assertEqual(response.status_code, 200, url)
+
+    async def test_writes_reach_the_viewsets(self):
+        response = await self.async_client.post('/api/categories/', {'name': 'posted', 'description': ''}, content_type='application/json')
+        self.assertServedBy(response, 'api')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(await Category.objects.filter(name='posted').aexists())
+
+        response = await self.async_client.post('/api/cart/', {}, content_type='application/json', headers=self.headers)
+        self.assertServedBy(response, 'api')
+        self.assertEqual(response.status_code, 405)
+
+        response = await self.async_client.delete(f'/api/products/{self.product.pk}/')
+        self.assertServedBy(response, 'api')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(await Product.objects.filter(pk=self.product.pk).aexists())
+        response = await self.async_client.get(f'/api/products/{self.product.pk}/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_async_views_refuse_writes(self):
+        with override_settings(ROOT_URLCONF='e_comm.async_urls'):
+            response = await self.async_client.post('/api/categories/', {}, content_type='application/json')
+        self.assertEqual((response.status_code, response['Allow']), (405, 'GET, HEAD'))
+        self.assertFalse(await Category.objects.filter(name='posted').aexists())
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.hats, cls.socks = Category.objects.bulk_create([
+            Category(name='hats', description=''), Category(name='socks', description=''),
+        ])
+        cls.products = Product.objects.bulk_create([
+            Product(
+                name=f'item {index}', description='knitted wool', price=Decimal(index), image=f'products/{index}.jpg',
+                category=cls.hats if index % 2 else cls.socks,
+            )
+            for index in range(1, 8)
+        ])
+        # Ties on created_at are broken by the id.
+        Product.objects.update(created_at=timezone.now())
+        index_products(cls.products)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def walk(self, params):
+        """Names on every page, following the next links."""
+        pages, page = [], self.get('/api/products/', params)
+        pages.append([product['name'] for product in page['results']])
+        while page['next']:
+            page = self.get(page['next'])
+            pages.append([product['name'] for product in page['results']])
+        return pages, page
+
+    def test_next_and_previous_round_trip(self):
+        pages, last = self.walk({'page_size': 3})
+        names = [f'item {index}' for index in range(7, 0, -1)]
+        self.assertEqual(pages, [names[:3], names[3:6], names[6:]])
+        back, page = [], last
+        while page['previous']:
+            page = self.get(page['previous'])
+            back.append([product['name'] for product in page['results']])
+        self.assertEqual(back, [names[3:6], names[:3]])
+        self.assertIsNone(page['previous'])
+        self.assertIsNotNone(page['next'])
+
+    def test_invalid_cursor(self):
+        token = base64.urlsafe_b64encode(b'{"p":[1],"r":0}').decode()
+        for cursor in ('not-a-cursor', token):
+            response = self.client.get('/api/products/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+    def test_cursors_keep_the_filters(self):
+        pages, _ = self.walk({'page_size': 2, 'category': self.hats.pk, 'min_price': 2})
+        self.assertEqual(pages, [['item 7', 'item 5'], ['item 3']])
+
+    def test_search_ranks_with_ties(self):
+        Product.objects.filter(pk=self.products[1].pk).update(name='wool hat')
+        index_products(Product.objects.filter(pk=self.products[1].pk))
+        pages, _ = self.walk({'page_size': 2, 'q': 'wool'})
+        names = [name for page in pages for name in page]
+        # The name match ranks first; the rest tie and fall back to the id.
+        self.assertEqual(names, ['wool hat', 'item 7', 'item 6', 'item 5', 'item 4', 'item 3', 'item 1'])
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_superuser('search@example.com', 'pw')
+        cls.category = Category.objects.create(name='searched', description='')
+        index_products(Product.objects.bulk_create([
+            Product(name=name, description=description, price=Decimal('5.00'), category=cls.category, image='products/searched.jpg')
+            for name, description in [
+                ('gadget', 'comes with a widget'),
+                ('blue widget', 'small and blue'),
+                ('bolt', 'steel'),
+            ]
+        ]))
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def search(self, query):
+        response = self.client.get('/api/products/', {'q': query})
+        return [product['name'] for product in response.json()['results']]
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual(self.search('widget'), ['blue widget', 'gadget'])
+        self.assertEqual(self.search('blue widget'), ['blue widget'])
+
+    def test_prefixes_match(self):
+        self.assertEqual(self.search('widg'), ['blue widget', 'gadget'])
+        self.assertEqual(self.search('WIDG bl'), ['blue widget'])
+        self.assertEqual(self.search('widgets'), [])
+
+    def test_index_follows_api_writes(self):
+        response = self.client.post('/api/products/', {
+            'name': 'sprocket', 'description': 'toothed', 'price': '3.00', 'category': self.category.pk,
+            'image': image_upload(),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        product_id = response.data['id']
+        self.assertEqual(self.search('sprock'), ['sprocket'])
+
+        self.client.patch(f'/api/products/{product_id}/', {'name': 'cog'}, format='json')
+        self.assertEqual(self.search('sprock'), [])
+        self.assertEqual(self.search('cog tooth'), ['cog'])
+
+        self.client.delete(f'/api/products/{product_id}/')
+        self.assertEqual(self.search('cog'), [])
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_superuser('cached@example.com', 'pw')
+        cls.category = Category.objects.create(name='cached', description='')
+        cls.product, cls.other = Product.objects.bulk_create([
+            Product(name=name, description='', price=Decimal('5.00'), category=cls.category, image='products/cached.jpg')
+            for name in ('vase', 'bowl')
+        ])
+        cls.inventory = Inventory.objects.create(product=cls.product, stock_count=3)
+
+    def setUp(self):
+        cache.clear()
+
+    def versions(self, *scopes):
+        return dict(zip(scopes, get_versions(scopes)))
+
+    def test_repeated_reads_are_hits(self):
+        for url in ('/api/products/', f'/api/products/{self.product.pk}/', '/api/categories/'):
+            first = self.client.get(url).json()
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).json(), first)
+        # A different query string is a different entry.
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/products/', {'page_size': 1})
+        self.assertTrue(queries)
+
+    def test_product_writes_bump_their_scopes(self):
+        scopes = ('global', 'products', f'category:{self.category.pk}', f'product:{self.product.pk}', f'product:{self.other.pk}')
+        before = self.versions(*scopes)
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        client.patch(f'/api/products/{self.product.pk}/', {'price': '6.00'}, format='json')
+        after = self.versions(*scopes)
+        self.assertEqual([scope for scope in scopes if after[scope] != before[scope]], list(scopes[1:4]))
+        self.assertEqual(self.client.get(f'/api/products/{self.product.pk}/').json()['price'], '6.00')
+
+    def test_bump_repeats_on_commit(self):
+        before = self.versions('products')['products']
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            invalidate_products([self.product])
+            self.assertEqual(self.versions('products')['products'], before + 1)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.versions('products')['products'], before + 2)
+
+    def test_admin_edits_invalidate(self):
+        detail = f'/api/products/{self.product.pk}/'
+        self.client.get('/api/categories/')
+        self.client.get(detail)
+        self.client.force_login(self.staff)
+        self.client.post(reverse('admin:store_category_change', args=[self.category.pk]), {'name': 'vessels', 'description': ''})
+        self.client.post(reverse('admin:store_product_change', args=[self.product.pk]), {
+            'sku': '', 'name': 'vase', 'description': 'tall', 'price': '8.00', 'category': self.category.pk,
+        })
+        self.client.post(reverse('admin:store_inventory_change', args=[self.inventory.pk]), {
+            'product': self.product.pk, 'stock_count': 9,
+        })
+        self.assertEqual([category['name'] for category in self.client.get('/api/categories/').json()['results']], ['vessels'])
+        product = self.client.get(detail).json()
+        self.assertEqual((product['category']['name'], product['price'], product['stock']), ('vessels', '8.00', 9))
+
+        self.client.post(reverse('admin:store_category_delete', args=[self.category.pk]), {'post': 'yes'})
+        self.assertEqual(self.client.get('/api/categories/').json()['results'], [])
+        self.assertEqual(self.client.get(detail).status_code, 404)
+
+
+class CartTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shopper = CustomUser.objects.create_user('totals@example.com', 'pw')
+        category = Category.objects.create(name='totalled', description='')
+        cls.pen, cls.ink = Product.objects.bulk_create([
+            Product(name='pen', description='', price=Decimal('2.00'), category=category, image='products/pen.jpg'),
+            Product(name='ink', description='', price=Decimal('3.50'), category=category, image='products/ink.jpg'),
+        ])
+
+    def setUp(self):
+        self.cart = Cart.objects.create(user=self.shopper)
+        self.client = APIClient()
+        self.client.force_authenticate(self.shopper)
+
+    def totals(self):
+        annotated = Cart.objects.with_items().get(pk=self.cart.pk)
+        plain = Cart.objects.get(pk=self.cart.pk)
+        self.assertEqual((plain.total_price, plain.total_items), (annotated.total_price, annotated.total_items))
+        response = self.client.get('/api/cart/').json()
+        self.assertEqual(Decimal(response['total_price']), annotated.total_price)
+        self.assertEqual(response['total_items'], annotated.total_items)
+        return annotated.total_price, annotated.total_items
+
+    def test_empty_cart(self):
+        self.assertEqual(self.totals(), (Decimal('0.00'), 0))
+
+    def test_several_lines(self):
+        CartItem.objects.bulk_create([CartItem(cart=self.cart, product=self.pen, quantity=2), CartItem(cart=self.cart, product=self.ink, quantity=3)])
+        self.assertEqual(self.totals(), (Decimal('14.50'), 5))
+
+
+class OrderExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_superuser('export@example.com', 'pw')
+        category = Category.objects.create(name='exported', description='')
+        cls.pen, cls.ink = Product.objects.bulk_create([
+            Product(name='pen', description='', price=Decimal('2.00'), category=category, image='products/pen.jpg'),
+            Product(name='ink', description='', price=Decimal('3.50'), category=category, image='products/ink.jpg'),
+        ])
+        cls.orders = Order.objects.bulk_create([
+            Order(user=cls.staff, full_name=name, email='export@example.com', address='a', phone='1', total=total, status=status)
+            for name, total, status in [
+                ('first', Decimal('11.00'), 'pending'), ('second', Decimal('2.00'), 'shipped'), ('third', Decimal('0.00'), 'cancelled'),
+            ]
+        ])
+        for order, day in zip(cls.orders, ('2026-01-05', '2026-02-10', '2026-03-01')):
+            Order.objects.filter(pk=order.pk).update(created_at=f'{day}T12:00:00Z')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=cls.orders[0], product=cls.pen, quantity=1, price=Decimal('2.00')),
+            OrderItem(order=cls.orders[0], product=cls.ink, quantity=2, price=Decimal('4.50')),
+            OrderItem(order=cls.orders[1], product=cls.pen, quantity=1, price=Decimal('2.00')),
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def export(self, **params):
+        response = self.client.get('/api/orders/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def exported_names(self, **params):
+        return [json.loads(line)['full_name'] for line in self.export(type='ndjson', **params).splitlines()]
+
+    def test_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.export())))
+        self.assertEqual(
+            [(row['full_name'], row['product_name'], row['quantity'], row['subtotal']) for row in rows],
+            [('first', 'pen', '1', '2.00'), ('first', 'ink', '2', '9.00'), ('second', 'pen', '1', '2.00'), ('third', '', '', '')],
+        )
+        self.assertEqual((rows[3]['status'], rows[3]['order_total'], rows[3]['item_id']), ('cancelled', '0.00', ''))
+
+    def test_ndjson(self):
+        orders = [json.loads(line) for line in self.export(type='ndjson').splitlines()]
+        self.assertEqual([order['full_name'] for order in orders], ['first', 'second', 'third'])
+        self.assertEqual(
+            [(item['product_name'], item['quantity'], item['subtotal']) for item in orders[0]['items']],
+            [('pen', 1, '2.00'), ('ink', 2, '9.00')],
+        )
+        self.assertEqual(orders[2]['items'], [])
+
+    def test_filters(self):
+        self.assertEqual(self.exported_names(since='2026-02-01'), ['second', 'third'])
+        # A bare date as the upper bound covers that whole day.
+        self.assertEqual(self.exported_names(until='2026-02-10'), ['first', 'second'])
+        self.assertEqual(self.exported_names(since='2026-02-10T13:00:00Z'), ['third'])
+        self.assertEqual(self.exported_names(status='pending,cancelled'), ['first', 'third'])
+
+    def test_bad_parameters(self):
+        for params in ({'type': 'xml'}, {'status': 'lost'}, {'since': 'yesterday'}):
+            self.assertEqual(self.client.get('/api/orders/export/', params).status_code, 400, params)
+
+    def test_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = Path(directory) / 'orders.ndjson'
+        call_command('export_orders', '--format', 'ndjson', '--status', 'shipped', '--status', 'cancelled', '--output', str(path))
+        self.assertEqual([json.loads(line)['full_name'] for line in path.read_text().splitlines()], ['second', 'third'])
+
+
+class OrderListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shopper = CustomUser.objects.create_user('history@example.com', 'pw')
+        category = Category.objects.create(name='ordered', description='')
+        pen, ink = Product.objects.bulk_create([
+            Product(name=name, description='', price=Decimal('2.00'), category=category, image=f'products/{name}.jpg')
+            for name in ('pen', 'ink')
+        ])
+        cls.full, cls.empty = Order.objects.bulk_create([
+            Order(user=cls.shopper, full_name=name, email='history@example.com', address='a', phone='1', total=Decimal('10.00'))
+            for name in ('full', 'empty')
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=cls.full, product=pen, quantity=2, price=Decimal('2.00')),
+            OrderItem(order=cls.full, product=ink, quantity=3, price=Decimal('2.00')),
+        ])
+
+    def test_item_counts(self):
+        client = APIClient()
+        client.force_authenticate(self.shopper)
+        results = client.get('/api/orders/').json()['results']
+        self.assertEqual({order['full_name']: order['item_count'] for order in results}, {'full': 5, 'empty': 0})
+        self.assertNotIn('items', results[0])
+
+
+@mock.patch.object(connection.creation, 'destroy_test_db')
+@mock.patch.object(connection.creation, 'create_test_db')
+class LoadTestCommandTests(TestCase):
+    """A small run of the load benchmark against the test database (the
+    command's own throwaway database is not created)."""
+
+    def test_seed_replay_and_report(self, create_test_db, destroy_test_db):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = Path(directory) / 'results.json'
+        out = io.StringIO()
+        call_command(
+            'loadtest', '--products', '40', '--categories', '3', '--users', '4', '--carts', '2',
+            '--requests', '60', '--warmup', '5', '--output', str(path), stdout=out,
+        )
+        create_test_db.assert_called_once()
+        destroy_test_db.assert_called_once()
+        self.assertEqual(Product.objects.count(), 40)
+
+        results = json.loads(path.read_text())
+        self.assertEqual(results['meta']['sizes'], {'categories': 3, 'products': 40, 'users': 4, 'carts': 2})
+        self.assertGreaterEqual(results['overall']['requests'], 60)
+        self.assertEqual(results['overall']['server_errors'], 0)
+        self.assertIn('product-list', results['endpoints'])
+        self.assertIn('overall', out.getvalue())
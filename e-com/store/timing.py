@@ -0,0 +1,185 @@
+"""Per-request performance breakdown.
+
+``server_timing_middleware`` samples ``SERVER_TIMING_SAMPLE_RATE`` of the
+requests. For each sampled request it records the total time, the number
+and duration of database queries, the time spent validating and rendering
+the store's serializers (those built on ``TimedSerializerMixin``), and the
+catalog and user cache hits and misses, and reports them in a JSON log line
+on the ``store.timing`` logger and, unless ``SERVER_TIMING_HEADER`` is off,
+a ``Server-Timing`` header.
+
+The measurements live in a context variable, which is copied into the
+worker threads that run sync code under ASGI. An unsampled request never
+sets it, so the hooks below cost one lookup each. Queries are seen through
+Django's execute wrappers; nothing in Django or DRF is patched.
+"""
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+SAMPLE_RATE = getattr(settings, 'SERVER_TIMING_SAMPLE_RATE', 0.01)
+SEND_HEADER = getattr(settings, 'SERVER_TIMING_HEADER', True)
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('store_request_timing', default=None)
+_installed = False
+
+
+class RequestTiming:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = 0.0
+        self.queries = 0
+        self.db = 0.0
+        self.serializer = 0.0
+        self.serializer_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+
+    def header(self, route):
+        metrics = [
+            f'total;dur={self.total * 1000:.1f}',
+            f'db;dur={self.db * 1000:.1f};desc="{self.queries} queries"',
+            f'ser;dur={self.serializer * 1000:.1f}',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+        ]
+        if route:
+            metrics.append(f'route;desc="{route}"')
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total * 1000, 2),
+            'db_queries': self.queries,
+            'db_ms': round(self.db * 1000, 2),
+            'serializer_ms': round(self.serializer * 1000, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+
+def start():
+    """Start timing the current request if it is sampled. Returns a token
+    for ``stop()``, or None."""
+    if SAMPLE_RATE < 1 and random.random() >= SAMPLE_RATE:
+        return None
+    # This thread's connections may predate install().
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(connection)
+    return _current.set(RequestTiming())
+
+
+def stop(token):
+    timing = _current.get()
+    _current.reset(token)
+    timing.finish()
+    return timing
+
+
+def record_cache(hit):
+    timing = _current.get()
+    if timing is not None:
+        if hit:
+            timing.cache_hits += 1
+        else:
+            timing.cache_misses += 1
+
+
+def record_query(execute, sql, params, many, context):
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.db += time.perf_counter() - started
+        timing.queries += 1
+
+
+def install_query_recorder(connection, **kwargs):
+    # First in the list: execute_wrapper() blocks pop the last entry.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+def timed_serializer(method):
+    """Add the time spent in ``method`` to the serializer total; nested
+    calls are only counted once."""
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        timing = _current.get()
+        if timing is None:
+            return method(*args, **kwargs)
+        timing.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            timing.serializer_depth -= 1
+            if not timing.serializer_depth:
+                timing.serializer += time.perf_counter() - started
+
+    return wrapper
+
+
+class TimedSerializerMixin:
+    """Count a serializer's validation and rendering towards the request's
+    serializer time. Nested and list serializers call these once per item,
+    so the outermost call is the one that is measured."""
+
+    @timed_serializer
+    def run_validation(self, *args, **kwargs):
+        return super().run_validation(*args, **kwargs)
+
+    @timed_serializer
+    def to_representation(self, *args, **kwargs):
+        return super().to_representation(*args, **kwargs)
+
+
+def install():
+    """Hook the query recorder into database connections. Safe to call more
+    than once."""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    # Connections are per thread; every new one gets the query recorder,
+    # including those opened by the async ORM's worker threads.
+    connection_created.connect(install_query_recorder, dispatch_uid='store.timing')
+
+
+def route_name(request):
+    """The URL name and, for viewsets, the action that served ``request``,
+    e.g. ``('cart-checkout', 'checkout')``."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None, None
+    actions = getattr(match.func, 'actions', None) or {}
+    return match.url_name, actions.get(request.method.lower())
+
+
+def report(request, response, timing):
+    route, action = route_name(request)
+    if SEND_HEADER:
+        response['Server-Timing'] = timing.header(route)
+    logger.info(json.dumps({
+        'method': request.method,
+        'path': request.path,
+        'route': route,
+        'action': action,
+        'status': response.status_code,
+        **timing.as_dict(),
+    }))
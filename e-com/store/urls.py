@@ -9,6 +9,8 @@ router.register('products', views.ProductViewSet)
 router.register('inventory', views.InventoryViewSet)
 router.register('cart', views.CartViewSet, basename='cart')
 router.register('orders', views.OrderViewSet, basename='orders')
+router.register('analytics', views.AnalyticsViewSet, basename='analytics')
+router.register('profiles', views.ProfileViewSet, basename='profiles')
 
 app_name = 'api'
 
@@ -1,30 +1,65 @@
 from rest_framework import viewsets, filters, status, permissions
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from django.db import transaction
-from django.shortcuts import get_object_or_404
+from django.http import HttpResponse, StreamingHttpResponse
 
 from .models import (
-    Category, Product, Inventory, Cart, CartItem, Order, OrderItem
+    Category, Product, Inventory, Cart, CartItem, Order, ProductFacetCount
 )
+from .models.facets import product_cell
 from .serializers import (
     CategorySerializer, ProductSerializer, ProductDetailSerializer,
     InventorySerializer, StockUpdateSerializer, PurchaseSerializer,
-    CartSerializer, CartItemSerializer, OrderSerializer, CheckoutSerializer
+    CartSerializer, CartItemSerializer, OrderSerializer, OrderSummarySerializer,
+    CartBatchSerializer, CheckoutSerializer, BulkOrderTransitionSerializer
 )
-
-
-class CategoryViewSet(viewsets.ModelViewSet):
+from . import profiling, sales
+from .cache import CatalogCacheMixin, invalidate_categories, invalidate_products
+from .checkout import CheckoutError, place_order
+from .facets import facet_counts, in_stock_filter
+from .fulfilment import transition
+from .exporter import DEFAULT_CHUNK_SIZE, export_orders, filter_orders
+from .importer import DEFAULT_BATCH_SIZE, ProductImporter, detect_format, read_rows
+from .metrics import checkouts, purchases, stock_adjusted_units, stock_adjustments
+from .pagination import KeysetPagination
+from .reservations import ReservationError, release, remove_unreserved, reserve, reserve_many
+from .search import search_products, search_terms, unindex_product
+
+
+class CategoryViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     filter_backends = [filters.SearchFilter]
     search_fields = ['name']
 
+    def perform_create(self, serializer):
+        serializer.save()
+        invalidate_categories()
+
+    def perform_update(self, serializer):
+        serializer.save()
+        invalidate_categories()
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        invalidate_categories()
+
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name', 'description']
+
+    @property
+    def search_query(self):
+        params = self.request.query_params
+        return ' '.join(search_terms(params.get('q') or params.get('search') or ''))
+
+    @property
+    def pagination_ordering(self):
+        if self.search_query:
+            return ('-search_rank', '-id')
+        return KeysetPagination.ordering
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -34,7 +69,7 @@ class ProductViewSet(viewsets.ModelViewSet):
         return ProductSerializer
 
     def get_queryset(self):
-        queryset = Product.objects.all()
+        queryset = Product.objects.select_related('category', 'inventory').prefetch_related('inventory__shards')
         category = self.request.query_params.get('category')
         min_price = self.request.query_params.get('min_price')
         max_price = self.request.query_params.get('max_price')
@@ -45,66 +80,123 @@ class ProductViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(price__gte=min_price)
         if max_price:
             queryset = queryset.filter(price__lte=max_price)
+        if self.request.query_params.get('in_stock') in ('1', 'true'):
+            queryset = queryset.filter(in_stock_filter())
+        if self.search_query:
+            queryset = search_products(queryset, self.search_query)
 
         return queryset
 
+    def get_cache_scopes(self):
+        if self.action == 'retrieve':
+            return ['global', f'product:{self.kwargs[self.lookup_field]}']
+        category = self.request.query_params.get('category')
+        return ['global', f'category:{category}' if category else 'products']
+
     def perform_destroy(self, instance):
+        product_id = instance.pk
+        ProductFacetCount.objects.apply([(product_cell(instance), None)])
         Inventory.objects.filter(product=instance).delete()
         instance.delete()
+        unindex_product(product_id)
+        invalidate_products([Product(pk=product_id, category_id=instance.category_id)])
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Product counts per category, price bucket and stock state for the
+        same filters and search as the list."""
+        params = request.query_params
+        filtered = bool(
+            self.search_query or params.get('min_price') or params.get('max_price') or params.get('in_stock') in ('1', 'true')
+        )
+        return self.cached_response(request, lambda: Response(
+            facet_counts(self.get_queryset(), filtered, category=params.get('category')),
+        ))
+
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=[permissions.IsAdminUser])
+    def bulk_import(self, request):
+        """Upsert products by SKU from a CSV or NDJSON body (or a multipart
+        ``file``). Rows are validated and written in batches as they are read."""
+        if request.content_type.startswith('multipart/form-data'):
+            upload = request.FILES.get('file')
+            stream = upload
+            fmt = detect_format(upload.content_type or '', upload.name) if upload else None
+        else:
+            stream, fmt = request.stream, detect_format(request.content_type)
+        fmt = request.query_params.get('type', fmt)
+        if stream is None or fmt not in ('csv', 'ndjson'):
+            return Response(
+                {'error': 'Send a CSV or NDJSON body, or a multipart "file" upload.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            batch_size = int(request.query_params.get('batch_size', DEFAULT_BATCH_SIZE))
+        except ValueError:
+            batch_size = DEFAULT_BATCH_SIZE
+        importer = ProductImporter(batch_size=max(1, min(batch_size, 5000)))
+        report = importer.run(read_rows(stream, fmt))
+        return Response(report, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'])
     def purchase(self, request, pk=None):
         product = self.get_object()
         serializer = self.get_serializer(data=request.data, context={'product': product})
-        serializer.is_valid(raise_exception=True)
+        if not serializer.is_valid():
+            purchases.inc(result='rejected')
+            raise ValidationError(serializer.errors)
         quantity = serializer.validated_data['quantity']
 
         try:
-            inventory = Inventory.objects.get(product=product)
+            inventory = product.inventory
         except Inventory.DoesNotExist:
+            purchases.inc(result='out_of_stock')
             return Response({'error': 'Product is out of stock'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if inventory.stock_count < quantity:
+        # Checked again under the inventory row lock: a cart may have placed
+        # a hold on the same units since the serializer looked.
+        if not remove_unreserved(inventory, quantity):
+            purchases.inc(result='out_of_stock')
             return Response({'error': 'Not enough stock available'}, status=status.HTTP_400_BAD_REQUEST)
-
-        inventory.stock_count -= quantity
-        inventory.save()
-
-        product.stock = inventory.stock_count
-        product.save()
+        invalidate_products([product])
+        purchases.inc(result='success')
 
         return Response({
             'status': 'success',
             'message': f'Purchased {quantity} of {product.name}',
-            'remaining_stock': inventory.stock_count
+            'remaining_stock': inventory.total_stock
         })
 
 
 class InventoryViewSet(viewsets.ModelViewSet):
-    queryset = Inventory.objects.all()
+    queryset = Inventory.objects.select_related('product').prefetch_related('shards')
+    # last_updated changes on every stock movement, so page on the id alone.
+    pagination_ordering = ('id',)
 
     def get_serializer_class(self):
         if self.action in ['add_stock', 'remove_stock']:
             return StockUpdateSerializer
         return InventorySerializer
 
+    def perform_destroy(self, instance):
+        instance.record_stock_change(instance.total_stock, 0)
+        instance.delete()
+        invalidate_products([instance.product])
+
     @action(detail=True, methods=['post'])
     def add_stock(self, request, pk=None):
         inventory = self.get_object()
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        inventory.stock_count += serializer.validated_data['quantity']
-        inventory.save()
-
-        product = inventory.product
-        product.stock = inventory.stock_count
-        product.save()
+        inventory.add(serializer.validated_data['quantity'])
+        invalidate_products([inventory.product])
+        stock_adjustments.inc(direction='add', result='success')
+        stock_adjusted_units.inc(serializer.validated_data['quantity'], direction='add')
 
         return Response({
             'status': 'success',
             'message': f'Added stock',
-            'new_stock_count': inventory.stock_count
+            'new_stock_count': inventory.total_stock
         })
 
     @action(detail=True, methods=['post'])
@@ -114,17 +206,14 @@ class InventoryViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         quantity = serializer.validated_data['quantity']
 
-        if inventory.stock_count < quantity:
+        if not inventory.remove(quantity):
+            stock_adjustments.inc(direction='remove', result='insufficient')
             return Response({'error': 'Not enough stock'}, status=status.HTTP_400_BAD_REQUEST)
+        invalidate_products([inventory.product])
+        stock_adjustments.inc(direction='remove', result='success')
+        stock_adjusted_units.inc(quantity, direction='remove')
 
-        inventory.stock_count -= quantity
-        inventory.save()
-
-        product = inventory.product
-        product.stock = inventory.stock_count
-        product.save()
-
-        return Response({'status': 'success', 'new_stock_count': inventory.stock_count})
+        return Response({'status': 'success', 'new_stock_count': inventory.total_stock})
 
 
 class CartViewSet(viewsets.GenericViewSet):
@@ -138,6 +227,14 @@ class CartViewSet(viewsets.GenericViewSet):
         cart, _ = Cart.objects.get_or_create(user=self.request.user)
         return cart
 
+    def cart_response(self, cart):
+        # Reload with items, products and totals in a fixed number of queries.
+        cart = Cart.objects.with_items().get(pk=cart.pk)
+        return Response(CartSerializer(cart).data)
+
+    def list(self, request):
+        return self.cart_response(self.get_object())
+
     @action(detail=False, methods=['post'])
     def add_item(self, request):
         cart = self.get_object()
@@ -147,14 +244,19 @@ class CartViewSet(viewsets.GenericViewSet):
         product = serializer.validated_data['product']
         quantity = serializer.validated_data['quantity']
 
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart, product=product, defaults={'quantity': quantity}
-        )
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
-
-        return Response(CartSerializer(cart).data)
+        try:
+            with transaction.atomic():
+                cart_item, created = CartItem.objects.get_or_create(
+                    cart=cart, product=product, defaults={'quantity': quantity}
+                )
+                if not created:
+                    cart_item.quantity += quantity
+                    cart_item.save(update_fields=['quantity'])
+                reserve(cart, product, cart_item.quantity)
+        except ReservationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return self.cart_response(cart)
 
     @action(detail=False, methods=['post'])
     def update_item(self, request):
@@ -163,50 +265,99 @@ class CartViewSet(viewsets.GenericViewSet):
         quantity = int(request.data.get('quantity', 0))
 
         try:
-            cart_item = CartItem.objects.get(cart=cart, product_id=product_id)
-            if quantity <= 0:
-                cart_item.delete()
-            else:
-                cart_item.quantity = quantity
-                cart_item.save()
-            return Response(CartSerializer(cart).data)
+            with transaction.atomic():
+                cart_item = CartItem.objects.select_related('product').get(cart=cart, product_id=product_id)
+                if quantity <= 0:
+                    cart_item.delete()
+                    release(cart, [cart_item.product_id])
+                else:
+                    cart_item.quantity = quantity
+                    cart_item.save(update_fields=['quantity'])
+                    reserve(cart, cart_item.product, quantity)
+            return self.cart_response(cart)
         except CartItem.DoesNotExist:
             return Response({'error': 'Item not found in cart'}, status=status.HTTP_404_NOT_FOUND)
+        except ReservationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=False, methods=['post'])
-    def checkout(self, request):
+    def batch(self, request):
+        """Apply a list of ``{product_id, quantity, mode}`` operations in one
+        transaction. ``add`` increases the line, ``set`` replaces it and
+        ``remove`` drops it; a line that ends at 0 is removed. Either every
+        operation is applied or none is."""
         cart = self.get_object()
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data['operations']
+
+        product_ids = {operation['product_id'] for operation in operations}
+        products = Product.objects.in_bulk(product_ids)
+        missing = sorted(product_ids - set(products))
+        if missing:
+            return Response(
+                {'error': f'Unknown product: {", ".join(map(str, missing))}'}, status=status.HTTP_400_BAD_REQUEST,
+            )
 
-        if not cart.items.exists():
-            return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with transaction.atomic():
+                # Serialize concurrent writes to the same cart.
+                Cart.objects.select_for_update().only('id').get(pk=cart.pk)
+                items = {
+                    item.product_id: item
+                    for item in CartItem.objects.filter(cart=cart, product_id__in=product_ids)
+                }
+                quantities = {product_id: item.quantity for product_id, item in items.items()}
+                for operation in operations:
+                    product_id = operation['product_id']
+                    if operation['mode'] == 'add':
+                        quantities[product_id] = quantities.get(product_id, 0) + operation['quantity']
+                    elif operation['mode'] == 'set':
+                        quantities[product_id] = operation['quantity']
+                    else:
+                        quantities[product_id] = 0
+
+                kept = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+                removed = [product_id for product_id in items if product_id not in kept]
+                if kept:
+                    reserve_many(cart, {products[product_id]: quantity for product_id, quantity in kept.items()})
+
+                created, changed = [], []
+                for product_id, quantity in kept.items():
+                    item = items.get(product_id)
+                    if item is None:
+                        created.append(CartItem(cart=cart, product=products[product_id], quantity=quantity))
+                    elif item.quantity != quantity:
+                        item.quantity = quantity
+                        changed.append(item)
+                CartItem.objects.bulk_create(created)
+                CartItem.objects.bulk_update(changed, ['quantity'])
+                if removed:
+                    CartItem.objects.filter(cart=cart, product_id__in=removed).delete()
+                    release(cart, removed)
+        except ReservationError as e:
+            return Response({'error': str(e), 'errors': e.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        return self.cart_response(cart)
 
-        checkout_serializer = CheckoutSerializer(data=request.data)
-        checkout_serializer.is_valid(raise_exception=True)
-
-        with transaction.atomic():
-            for item in cart.items.all():
-                inventory = Inventory.objects.get(product=item.product)
-                if inventory.stock_count < item.quantity:
-                    return Response({'error': f'Not enough stock for {item.product.name}'}, status=status.HTTP_400_BAD_REQUEST)
-
-            order = Order.objects.create(
-                user=request.user,
-                full_name=checkout_serializer.validated_data['full_name'],
-                email=checkout_serializer.validated_data['email'],
-                address=checkout_serializer.validated_data['address'],
-                phone=checkout_serializer.validated_data['phone'],
-                total=cart.total_price,
-            )
+    @action(detail=False, methods=['post'])
+    def checkout(self, request):
+        cart = self.get_object()
 
-            for item in cart.items.all():
-                OrderItem.objects.create(order=order, product=item.product, quantity=item.quantity, price=item.product.price)
+        checkout_serializer = CheckoutSerializer(data=request.data)
+        if not checkout_serializer.is_valid():
+            checkouts.inc(result='rejected')
+            raise ValidationError(checkout_serializer.errors)
 
-                inventory = Inventory.objects.get(product=item.product)
-                inventory.stock_count -= item.quantity
-                inventory.save()
+        try:
+            order = place_order(cart, request.user, checkout_serializer.validated_data)
+        except CheckoutError as e:
+            checkouts.inc(result='failed')
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        checkouts.inc(result='success')
 
-            cart.items.all().delete()
-            return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+        order = Order.objects.with_items().get(pk=order.pk)
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
 
 
 class OrderViewSet(viewsets.ReadOnlyModelViewSet):
@@ -214,21 +365,125 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        queryset = Order.objects.filter(user=self.request.user).order_by('-created_at', '-id')
+        if self.action == 'list':
+            return queryset.with_summary()
+        return queryset.with_items()
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return OrderSummarySerializer
+        return OrderSerializer
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def export(self, request):
+        """Stream every order and its lines as CSV (default) or NDJSON.
+        Filters: ``since``/``until`` (date or datetime) and ``status``
+        (comma-separated)."""
+        params = request.query_params
+        fmt = params.get('type', 'csv')
+        if fmt not in ('csv', 'ndjson'):
+            return Response({'error': 'type must be csv or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+        statuses = [value for value in params.get('status', '').split(',') if value]
+        try:
+            queryset = filter_orders(Order.objects.all(), params.get('since'), params.get('until'), statuses)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(
+            export_orders(queryset, fmt, chunk_size=DEFAULT_CHUNK_SIZE),
+            content_type='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+        )
+        response['Content-Disposition'] = f'attachment; filename="orders.{fmt}"'
+        return response
 
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         order = self.get_object()
-        if order.status not in ['pending', 'processing']:
+        _, rejected = transition({order.pk: 'cancelled'})
+        if rejected:
             return Response({'error': f'Cannot cancel order with status {order.status}'}, status=status.HTTP_400_BAD_REQUEST)
 
-        with transaction.atomic():
-            order.status = 'cancelled'
-            order.save()
+        order.refresh_from_db(fields=['status', 'updated_at'])
+        return Response(OrderSerializer(order).data)
 
-            for item in order.items.all():
-                inventory, _ = Inventory.objects.get_or_create(product=item.product)
-                inventory.stock_count += item.quantity
-                inventory.save()
+    @action(detail=False, methods=['post'], url_path='transition', permission_classes=[permissions.IsAdminUser])
+    def bulk_transition(self, request):
+        """Move a batch of orders to new statuses, e.g.
+        ``{"transitions": [{"id": 1, "status": "shipped"}, ...]}``. Orders
+        that do not exist or may not move to their target are left alone
+        and listed in ``rejected``."""
+        serializer = BulkOrderTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        moved, rejected = transition({
+            change['id']: change['status'] for change in serializer.validated_data['transitions']
+        })
+        return Response({'updated': moved, 'rejected': rejected})
+
+
+class AnalyticsViewSet(viewsets.ViewSet):
+    """Sales reports read from the daily rollups (see ``store.sales``).
+    Filters: ``since``/``until`` (``YYYY-MM-DD``, inclusive; the last 30
+    days by default) and ``status`` (comma-separated; every status but
+    cancelled by default)."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def report_filters(self, request):
+        params = request.query_params
+        statuses = [value for value in params.get('status', '').split(',') if value] or sales.DEFAULT_STATUSES
+        unknown = [value for value in statuses if value not in dict(Order.STATUS_CHOICES)]
+        if unknown:
+            raise ValidationError({'status': f'Unknown status: {", ".join(unknown)}'})
+        try:
+            since, until = sales.parse_range(params.get('since'), params.get('until'))
+        except ValueError as e:
+            raise ValidationError({'error': str(e)})
+        return since, until, statuses
+
+    def report(self, since, until, statuses, **results):
+        return Response({'since': since, 'until': until, 'statuses': statuses, **results})
+
+    @action(detail=False, methods=['get'])
+    def daily(self, request):
+        since, until, statuses = self.report_filters(request)
+        return self.report(since, until, statuses, days=sales.daily(since, until, statuses))
+
+    @action(detail=False, methods=['get'])
+    def products(self, request):
+        """Best-selling products by revenue; ``limit`` (default 20, at most
+        100) sets how many."""
+        since, until, statuses = self.report_filters(request)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer'})
+        return self.report(since, until, statuses, products=sales.by_product(since, until, statuses, limit))
+
+    @action(detail=False, methods=['get'])
+    def categories(self, request):
+        since, until, statuses = self.report_filters(request)
+        return self.report(since, until, statuses, categories=sales.by_category(since, until, statuses))
+
+
+class ProfileViewSet(viewsets.ViewSet):
+    """Stored request profiles, newest first (see ``store.profiling``)."""
+    permission_classes = [permissions.IsAdminUser]
+    lookup_value_regex = r'[0-9A-Za-z-]+'
+
+    def list(self, request):
+        return Response(profiling.recent())
+
+    def retrieve(self, request, pk=None):
+        profile = profiling.load(pk)
+        if profile is None:
+            return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(profile)
+
+    @action(detail=True, methods=['get'])
+    def flamegraph(self, request, pk=None):
+        """Collapsed stacks, one ``frame;frame;frame count`` line each."""
+        stacks = profiling.flamegraph(pk)
+        if stacks is None:
+            return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+        return HttpResponse(stacks, content_type='text/plain; charset=utf-8')
 
-        return Response(OrderSerializer(order).data)
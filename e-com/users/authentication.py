@@ -0,0 +1,220 @@
+"""JWT and Basic authentication with cached user resolution.
+
+simplejwt loads the user row on every authenticated request. Here the
+fields requests read (``CLAIM_FIELDS`` and the pk, never the password hash)
+are cached for ``JWT_USER_CACHE_TIMEOUT`` seconds under a key that embeds the
+user's current version, and ``invalidate_user()`` (run on every save and
+delete of a user) bumps that version so profile, role, password and active
+flag changes apply on the next request. Bulk ``update()`` calls bypass the
+signals; call ``invalidate_user()`` after them.
+
+With ``JWT_STATELESS_USERS`` the user is built from the token's claims
+instead. Tokens carry the version they were issued at, and a token whose
+version is no longer current falls back to the cached lookup.
+
+Basic credentials are verified with the password hasher once and then
+remembered for ``BASIC_AUTH_CACHE_TIMEOUT`` seconds under an HMAC of the
+credentials (keyed with SECRET_KEY, so the cache never holds anything that
+can be checked offline), tied to the user's version like the rows above.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.utils.crypto import salted_hmac
+from rest_framework.authentication import BasicAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from store.timing import record_cache
+
+USER_CACHE_TIMEOUT = getattr(settings, 'JWT_USER_CACHE_TIMEOUT', 60)
+STATELESS_USERS = getattr(settings, 'JWT_STATELESS_USERS', False)
+BASIC_AUTH_CACHE_TIMEOUT = getattr(settings, 'BASIC_AUTH_CACHE_TIMEOUT', 120)
+BASIC_AUTH_COUNTERS = ('hits', 'misses', 'verify_ns')
+VERSION_CLAIM = 'uv'
+CLAIM_FIELDS = ('email', 'first_name', 'last_name', 'role', 'is_staff', 'is_superuser', 'is_active', 'is_vendor')
+# The digest of the password hash that tokens carry when CHECK_REVOKE_TOKEN
+# is set; cached in place of the hash itself.
+PASSWORD_DIGEST = 'password_digest'
+
+
+def _version_key(user_id):
+    return f'auth:user-version:{user_id}'
+
+
+def _user_key(user_id, version):
+    return f'auth:user:{user_id}:{version}'
+
+
+def get_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(user_id):
+    key = _version_key(user_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def _cached_fields(user):
+    values = {field: getattr(user, field) for field in (api_settings.USER_ID_FIELD, *CLAIM_FIELDS)}
+    if api_settings.CHECK_REVOKE_TOKEN:
+        values[PASSWORD_DIGEST] = get_md5_hash_password(user.password)
+    return values
+
+
+def user_from_fields(user_model, values):
+    """A user holding only ``values``; the other fields are deferred and
+    loaded from the database if they are read."""
+    # from_db() expects the values in model field order.
+    field_names = [field.attname for field in user_model._meta.concrete_fields if field.attname in values]
+    user = user_model.from_db(DEFAULT_DB_ALIAS, field_names, [values[name] for name in field_names])
+    if PASSWORD_DIGEST in values:
+        user.password_digest = values[PASSWORD_DIGEST]
+    return user
+
+
+def get_user(user_model, user_id, version):
+    """The user ``user_id`` as of ``version``, from the cached fields; None
+    if there is no such user."""
+    key = _user_key(user_id, version)
+    values = cache.get(key)
+    record_cache(values is not None)
+    if values is not None:
+        return user_from_fields(user_model, values)
+    user = user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+    if user is not None:
+        cache.set(key, _cached_fields(user), USER_CACHE_TIMEOUT)
+    return user
+
+
+async def aget_user(user_model, user_id, version):
+    key = _user_key(user_id, version)
+    values = await cache.aget(key)
+    record_cache(values is not None)
+    if values is not None:
+        return user_from_fields(user_model, values)
+    user = await user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+    if user is not None:
+        await cache.aset(key, _cached_fields(user), USER_CACHE_TIMEOUT)
+    return user
+
+
+def invalidate_user(user_id):
+    def _bump():
+        key = _version_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+    _bump()
+    # A request may cache the old row between the bump above and the commit.
+    if connection.in_atomic_block:
+        transaction.on_commit(_bump)
+
+
+def user_claims(user):
+    claims = {field: getattr(user, field) for field in CLAIM_FIELDS}
+    claims[VERSION_CLAIM] = get_version(user.pk)
+    return claims
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        version = get_version(user_id)
+        if STATELESS_USERS and validated_token.get(VERSION_CLAIM) == version:
+            return self.user_from_claims(validated_token)
+        return self.check_user(get_user(self.user_model, user_id, version), validated_token)
+
+    async def aget_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        version = await aget_version(user_id)
+        if STATELESS_USERS and validated_token.get(VERSION_CLAIM) == version:
+            return self.user_from_claims(validated_token)
+        return self.check_user(await aget_user(self.user_model, user_id, version), validated_token)
+
+    @staticmethod
+    def get_user_id(validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+    @staticmethod
+    def check_user(user, validated_token):
+        if user is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN:
+            digest = getattr(user, PASSWORD_DIGEST, None) or get_md5_hash_password(user.password)
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != digest:
+                raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
+        return user
+
+    def user_from_claims(self, validated_token):
+        claims = {field: validated_token.get(field) for field in CLAIM_FIELDS}
+        claims[api_settings.USER_ID_FIELD] = validated_token[api_settings.USER_ID_CLAIM]
+        return user_from_fields(self.user_model, claims)
+
+
+def _count(name, delta=1):
+    key = f'auth:basic:{name}'
+    if not cache.add(key, delta, None):
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            cache.set(key, delta, None)
+
+
+def basic_auth_metrics():
+    """Hit rate of the Basic credential cache and the hashing CPU time it
+    saved, estimated from the average cost of the verifications it missed."""
+    counters = cache.get_many([f'auth:basic:{name}' for name in BASIC_AUTH_COUNTERS])
+    hits, misses, verify_ns = (counters.get(f'auth:basic:{name}', 0) for name in BASIC_AUTH_COUNTERS)
+    average_ns = verify_ns / misses if misses else 0
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+        'verify_ms_avg': round(average_ns / 1e6, 3),
+        'cpu_saved_ms': round(hits * average_ns / 1e6, 1),
+    }
+
+
+def reset_basic_auth_metrics():
+    cache.delete_many([f'auth:basic:{name}' for name in BASIC_AUTH_COUNTERS])
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    def authenticate_credentials(self, userid, password, request=None):
+        key = 'auth:basic:credentials:' + salted_hmac('users.basic-auth', f'{userid}\0{password}').hexdigest()
+        entry = cache.get(key)
+        if entry is not None:
+            user_id, version = entry
+            if get_version(user_id) == version:
+                user = get_user(get_user_model(), user_id, version)
+                if user is not None and user.is_active:
+                    _count('hits')
+                    return user, None
+
+        start = time.thread_time_ns()
+        user, auth = super().authenticate_credentials(userid, password, request)
+        _count('misses')
+        _count('verify_ns', time.thread_time_ns() - start)
+        cache.set(key, (user.pk, get_version(user.pk)), BASIC_AUTH_CACHE_TIMEOUT)
+        return user, auth
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from users.authentication import basic_auth_metrics, reset_basic_auth_metrics
+
+
+class Command(BaseCommand):
+    help = (
+        'Show the hit rate of the Basic auth credential cache and the hashing CPU time it saved. '
+        'The counters live in the default cache, so a per-process backend such as locmem only '
+        'reports on the process that reads it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them.')
+
+    def handle(self, *args, reset, **options):
+        metrics = basic_auth_metrics()
+        hit_rate = 'n/a' if metrics['hit_rate'] is None else f'{metrics["hit_rate"]:.1%}'
+        self.stdout.write(f'hits:            {metrics["hits"]}')
+        self.stdout.write(f'misses:          {metrics["misses"]}')
+        self.stdout.write(f'hit rate:        {hit_rate}')
+        self.stdout.write(f'avg verify:      {metrics["verify_ms_avg"]} ms CPU')
+        self.stdout.write(f'CPU saved:       {metrics["cpu_saved_ms"]} ms')
+        if reset:
+            reset_basic_auth_metrics()
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .authentication import user_claims
 
 User = get_user_model()
 
@@ -14,7 +16,7 @@ class ChangePasswordSerializer(serializers.Serializer):
     new_password = serializers.CharField(write_only=True, required=True)
 
     def validate_old_password(self, value):
-        user = self.context["request"].user
+        user = self.context.get("user") or self.context["request"].user
         if not user.check_password(value):
             raise serializers.ValidationError("Old password is incorrect.")
         return value
@@ -24,6 +26,15 @@ class ChangePasswordSerializer(serializers.Serializer):
         instance.save()
         return instance
 
+class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        # Lets JWT_STATELESS_USERS build request.user without a lookup.
+        for claim, value in user_claims(user).items():
+            token[claim] = value
+        return token
+
 class CustomUserSerializer(serializers.ModelSerializer):
     role = serializers.ChoiceField(choices=User.ROLE_CHOICES, default="customer")
 
@@ -1,3 +1,136 @@
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework import exceptions
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import authentication
+from .authentication import CachedBasicAuthentication, CachedJWTAuthentication, basic_auth_metrics
+from .models import CustomUser
+from .serializers import UserTokenObtainPairSerializer
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('jwt@example.com', 'old-password')
+        self.token = str(AccessToken.for_user(self.user))
+
+    def authenticate(self, token=None):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'bearer {token or self.token}')
+        user, _ = CachedJWTAuthentication().authenticate(request)
+        return user
+
+    def test_user_is_cached(self):
+        self.assertEqual(self.authenticate(), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(), self.user)
+
+    def test_password_hash_is_not_cached(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertEqual((user.email, user.is_active, user.is_staff), ('jwt@example.com', True, False))
+        self.assertIn('password', user.get_deferred_fields())
+        entry = cache.get(authentication._user_key(self.user.pk, authentication.get_version(self.user.pk)))
+        self.assertNotIn(self.user.password, repr(entry))
+        # The hash is still there for code that reads it.
+        self.assertTrue(user.check_password('old-password'))
+
+    @mock.patch.object(api_settings, 'CHECK_REVOKE_TOKEN', True)
+    def test_revoked_token_is_refused_from_the_cache(self):
+        token = str(AccessToken.for_user(self.user))
+        self.authenticate(token)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(token), self.user)
+        CustomUser.objects.filter(pk=self.user.pk).update(password='changed')
+        authentication.invalidate_user(self.user.pk)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_password_change_drops_cached_user(self):
+        self.authenticate()
+        self.user.set_password('new-password')
+        self.user.save()
+        with self.assertNumQueries(1):
+            user = self.authenticate()
+        self.assertTrue(user.check_password('new-password'))
+
+    def test_role_change_drops_cached_user(self):
+        self.assertEqual(self.authenticate().role, 'customer')
+        self.user.role = 'vendor'
+        self.user.save(update_fields=['role'])
+        self.assertEqual(self.authenticate().role, 'vendor')
+
+    def test_deactivated_user_is_refused(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deleted_user_is_refused(self):
+        self.authenticate()
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_bulk_updates_need_invalidate_user(self):
+        self.authenticate()
+        CustomUser.objects.filter(pk=self.user.pk).update(role='admin')
+        self.assertEqual(self.authenticate().role, 'customer')
+        authentication.invalidate_user(self.user.pk)
+        self.assertEqual(self.authenticate().role, 'admin')
+
+    @mock.patch.object(authentication, 'STATELESS_USERS', True)
+    def test_stateless_users_fall_back_once_the_user_changes(self):
+        token = str(UserTokenObtainPairSerializer.get_token(self.user).access_token)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate(token).email, 'jwt@example.com')
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+
+class CachedBasicAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('basic@example.com', 'old-password')
+
+    def authenticate(self, password='old-password'):
+        user, _ = CachedBasicAuthentication().authenticate_credentials('basic@example.com', password)
+        return user
+
+    def test_verified_credentials_are_cached(self):
+        self.assertEqual(self.authenticate(), self.user)
+        with mock.patch.object(CustomUser, 'check_password') as check_password:
+            self.assertEqual(self.authenticate(), self.user)
+        check_password.assert_not_called()
+        self.assertEqual((basic_auth_metrics()['hits'], basic_auth_metrics()['misses']), (1, 1))
+
+    def test_wrong_password_is_not_cached(self):
+        for _ in range(2):
+            with self.assertRaises(exceptions.AuthenticationFailed):
+                self.authenticate('wrong-password')
+        self.assertEqual(basic_auth_metrics()['hits'], 0)
+
+    def test_password_change_stops_cached_credentials(self):
+        self.authenticate()
+        self.user.set_password('new-password')
+        self.user.save()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate()
+        self.assertEqual(self.authenticate('new-password'), self.user)
+        self.assertEqual(basic_auth_metrics()['hits'], 0)
 
-# Create your tests here.
+    def test_deactivated_user_is_refused(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate()
@@ -18,7 +18,9 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        # request.user may come from the auth cache or the token's claims;
+        # save changes onto the current row.
+        return User.objects.get(pk=self.request.user.pk)
 
 # Change Password View
 class ChangePasswordView(generics.UpdateAPIView):
@@ -26,13 +28,14 @@ class ChangePasswordView(generics.UpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        return User.objects.get(pk=self.request.user.pk)
 
     def update(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data, context={"request": request})
+        user = self.get_object()
+        serializer = self.get_serializer(data=request.data, context={"request": request, "user": user})
         serializer.is_valid(raise_exception=True)
-        self.get_object().set_password(serializer.validated_data["new_password"])
-        self.get_object().save()
+        user.set_password(serializer.validated_data["new_password"])
+        user.save()
         return Response({"detail": "Password updated successfully"}, status=status.HTTP_200_OK)
 
 class CustomTokenObtainPairView(TokenObtainPairView):